@@ -1,6 +1,21 @@
 from flask import Blueprint, render_template, request, redirect, session, flash, Response, current_app, jsonify, url_for
-from services import require_role, _create_single_user, generate_users_csv
-import io, csv
+from services import require_role, _create_single_user, generate_users_csv, summarize
+from export_jobs import STATUS_DONE, export_kind, table_version, track_progress, write_csv
+from asset_lookup import apply_asset_writes, request_loader
+from spares_stats import invalidate_spares_stats
+from delta_sync import fetch_delta, fetch_spares_delta, new_cursor, record_tombstones, record_spares_tombstones
+from row_serializer import serialize_admin_spare
+from push_dispatch import notify_spares_event
+from spares_bulk import parse_ids, parse_patch, bulk_update_spares, bulk_delete_spares
+from asset_summary import DIMENSIONS
+from bulk_delete import parse_ids as parse_delete_ids
+from user_provisioning import read_user_rows, job_view as provision_job_view
+from asset_patch import apply_edit, apply_edits, parse_edits, single_edit
+from asset_import import dry_run_assets, import_assets, is_supported_upload, open_upload
+from ref_sequence import RefAllocationError
+from user_permissions import MAX_USERS, apply_to_users, load_users_by_filter, load_users_by_ids, parse_deltas
+import io, csv, re
+import time
 from datetime import datetime, timedelta, timezone
 # ✅ Define India Standard Time (UTC+5:30)
 IST = timezone(timedelta(hours=5, minutes=30))
@@ -56,35 +71,163 @@ def admin_spares_requirements_page():
 
 
 # ---------------- USER MANAGEMENT ----------------
+USER_LIST_COLUMNS = [
+    'user_id', 'full_name', 'designation', 'phone', 'email',
+    'accesses', 'role', 'auth_id', 'created_at'
+]
+USER_SEARCH_COLUMNS = ('user_id', 'full_name', 'email', 'phone', 'designation')
+USER_PAGE_MAX = 200
+
+
 @admin_bp.route('/admin_user_management')
 @require_role('admin')
 def admin_user_management():
+    """Page shell only: the user list and permission trees are loaded as JSON."""
     supabase_admin = current_app.config['supabase_admin']
     modules = current_app.config['MODULES']
 
-    # Fetch users from Supabase
-    users = supabase_admin.table("users_meta").select("*").execute()
-    users = users.data if users.data else []
+    # two count-only queries instead of loading every users_meta row
+    def count(q):
+        res = q.limit(1).execute()
+        return res.count if getattr(res, "count", None) is not None else len(res.data or [])
 
+    total = count(supabase_admin.table("users_meta").select("user_id", count="exact"))
     counts = {
-        "users": len(users),
-        "admins": sum(1 for u in users if u.get("role") == "admin"),
-        "active": len(users)  # adjust later if you track active separately
+        "users": total,
+        "admins": count(supabase_admin.table("users_meta").select("user_id", count="exact").eq("role", "admin")),
+        "active": total  # adjust later if you track active separately
     }
 
     return render_template(
         'admin_user_management.html',
-        users=users,
         counts=counts,
-        default_columns=[
-            'user_id', 'full_name', 'designation', 'phone', 'email',
-            'accesses', 'role', 'auth_id', 'created_at'
-        ],
+        default_columns=USER_LIST_COLUMNS,
         modules=modules,
-        feature_matrix=current_app.config['FEATURE_MATRIX']   # ✅ Added line
     )
 
 
+# ---------------- USER LIST / PERMISSIONS (JSON) ----------------
+def _filter_users(query, q=None, role=None):
+    """Apply the user table's search box (q) and role filter to a users_meta query."""
+    # characters that would break the PostgREST or() filter syntax
+    q = re.sub(r'[,()*%\\]', ' ', q or '').strip()
+    if q:
+        query = query.or_(",".join(f"{c}.ilike.*{q}*" for c in USER_SEARCH_COLUMNS))
+    if role:
+        query = query.eq("role", role)
+    return query
+
+
+@admin_bp.route('/users')
+@require_role('admin')
+def list_users():
+    """
+    One page of users_meta for the management table.
+    Query: q (search user_id/name/email/phone/designation), role, page (1-based), per_page.
+    Returns {"users", "total", "page", "per_page"}; feature_accesses are not included.
+    """
+    supabase_admin = current_app.config['supabase_admin']
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 50)), 1), USER_PAGE_MAX)
+    except ValueError:
+        return jsonify({"success": False, "error": "page and per_page must be integers"}), 400
+
+    try:
+        query = _filter_users(
+            supabase_admin.table("users_meta").select(", ".join(USER_LIST_COLUMNS), count="exact"),
+            request.args.get('q'), request.args.get('role'))
+        start = (page - 1) * per_page
+        res = query.order("user_id").range(start, start + per_page - 1).execute()
+        total = res.count if getattr(res, "count", None) is not None else len(res.data or [])
+        return jsonify({"users": res.data or [], "total": total, "page": page, "per_page": per_page}), 200
+    except Exception as e:
+        current_app.logger.error(f"list_users error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@admin_bp.route('/users/<user_id>')
+@require_role('admin')
+def get_user(user_id):
+    """One user's editable record, including accesses and feature_accesses (edit modal)."""
+    supabase_admin = current_app.config['supabase_admin']
+    try:
+        res = supabase_admin.table("users_meta") \
+            .select("user_id, full_name, designation, phone, email, role, accesses, feature_accesses") \
+            .eq("user_id", user_id).limit(1).execute()
+        if not res.data:
+            return jsonify({"success": False, "error": "User not found"}), 404
+        return jsonify(res.data[0]), 200
+    except Exception as e:
+        current_app.logger.error(f"get_user error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@admin_bp.route('/users/permissions', methods=['POST'])
+@require_role('admin')
+def bulk_user_permissions():
+    """
+    Grant / revoke permissions for many users in one request.
+    Body: {"user_ids": [...]} or {"filter": {"q": ..., "role": ...}} (the table's search),
+          "grant": ["page", "page:feature", "page:feature:sub", ...], "revoke": [...]
+    Returns {"success", "matched", "updated", "unchanged", "failed"}.
+    """
+    supabase_admin = current_app.config['supabase_admin']
+    data = request.get_json(silent=True) or {}
+    try:
+        grants, revokes = parse_deltas(data)
+        user_ids = data.get("user_ids")
+        user_filter = data.get("filter")
+        if user_ids is not None:
+            if not isinstance(user_ids, list) or not user_ids:
+                raise ValueError("user_ids must be a non-empty list")
+            if len(user_ids) > MAX_USERS:
+                raise ValueError(f"At most {MAX_USERS} users per request")
+            user_ids = list(dict.fromkeys(str(u) for u in user_ids))
+        elif not isinstance(user_filter, dict):
+            raise ValueError("Give user_ids or a filter")
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        if user_ids is not None:
+            rows = load_users_by_ids(supabase_admin, user_ids)
+        else:
+            try:
+                rows = load_users_by_filter(
+                    supabase_admin, lambda q: _filter_users(q, user_filter.get("q"), user_filter.get("role")))
+            except ValueError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+
+        result = apply_to_users(supabase_admin, rows, grants, revokes)
+        return jsonify({
+            "success": not result["failed"],
+            "matched": len(rows),
+            "updated": result["updated"],
+            "unchanged": result["unchanged"],
+            "failed": result["failed"],
+        }), 200
+    except Exception as e:
+        current_app.logger.error(f"bulk_user_permissions error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@admin_bp.route('/feature_matrix')
+@require_role('admin')
+def get_feature_matrix():
+    """Page -> features tree used to build the permission editors."""
+    return jsonify(current_app.config['FEATURE_MATRIX']), 200
+
+
+# ---------------- METRICS ----------------
+@admin_bp.route('/metrics')
+@require_role('admin')
+def metrics():
+    """Request / Supabase query histograms in Prometheus text format (see metrics.py)."""
+    return Response(current_app.config['METRICS'].render(),
+                    mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
 @admin_bp.route('/refresh_feature_matrix', methods=['POST'])
 @require_role('admin')
 def refresh_feature_matrix():
@@ -112,45 +255,29 @@ def create_users():
     # ---------- 1️⃣ CSV Upload ----------
     if 'csv_file' in request.files:
         file = request.files['csv_file']
+        wants_json = request.accept_mimetypes.best == "application/json"
         if not file.filename.lower().endswith('.csv'):
+            if wants_json:
+                return jsonify({"success": False, "error": "Only CSV files allowed"}), 400
             flash("Only CSV files allowed", "danger")
             return redirect(url_for('admin.admin_user_management'))
 
-        stream = io.StringIO(file.stream.read().decode("utf8"), newline=None)
-        reader = csv.DictReader(stream)
-        created_rows, errors = [], []
-
-        for i, row in enumerate(reader, start=1):
-            try:
-                row['accesses'] = [x.strip() for x in row.get('accesses', '').split(',') if x.strip()]
-                result = _create_single_user(row, supabase_admin)
-                gen_pass = result.get("generated_password") if isinstance(result, dict) else None
-                created_rows.append({
-                    "user_id": row.get("user_id", ""),
-                    "email": row.get("email", ""),
-                    "generated_password": gen_pass or (row.get("password") or "")
-                })
-            except Exception as e:
-                errors.append(f"Row {i}: {str(e)}")
-
-        if errors:
-            flash(f"CSV upload finished with {len(errors)} error(s).", "warning")
-            for err in errors[:10]:
-                flash(err, "danger")
-
-        if created_rows:
-            si = io.StringIO()
-            writer = csv.writer(si)
-            writer.writerow(["user_id", "email", "generated_password"])
-            for r in created_rows:
-                writer.writerow([r["user_id"], r["email"], r["generated_password"]])
-            output = si.getvalue().encode("utf-8")
-            return Response(
-                output,
-                mimetype="text/csv",
-                headers={"Content-Disposition": "attachment;filename=created_users_with_passwords.csv"}
-            )
+        try:
+            stream = io.StringIO(file.stream.read().decode("utf8"), newline=None)
+            rows = read_user_rows(stream)
+            job = current_app.config['USER_PROVISIONER'].submit(
+                supabase_admin, rows, requested_by=session.get("user"), after=_directory_refresher())
+        except Exception as e:
+            current_app.logger.error(f"create_users CSV error: {e}")
+            if wants_json:
+                return jsonify({"success": False, "error": str(e)}), 400
+            flash(f"CSV upload failed: {e}", "danger")
+            return redirect(url_for('admin.admin_user_management'))
 
+        if wants_json:
+            return jsonify({"success": True, "job": _provision_job_view(job)}), 202
+        flash(f"Creating {len(rows)} user(s) in the background. Results: "
+              f"{url_for('admin.provision_job_results', job_id=job['id'])}", "info")
         return redirect(url_for('admin.admin_user_management'))
 
     # ---------- 2️⃣ Manual Form Creation ----------
@@ -189,6 +316,7 @@ def create_users():
 
     try:
         _create_single_user(data, supabase_admin)
+        current_app.config['USER_DIRECTORY'].invalidate()
         flash("✅ User created successfully!", "success")
     except Exception as e:
         print("❌ Failed to create user:", e)
@@ -197,6 +325,57 @@ def create_users():
     return redirect(url_for('admin.admin_user_management'))
 
 
+def _directory_refresher():
+    """after-hook for background user jobs: drop the login directory once they finish."""
+    directory = current_app.config['USER_DIRECTORY']
+    return lambda *_: directory.invalidate()
+
+
+def _provision_job_view(job):
+    out = provision_job_view(job)
+    out["status_url"] = url_for('admin.provision_job_status', job_id=job["id"])
+    out["resume_url"] = url_for('admin.provision_job_resume', job_id=job["id"])
+    out["download_url"] = url_for('admin.provision_job_results', job_id=job["id"]) \
+        if job["status"] == STATUS_DONE and not job.get("downloaded") else None
+    return out
+
+
+@admin_bp.route('/provision_jobs/<job_id>')
+@require_role('admin')
+def provision_job_status(job_id):
+    job = current_app.config['USER_PROVISIONER'].get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": _provision_job_view(job)}), 200
+
+
+@admin_bp.route('/provision_jobs/<job_id>/resume', methods=['POST'])
+@require_role('admin')
+def provision_job_resume(job_id):
+    """Continue an interrupted provisioning job (e.g. after a restart)."""
+    provisioner = current_app.config['USER_PROVISIONER']
+    job = provisioner.resume(job_id, current_app.config['supabase_admin'], after=_directory_refresher())
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": _provision_job_view(job)}), 202
+
+
+@admin_bp.route('/provision_jobs/<job_id>/results.csv')
+@require_role('admin')
+def provision_job_results(job_id):
+    provisioner = current_app.config['USER_PROVISIONER']
+    job = provisioner.get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    if job["status"] != STATUS_DONE:
+        return jsonify({"success": False, "error": "Provisioning not finished", "job": _provision_job_view(job)}), 409
+    return Response(
+        provisioner.results_csv(job),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment;filename=created_users_with_passwords.csv"}
+    )
+
+
 @admin_bp.route('/edit_user/<user_id>', methods=['POST'])
 @require_role('admin')
 def edit_user(user_id):
@@ -252,6 +431,7 @@ def edit_user(user_id):
                 auth_id = user_record.data[0]["auth_id"]
                 supabase_admin.auth.admin.update_user(auth_id, {"password": password})
 
+        current_app.config['USER_DIRECTORY'].invalidate()
         flash("✅ User updated successfully", "success")
 
     except Exception as e:
@@ -267,12 +447,52 @@ def edit_user(user_id):
 def delete_user(user_id):
     supabase_admin = current_app.config['supabase_admin']
     try:
-        supabase_admin.table("users_meta").delete().eq("user_id", user_id).execute()
+        results, _ = current_app.config['BULK_DELETE'].run("users", supabase_admin, [user_id])
+        current_app.config['USER_DIRECTORY'].invalidate()
+        if not results[0]["ok"]:
+            flash(f"Failed to delete user: {results[0]['error']}")
+        elif results[0].get("warning"):
+            flash(results[0]["warning"], "warning")
     except Exception as e:
         flash(f"Failed to delete user: {e}")
     return redirect(url_for('admin.admin_user_management'))
 
 
+@admin_bp.route('/delete_users_bulk', methods=['POST'])
+@require_role('admin')
+def delete_users_bulk():
+    """Delete many users (users_meta rows + their Auth accounts) as a background job."""
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = parse_delete_ids("users", data.get("ids"))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        job = current_app.config['BULK_DELETE'].submit(
+            "users", current_app.config['supabase_admin'], ids, requested_by=session.get("user"),
+            after=_directory_refresher())
+        return jsonify({"success": True, "job": _bulk_job_view(job)}), 202
+    except Exception as e:
+        current_app.logger.error(f"delete_users_bulk error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@admin_bp.route('/bulk_jobs/<job_id>')
+@require_role('admin')
+def bulk_job_status(job_id):
+    job = current_app.config['BULK_DELETE'].get(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": _bulk_job_view(job)}), 200
+
+
+def _bulk_job_view(job):
+    """Public shape of a bulk delete job (what the polling UI sees)."""
+    out = {k: job.get(k) for k in ("id", "kind", "status", "total", "done", "failed", "progress", "failures", "error")}
+    out["status_url"] = url_for('admin.bulk_job_status', job_id=job["id"])
+    return out
+
+
 @admin_bp.route('/download_users_csv')
 @require_role('admin')
 def download_users_csv():
@@ -303,14 +523,45 @@ def admin_profile():
 @admin_bp.route('/get_assets')
 @require_role('admin')
 def get_assets():
+    """Full catalog, or with ?since=<cursor> only the assets changed/deleted since then."""
     supabase_admin = current_app.config['supabase_admin']
     try:
+        since = request.args.get('since')
+        if since:
+            try:
+                rows, deleted, full, cursor = fetch_delta(supabase_admin, "asset_master", since)
+            except ValueError as e:
+                return {"error": str(e)}, 400
+            return jsonify({"cursor": cursor, "changed": rows, "deleted": deleted, "full": full}), 200
+
+        cursor = new_cursor()
         result = supabase_admin.table("asset_master").select("*").execute()
-        return jsonify(result.data), 200
+        resp = jsonify(result.data)
+        resp.headers["X-Sync-Cursor"] = cursor
+        return resp, 200
     except Exception as e:
         return {"error": str(e)}, 500
 
 
+# ---------------- ASSET FLEET SUMMARY ----------------
+@admin_bp.route('/asset_summary')
+@require_role('admin')
+def asset_summary():
+    """Counts (own/hire/nc) and EHC/IHC totals, grouped by ?by=package,owner,... (default: all)."""
+    supabase_admin = current_app.config['supabase_admin']
+    by = [d.strip() for d in (request.args.get('by') or "").split(",") if d.strip()] or list(DIMENSIONS)
+    unknown = [d for d in by if d not in DIMENSIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown dimension(s): {', '.join(unknown)}. Use: {', '.join(DIMENSIONS)}"}), 400
+    try:
+        summary = current_app.config['ASSET_SUMMARY']
+        summary.ensure_fresh(supabase_admin)
+        return jsonify(summary.snapshot(by)), 200
+    except Exception as e:
+        current_app.logger.error(f"asset_summary error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @admin_bp.route('/add_asset', methods=['POST'])
 @require_role('admin')
 def add_asset():
@@ -319,32 +570,50 @@ def add_asset():
     try:
         data["last_updated_by"] = session.get("name")
         data["last_updated_at"] = datetime.now(IST).isoformat()
-        supabase_admin.table("asset_master").insert(data).execute()
+        result = supabase_admin.table("asset_master").insert(data).execute()
+        apply_asset_writes(result.data)
         return {"success": True}, 201
     except Exception as e:
         return {"error": str(e)}, 500
 
 
-@admin_bp.route('/update_asset/<asset_id>', methods=['POST'])
+@admin_bp.route('/update_asset/<asset_id>', methods=['POST', 'PATCH'])
 @require_role('admin')
 def update_asset(asset_id):
     supabase_admin = current_app.config['supabase_admin']
     try:
-        data = request.get_json()
-        if not data:
+        changes, version = single_edit(request.get_json(silent=True))
+        if not changes:
             return jsonify({"success": False, "error": "No data provided"}), 400
 
-        # Update in Supabase
-        result = supabase_admin.table("asset_master").update(data).eq("id", asset_id).execute()
+        result = apply_edit(supabase_admin, asset_id, changes, version, actor=session.get("name"))
+        if result["ok"]:
+            apply_asset_writes([result["row"]])
+            return jsonify({"success": True, "row": result["row"]}), 200
+        status = 409 if result.get("conflict") else 404 if result["error"] == "Asset not found" else 400
+        return jsonify(dict(result, success=False)), status
 
-        # Optionally check if rows updated
-        if not result.data:
-            return jsonify({"success": False, "error": "Asset not found"}), 404
+    except Exception as e:
+        current_app.logger.error(f"Error updating asset {asset_id}: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        return jsonify({"success": True}), 200
 
+@admin_bp.route('/assets', methods=['PATCH'])
+@require_role('admin')
+def patch_assets():
+    """Batched field-level edits: {"edits": [{"id", "version", "changes"}]} (see asset_patch.py)."""
+    supabase_admin = current_app.config['supabase_admin']
+    try:
+        edits = parse_edits(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        results, rows = apply_edits(supabase_admin, edits, actor=session.get("name"))
+        if rows:
+            apply_asset_writes(rows)
+        return jsonify(summarize(results)), 200
     except Exception as e:
-        current_app.logger.error(f"Error updating asset {asset_id}: {e}")
+        current_app.logger.error(f"patch_assets error: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -354,6 +623,8 @@ def delete_asset(asset_id):
     supabase_admin = current_app.config['supabase_admin']
     try:
         supabase_admin.table("asset_master").delete().eq("id", asset_id).execute()
+        record_tombstones(supabase_admin, "asset_master", [asset_id])
+        apply_asset_writes(removed_ids=[asset_id])
         return {"success": True}, 200
     except Exception as e:
         return {"error": str(e)}, 500
@@ -362,130 +633,85 @@ def delete_asset(asset_id):
 @admin_bp.route('/delete_assets_bulk', methods=['POST'])
 @require_role('admin')
 def delete_assets_bulk():
-    supabase_admin = current_app.config['supabase_admin']
-    ids = request.json.get("ids", [])
+    """Delete many assets as a background job; poll the returned status_url for progress."""
+    data = request.get_json(silent=True) or {}
     try:
-        if not ids:
-            return {"success": False, "error": "No IDs provided"}, 400
-
-        batch_size = 200
-        for i in range(0, len(ids), batch_size):
-            supabase_admin.table("asset_master").delete().in_("id", ids[i:i + batch_size]).execute()
+        ids = parse_delete_ids("assets", data.get("ids"))
+    except ValueError as e:
+        return {"success": False, "error": str(e)}, 400
 
-        return {"success": True}, 200
-    except Exception as e:
-        return {"success": False, "error": str(e)}, 500
+    app = current_app._get_current_object()
 
+    def after(deleted_ids, rows):
+        with app.app_context():
+            record_tombstones(app.config['supabase_admin'], "asset_master", deleted_ids)
+            apply_asset_writes(removed_ids=deleted_ids)
 
-# ---- Helper to normalize dates ----
-def normalize_date(val):
-    """Convert DD-MM-YYYY or YYYY-MM-DD to YYYY-MM-DD (DB format)."""
-    if not val:
-        return None
-    try:
-        return datetime.strptime(val, "%Y-%m-%d").strftime("%Y-%m-%d")
-    except:
-        pass
     try:
-        return datetime.strptime(val, "%d-%m-%Y").strftime("%Y-%m-%d")
-    except:
-        return None
+        job = current_app.config['BULK_DELETE'].submit(
+            "assets", current_app.config['supabase_admin'], ids, requested_by=session.get("user"), after=after)
+        return {"success": True, "job": _bulk_job_view(job)}, 202
+    except Exception as e:
+        return {"success": False, "error": str(e)}, 500
 
 
 @admin_bp.route('/upload_assets_csv', methods=['POST'])
 @require_role('admin')
 def upload_assets_csv():
+    """Batched upsert import of an asset CSV (.csv or .csv.gz), see asset_import.py.
+
+    With ?dry_run=1 the file is only validated and nothing is written.
+    """
     supabase_admin = current_app.config['supabase_admin']
     if 'csv_file' not in request.files:
         return {"success": False, "error": "No file uploaded"}, 400
 
     file = request.files['csv_file']
-    if not file.filename.endswith('.csv'):
-        return {"success": False, "error": "Only CSV files are allowed"}, 400
-
-    try:
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        reader = csv.DictReader(stream)
+    if not is_supported_upload(file.filename):
+        return {"success": False, "error": "Only CSV files (optionally .gz compressed) are allowed"}, 400
 
-        inserted = 0
-        errors = []
+    if request.args.get('dry_run') in ('1', 'true', 'yes') or request.form.get('dry_run') in ('1', 'true', 'yes'):
+        try:
+            report = dry_run_assets(supabase_admin, open_upload(file))
+            report["details"] = [f"Row {e['row']}: {e['field']}: {e['error']}" for e in report["errors"]]
+            report["dry_run"] = True
+            report["success"] = not report["errors"]
+            return report, 200
+        except Exception as e:
+            current_app.logger.error(f"upload_assets_csv dry_run error: {e}", exc_info=True)
+            return {"success": False, "error": f"Could not validate the file: {e}"}, 400
 
-        for i, row in enumerate(reader, start=1):
-            try:
-                # Normalize date fields
-                if "date_of_commission" in row:
-                    row["date_of_commission"] = normalize_date(row["date_of_commission"])
-
-                # Convert numeric fields safely
-                for field in ["starting_reading", "tank_capacity", "hsd_available",
-                              "ehc", "ihc","additional_operator_charge", "shift_hours",
-                              "operator_available", "helper_available"]:
-                    if field in row and str(row[field]).strip():
-                        try:
-                            row[field] = float(row[field])
-                        except:
-                            row[field] = None
-
-                asset_data = {
-                    "asset_code": row.get("asset_code"),
-                    "asset_description": row.get("asset_description"),
-                    "asset_category": row.get("asset_category"),
-                    "reg_no": row.get("reg_no"),
-                    "package": row.get("package"),
-                    "activity": row.get("activity"),
-                    "location": row.get("location"),
-                    "meter_type": row.get("meter_type"),
-                    "uom": row.get("uom"),
-                    "fuel_norms": row.get("fuel_norms"),
-                    "owner": row.get("owner"),
-                    "vendor_code": row.get("vendor_code"),
-                    "agency": row.get("agency"),
-                    "wod_number": row.get("wod_number"),
-                    "vendor_mail_id": row.get("vendor_mail_id"),
-                    "date_of_commission": row.get("date_of_commission"),
-                    "starting_reading": row.get("starting_reading"),
-                    "tank_capacity": row.get("tank_capacity"),
-                    "hsd_available": row.get("hsd_available"),
-                    "make": row.get("make"),
-                    "model": row.get("model"),
-                    "pm_make": row.get("pm_make"),
-                    "pm_model": row.get("pm_model"),
-                    "ehc": row.get("ehc"),
-                    "ihc": row.get("ihc"),
-                    "shift_hours": row.get("shift_hours"),
-                    "operator_available": row.get("operator_available"),
-                    "helper_available": row.get("helper_available"),
-                    "supervisor_owner_name": row.get("supervisor_owner_name"),
-                    "supervisor_owner_phone": row.get("supervisor_owner_phone"),
-                    "operator1": row.get("operator1"),
-                    "operator1_phone": row.get("operator1_phone"),
-                    "operator1_shift": row.get("operator1_shift"),
-                    "operator2": row.get("operator2"),
-                    "operator2_phone": row.get("operator2_phone"),
-                    "operator2_shift": row.get("operator2_shift"),
-                    "last_updated_by": session.get("name"),
-                    "last_updated_at": datetime.now(IST).isoformat()
-                }
-
-                supabase_admin.table("asset_master").insert(asset_data).execute()
-                inserted += 1
-
-            except Exception as row_err:
-                errors.append(f"Row {i}: {row_err}")
+    try:
+        stamp = {
+            "last_updated_by": session.get("name"),
+            "last_updated_at": datetime.now(IST).isoformat()
+        }
+        report = import_assets(supabase_admin, open_upload(file),
+                               batch_size=current_app.config.get('ASSET_IMPORT_BATCH_SIZE', 500),
+                               stamp=stamp, on_written=apply_asset_writes)
+        errors = report["errors"]
 
         if errors:
             return {
                 "success": False,
-                "error": f"Upload completed with {len(errors)} error(s).",
-                "details": errors
+                "error": f"Upload completed with {len(errors)} error(s); {report['upserted']} of {report['rows']} rows saved.",
+                "details": [f"Row {e['row']}: " + (f"{e['field']}: " if e['field'] else "") + e['error'] for e in errors],
+                "errors": errors,
+                "rows": report["rows"],
+                "upserted": report["upserted"],
+                "warning": report.get("warning")
             }, 400
 
-        return {"success": True, "message": f"Successfully uploaded {inserted} records."}, 200
+        body = {"success": True, "message": f"Successfully uploaded {report['upserted']} records.",
+                "rows": report["rows"], "upserted": report["upserted"]}
+        if report.get("warning"):
+            body["warning"] = report["warning"]
+        return body, 200
 
     except Exception as e:
-        err_msg = str(e)
-        if "date/time field value out of range" in err_msg:
-            return {"success": False, "error": "Invalid date format. Please use DD-MM-YYYY (e.g., 25-08-2025)."}, 400
+        current_app.logger.error(f"upload_assets_csv error: {e}", exc_info=True)
+        if isinstance(e, (UnicodeDecodeError, OSError, csv.Error)):
+            return {"success": False, "error": "Could not read the file. Upload a UTF-8 CSV (optionally gzip-compressed)."}, 400
         return {"success": False, "error": "Upload failed. Please check your CSV data."}, 400
 
 
@@ -500,15 +726,12 @@ def download_assets_csv():
         if not assets:
             return {"error": "No assets found"}, 404
 
-        # ✅ Dynamically detect columns
-        headers = list(assets[0].keys())
-        headers.sort()
+        headers, rows = _asset_csv_table(assets)
 
         si = io.StringIO()
         writer = csv.writer(si)
         writer.writerow(headers)
-        for a in assets:
-            writer.writerow([a.get(h, "") for h in headers])
+        writer.writerows(rows)
 
         output = si.getvalue().encode("utf-8")
         return Response(
@@ -520,6 +743,35 @@ def download_assets_csv():
         return {"error": str(e)}, 500
 
 
+def _asset_csv_table(assets):
+    """Return (sorted headers, row generator) for an asset CSV dump."""
+    # ✅ Dynamically detect columns
+    headers = sorted(assets[0].keys()) if assets else []
+    return headers, ([a.get(h, "") for h in headers] for a in assets)
+
+
+# ---------------- Background exports (see export_jobs.py) ----------------
+@export_kind("assets_csv", role="admin", filename="asset_master.csv", mimetype="text/csv",
+             version=lambda sb: table_version(sb, "asset_master", "last_updated_at"))
+def _export_assets_csv_job(supabase_admin, fileobj, progress):
+    assets = supabase_admin.table("asset_master").select("*").execute().data or []
+    headers, rows = _asset_csv_table(assets)
+    write_csv(fileobj, headers, track_progress(rows, len(assets), progress))
+
+
+def _users_export_version(supabase_admin):
+    # users_meta has no edit timestamp, so edits are only picked up by the 10-minute bucket
+    return f"{table_version(supabase_admin, 'users_meta', 'created_at')}:{int(time.time() // 600)}"
+
+
+@export_kind("users_csv", role="admin", filename="users.csv", mimetype="text/csv",
+             version=_users_export_version)
+def _export_users_csv_job(supabase_admin, fileobj, progress):
+    users = supabase_admin.table("users_meta").select("*").execute().data or []
+    fileobj.write(generate_users_csv(users))
+    progress(len(users), len(users))
+
+
 @admin_bp.route('/download_assets_template_csv')
 @require_role('admin')
 def download_assets_template_csv():
@@ -579,12 +831,13 @@ def admin_module_page(module_name):
 def admin_get_dropdown_config():
     supabase_admin = current_app.config['supabase_admin']
     try:
-        result = supabase_admin.table("dropdown_config").select("*").execute()
-        data = sorted(result.data or [], key=lambda x: (x["list_name"], x["value"]))
-        grouped = {}
-        for row in data:
-            grouped.setdefault(row["list_name"], []).append({"value": row["value"], "id": row["id"]})
-        return jsonify(grouped), 200
+        version, grouped = current_app.config['DROPDOWN_CACHE'].grouped_with_ids(supabase_admin)
+        if request.if_none_match.contains(version):
+            return "", 304, {"ETag": f'"{version}"'}
+        resp = jsonify(grouped)
+        resp.set_etag(version)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp, 200
     except Exception as e:
         current_app.logger.error(f"dropdown_config GET error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -616,6 +869,7 @@ def admin_update_dropdown():
         else:
             return jsonify({"success": False, "error": "Invalid action"}), 400
 
+        current_app.config['DROPDOWN_CACHE'].invalidate()
         return jsonify({"success": True}), 200
     except Exception as e:
         current_app.logger.error(f"update_dropdown error: {e}")
@@ -631,52 +885,28 @@ from flask import stream_with_context
 @admin_bp.route('/get_spares')
 @require_role('admin')
 def admin_get_spares():
+  """Full list, or with ?since=<cursor> only the rows changed/deleted since then."""
   supabase_admin = current_app.config['supabase_admin']
   try:
+    since = request.args.get("since")
+    if since:
+      try:
+        rows, deleted, full, cursor = fetch_spares_delta(supabase_admin, since)
+      except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+      return jsonify({
+        "cursor": cursor,
+        "changed": [serialize_admin_spare(r) for r in rows],
+        "deleted": deleted,
+        "full": full
+      }), 200
+
+    cursor = new_cursor()
     res = supabase_admin.table("spares_requirements").select("*").order("created_at", desc=True).execute()
     rows = res.data if res.data else []
-    out = []
-    for r in rows:
-      created = r.get("created_at")
-      status_up = r.get("status_updated_at")
-      created_fmt = created
-      status_fmt = status_up
-      try:
-        if created:
-          dt = datetime.fromisoformat(created)
-          dt = dt.astimezone(IST)
-          created_fmt = dt.strftime("%d-%m-%Y %I:%M %p")
-        if status_up:
-          dt2 = datetime.fromisoformat(status_up)
-          dt2 = dt2.astimezone(IST)
-          status_fmt = dt2.strftime("%d-%m-%Y %I:%M %p")
-      except:
-        pass
-
-      out.append({
-        "id": r.get("id"),
-        "ref_no": r.get("ref_no") or r.get("ref_number"),
-        "priority": r.get("priority"),
-        "for_type": r.get("for_type"),
-        "asset_code": r.get("asset_code"),
-        "asset_description": r.get("asset_description"),
-        "required_by": r.get("required_by"),
-        "required_by_raw": r.get("required_by"),
-        "title": r.get("title") or r.get("requisition") or "",
-        "requisition": r.get("requisition"),
-        "spares_req": r.get("spares_req") or r.get("spare_requirement"),
-        "current_status": r.get("current_status"),
-        "actioner": r.get("actioner"),
-        "dc_required": r.get("dc_required") if "dc_required" in r else r.get("is_dc"),
-        "dc_number": r.get("dc_number"),
-        "created_at": created_fmt,
-        "status_updated_at": status_fmt,
-        "status": r.get("status"),
-        "closed": r.get("closed") if "closed" in r else (r.get("status") == "Closed"),
-        "created_by": r.get("created_by"),
-        "metadata": r.get("metadata")
-      })
-    return jsonify(out), 200
+    resp = jsonify([serialize_admin_spare(r) for r in rows])
+    resp.headers["X-Sync-Cursor"] = cursor
+    return resp, 200
   except Exception as e:
     current_app.logger.error(f"admin_get_spares error: {e}")
     return jsonify({"error": str(e)}), 500
@@ -691,53 +921,10 @@ def admin_get_spares_counts():
     """
     supabase_admin = current_app.config['supabase_admin']
     try:
-        # Note: some DBs don't have `status_updated_at`. Avoid selecting a column
-        # that may not exist to prevent SQL errors; we'll read it from the row
-        # if present. Select last_updated_at and created_at which are expected.
-        res = supabase_admin.table("spares_requirements").select("id, status, closed, created_at, last_updated_at").execute()
-        rows = res.data if res.data else []
-        total = len(rows)
-        active = 0
-        latest = None
-
-        def parse_bool(val):
-            if isinstance(val, bool):
-                return val
-            if val is None:
-                return False
-            s = str(val).strip().lower()
-            return s in ("1", "true", "t", "yes", "y")
-
-        def parse_dt(cand):
-            if not cand:
-                return None
-            s = str(cand)
-            # handle trailing Z
-            if s.endswith('Z'):
-                s = s[:-1] + '+00:00'
-            try:
-                return datetime.fromisoformat(s)
-            except Exception:
-                formats = ["%Y-%m-%d %H:%M:%S", "%d-%m-%Y %I:%M %p", "%Y-%m-%d"]
-                for fmt in formats:
-                    try:
-                        return datetime.strptime(s, fmt)
-                    except Exception:
-                        continue
-            return None
-
-        for r in rows:
-            closed_raw = r.get('closed') if 'closed' in r else None
-            status_raw = r.get('status') or ''
-            closed = parse_bool(closed_raw) or (str(status_raw).strip().lower() == 'closed')
-            if not closed:
-                active += 1
-            # consider status_updated_at first, then last_updated_at, then created_at
-            cand = r.get('status_updated_at') or r.get('last_updated_at') or r.get('created_at')
-            dt = parse_dt(cand)
-            if dt:
-                if latest is None or dt > latest:
-                    latest = dt
+        stats = current_app.config['SPARES_STATS'].get(supabase_admin)
+        total = stats["total"]
+        active = stats["open"]
+        latest = stats["latest"]
 
         if latest:
             try:
@@ -759,21 +946,8 @@ def admin_get_spares_counts():
 def admin_get_spares_next_ref():
   supabase_admin = current_app.config['supabase_admin']
   try:
-    res = supabase_admin.table("spares_requirements").select("ref_no").order("id", desc=True).limit(1).execute()
-    last = None
-    if res.data and len(res.data) > 0:
-      last = res.data[0].get("ref_no") or res.data[0].get("ref_number")
-    if last:
-      try:
-        num = int(last)
-      except:
-        try:
-          num = int(str(last).lstrip("0") or "0")
-        except:
-          num = 0
-    else:
-      num = 0
-    next_ref = str(num + 1).zfill(4)
+    # preview only; the number is assigned when the spare is created
+    next_ref = current_app.config['SPARES_REFS'].peek(supabase_admin)
     return jsonify({"next_ref": next_ref}), 200
   except Exception as e:
     current_app.logger.error(f"admin_get_spares_next_ref error: {e}")
@@ -827,23 +1001,14 @@ def admin_create_spare():
   supabase_admin = current_app.config['supabase_admin']
   data = request.get_json() or {}
   try:
-    ref_no = data.get("ref_no")
-    if not ref_no:
-      r = supabase_admin.table("spares_requirements").select("ref_no").order("id", desc=True).limit(1).execute()
-      last = None
-      if r.data and len(r.data) > 0:
-        last = r.data[0].get("ref_no") or r.data[0].get("ref_number")
-      if last:
-        try:
-          num = int(last)
-        except:
-          try:
-            num = int(str(last).lstrip("0") or "0")
-          except:
-            num = 0
-      else:
-        num = 0
-      ref_no = str(num + 1).zfill(4)
+    # ref_no always comes from the block allocator so concurrent creators can't collide
+    ref_no = current_app.config['SPARES_REFS'].next_ref(supabase_admin)
+
+    # fill the description from asset master instead of trusting the client
+    if data.get("asset_code") and not data.get("asset_description"):
+      asset = request_loader().get(data.get("asset_code"))
+      if asset:
+        data["asset_description"] = asset.get("asset_description")
 
     payload = {
       "ref_no": ref_no,
@@ -863,38 +1028,59 @@ def admin_create_spare():
       "created_by": session.get("user") or session.get("name"),
       "metadata": data.get("metadata") or {},
       "created_at": datetime.now(IST).isoformat(),
-      "status_updated_at": datetime.now(IST).isoformat()
+      "status_updated_at": datetime.now(IST).isoformat(),
+      "last_updated_at": datetime.now(timezone.utc).isoformat()
     }
 
     supabase_admin.table("spares_requirements").insert(payload).execute()
+    # the row exists now: a failing hook must not turn the create into an error
+    try:
+      invalidate_spares_stats()
+      notify_spares_event("created", ref_no=ref_no)
+    except Exception as hook_err:
+      current_app.logger.warning(f"admin_create_spare post-insert hooks failed: {hook_err}")
     return jsonify({"success": True, "ref_no": ref_no}), 201
+  except RefAllocationError as e:
+    current_app.logger.error(f"admin_create_spare error: {e}")
+    return jsonify({"success": False, "error": "Could not assign a reference number, please try again"}), 503
   except Exception as e:
     current_app.logger.error(f"admin_create_spare error: {e}")
     return jsonify({"success": False, "error": str(e)}), 500
 
 
+# Fields an admin may change on a spare (single and bulk update)
+ADMIN_SPARE_FIELDS = ["priority", "for_type", "asset_code", "asset_description", "required_by",
+                      "requisition", "spares_req", "current_status", "actioner", "dc_required",
+                      "dc_number", "status", "created_by", "metadata"]
+
+
+def _admin_spare_patch(data):
+  update = {}
+  # Allow admin to update many fields
+  for field in ADMIN_SPARE_FIELDS:
+    if field in data:
+      update[field] = data.get(field)
+  # ensure proper booleans
+  if "dc_required" in update:
+    update["dc_required"] = bool(update["dc_required"])
+  if "closed" in data:
+    update["closed"] = bool(data.get("closed"))
+  # update status timestamp (last_updated_at drives delta sync)
+  update["status_updated_at"] = datetime.now(IST).isoformat()
+  update["last_updated_at"] = datetime.now(timezone.utc).isoformat()
+  return update
+
+
 @admin_bp.route('/update_spare/<int:spare_id>', methods=['POST'])
 @require_role('admin')
 def admin_update_spare(spare_id):
   supabase_admin = current_app.config['supabase_admin']
   data = request.get_json() or {}
   try:
-    update = {}
-    # Allow admin to update many fields
-    for field in ["priority", "for_type", "asset_code", "asset_description", "required_by",
-                  "requisition", "spares_req", "current_status", "actioner", "dc_required",
-                  "dc_number", "status", "created_by", "metadata"]:
-      if field in data:
-        update[field] = data.get(field)
-    # ensure proper booleans
-    if "dc_required" in update:
-      update["dc_required"] = bool(update["dc_required"])
-    if "closed" in data:
-      update["closed"] = bool(data.get("closed"))
-    # update status timestamp
-    update["status_updated_at"] = datetime.now(IST).isoformat()
-
-    supabase_admin.table("spares_requirements").update(update).eq("id", spare_id).execute()
+    update = _admin_spare_patch(data)
+    res = supabase_admin.table("spares_requirements").update(update).eq("id", spare_id).execute()
+    invalidate_spares_stats()
+    notify_spares_event("closed" if update.get("closed") else "updated", spare_id=spare_id, rows=res.data)
     return jsonify({"success": True}), 200
   except Exception as e:
     current_app.logger.error(f"admin_update_spare error: {e}")
@@ -911,9 +1097,12 @@ def admin_close_spare(spare_id):
       "status": "Closed",
       "current_status": "Closed",
       "status_updated_at": datetime.now(IST).isoformat(),
+      "last_updated_at": datetime.now(timezone.utc).isoformat(),
       "actioner": session.get("name") or session.get("user")
     }
-    supabase_admin.table("spares_requirements").update(update).eq("id", spare_id).execute()
+    res = supabase_admin.table("spares_requirements").update(update).eq("id", spare_id).execute()
+    invalidate_spares_stats()
+    notify_spares_event("closed", spare_id=spare_id, rows=res.data)
     return jsonify({"success": True}), 200
   except Exception as e:
     current_app.logger.error(f"admin_close_spare error: {e}")
@@ -941,9 +1130,83 @@ def admin_delete_spare(spare_id):
             current_app.logger.warning(f"admin_delete_spare: no rows deleted for id={spare_id} (res.data={deleted})")
             return jsonify({"success": False, "error": "No record found to delete"}), 404
 
+        record_spares_tombstones(supabase_admin, [spare_id])
+        invalidate_spares_stats()
         current_app.logger.info(f"admin_delete_spare: deleted id={spare_id}, deleted_rows={deleted}")
         return jsonify({"success": True, "deleted": deleted}), 200
 
     except Exception as e:
         current_app.logger.error(f"admin_delete_spare error: {e}", exc_info=True)
-        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# ---------------- ADMIN SPARES: BULK ACTIONS ----------------
+# Body: {"ids": [..]} (+ "patch": {..} for update). Per-id results, see spares_bulk.py
+@admin_bp.route('/bulk_update_spares', methods=['POST'])
+@require_role('admin')
+def admin_bulk_update_spares():
+  supabase_admin = current_app.config['supabase_admin']
+  data = request.get_json() or {}
+  try:
+    ids = parse_ids(data.get("ids"))
+    patch = parse_patch(data.get("patch"), set(ADMIN_SPARE_FIELDS) | {"closed"})
+  except ValueError as e:
+    return jsonify({"success": False, "error": str(e)}), 400
+  try:
+    update = _admin_spare_patch(patch)
+    results, rows = bulk_update_spares(supabase_admin, ids, update)
+    invalidate_spares_stats()
+    for r in rows:
+      notify_spares_event("closed" if update.get("closed") else "updated", spare_id=r.get("id"), rows=[r])
+    return jsonify(summarize(results)), 200
+  except Exception as e:
+    current_app.logger.error(f"admin_bulk_update_spares error: {e}")
+    return jsonify({"success": False, "error": str(e)}), 500
+
+
+@admin_bp.route('/bulk_close_spares', methods=['POST'])
+@require_role('admin')
+def admin_bulk_close_spares():
+  supabase_admin = current_app.config['supabase_admin']
+  data = request.get_json() or {}
+  try:
+    ids = parse_ids(data.get("ids"))
+  except ValueError as e:
+    return jsonify({"success": False, "error": str(e)}), 400
+  try:
+    update = {
+      "closed": True,
+      "status": "Closed",
+      "current_status": "Closed",
+      "status_updated_at": datetime.now(IST).isoformat(),
+      "last_updated_at": datetime.now(timezone.utc).isoformat(),
+      "actioner": session.get("name") or session.get("user")
+    }
+    results, rows = bulk_update_spares(supabase_admin, ids, update)
+    invalidate_spares_stats()
+    for r in rows:
+      notify_spares_event("closed", spare_id=r.get("id"), rows=[r])
+    return jsonify(summarize(results)), 200
+  except Exception as e:
+    current_app.logger.error(f"admin_bulk_close_spares error: {e}")
+    return jsonify({"success": False, "error": str(e)}), 500
+
+
+@admin_bp.route('/bulk_delete_spares', methods=['POST'])
+@require_role('admin')
+def admin_bulk_delete_spares():
+  supabase_admin = current_app.config['supabase_admin']
+  data = request.get_json() or {}
+  try:
+    ids = parse_ids(data.get("ids"))
+  except ValueError as e:
+    return jsonify({"success": False, "error": str(e)}), 400
+  try:
+    results, rows = bulk_delete_spares(supabase_admin, ids)
+    record_spares_tombstones(supabase_admin, [r.get("id") for r in rows])
+    invalidate_spares_stats()
+    current_app.logger.info(f"admin_bulk_delete_spares: deleted {len(rows)} of {len(ids)} by {session.get('user')}")
+    return jsonify(summarize(results)), 200
+  except Exception as e:
+    current_app.logger.error(f"admin_bulk_delete_spares error: {e}")
+    return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
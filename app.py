@@ -42,9 +42,18 @@ def create_app():
 
     # expose retry config to app for use in routes that need to retry on transient network errors
     app.config['SUPABASE_HTTP_RETRIES'] = http_retries
+    # kept so a preloading server can drop pooled connections before forking workers
+    app.config['SUPABASE_HTTP_CLIENT'] = httpx_client
 
-    app.config['supabase'] = create_client(SUPABASE_URL, SUPABASE_ANON_KEY, options=options)
-    app.config['supabase_admin'] = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=options)
+    # --- Metrics: every request and every Supabase table/rpc call is timed (served at /admin/metrics) ---
+    from metrics import InstrumentedClient, create_metrics, init_app as init_metrics
+    app.config['METRICS'] = create_metrics()
+    init_metrics(app, app.config['METRICS'])
+
+    app.config['supabase'] = InstrumentedClient(
+        create_client(SUPABASE_URL, SUPABASE_ANON_KEY, options=options), app.config['METRICS'])
+    app.config['supabase_admin'] = InstrumentedClient(
+        create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY, options=options), app.config['METRICS'])
 
     # Modules list (cleaned and properly indented)
     app.config['MODULES'] = [
@@ -73,14 +82,103 @@ def create_app():
     app.config['FEATURE_MATRIX'] = scan_user_templates("templates")
     print("🔍 Loaded feature matrix with", len(app.config['FEATURE_MATRIX']), "user pages.")
 
+    # --- Background export jobs (bounded pool + artifact dir, see export_jobs.py) ---
+    from export_jobs import create_export_queue
+    app.config['EXPORT_JOBS'] = create_export_queue()
+    # Let a fronting nginx/apache serve artifacts when configured; otherwise
+    # gunicorn's wsgi.file_wrapper uses sendfile for path-based send_file.
+    app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE", "0").lower() in ("1", "true", "yes")
+
+    # --- In-process asset search index for autocomplete (built lazily on first query) ---
+    from asset_index import AssetSearchIndex
+    try:
+        index_check = float(os.getenv("ASSET_INDEX_CHECK_SECONDS", "30"))
+    except Exception:
+        index_check = 30.0
+    app.config['ASSET_INDEX'] = AssetSearchIndex(check_interval=index_check)
+
+    # --- Fleet summary rollups (package/owner/activity/category/location), kept incrementally ---
+    from asset_summary import AssetSummary
+    try:
+        summary_check = float(os.getenv("ASSET_SUMMARY_CHECK_SECONDS", "30"))
+    except Exception:
+        summary_check = 30.0
+    app.config['ASSET_SUMMARY'] = AssetSummary(check_interval=summary_check)
+
+    # --- asset_code -> agency/package/owner/location/description cache for write paths ---
+    from asset_lookup import AssetLookup
+    try:
+        lookup_ttl = float(os.getenv("ASSET_LOOKUP_TTL_SECONDS", "300"))
+    except Exception:
+        lookup_ttl = 300.0
+    app.config['ASSET_LOOKUP'] = AssetLookup(ttl=lookup_ttl)
+
+    # --- Short-TTL spares counters (one grouped query, invalidated on writes) ---
+    from spares_stats import SparesStats
+    try:
+        spares_ttl = float(os.getenv("SPARES_STATS_TTL_SECONDS", "5"))
+    except Exception:
+        spares_ttl = 5.0
+    app.config['SPARES_STATS'] = SparesStats(ttl=spares_ttl)
+
+    # --- Spares ref_no allocator (atomic sequence, block reserved per worker) ---
+    from ref_sequence import RefAllocator
+    try:
+        ref_block = int(os.getenv("SPARES_REF_BLOCK_SIZE", "20"))
+    except Exception:
+        ref_block = 20
+    # one numbering source per deployment: "rpc" (default) or, explicitly, "local"
+    ref_source = (os.getenv("SPARES_REF_SOURCE") or "rpc").strip().lower()
+    if ref_source not in ("rpc", "local"):
+        print(f"⚠️ Unknown SPARES_REF_SOURCE={ref_source!r}; using rpc")
+        ref_source = "rpc"
+    app.config['SPARES_REFS'] = RefAllocator(block_size=ref_block, state_path=os.getenv("SPARES_REF_STATE"),
+                                             source=ref_source)
+
+    # --- Asset CSV import: rows per multi-row upsert ---
+    try:
+        app.config['ASSET_IMPORT_BATCH_SIZE'] = max(int(os.getenv("ASSET_IMPORT_BATCH_SIZE", "500")), 1)
+    except Exception:
+        app.config['ASSET_IMPORT_BATCH_SIZE'] = 500
+
+    # --- Login fast path: cached users_meta directory + shared dropdown_config ---
+    from user_directory import UserDirectory
+    from dropdown_cache import DropdownCache
+    try:
+        directory_ttl = float(os.getenv("USER_DIRECTORY_TTL", "60"))
+    except Exception:
+        directory_ttl = 60.0
+    try:
+        dropdown_ttl = float(os.getenv("DROPDOWN_CACHE_TTL", "30"))
+    except Exception:
+        dropdown_ttl = 30.0
+    app.config['USER_DIRECTORY'] = UserDirectory(ttl=directory_ttl)
+    app.config['DROPDOWN_CACHE'] = DropdownCache(ttl=dropdown_ttl)
+
+    # --- Bulk asset/user deletes (parallel chunked deletes as background jobs) ---
+    from bulk_delete import create_bulk_deleter
+    app.config['BULK_DELETE'] = create_bulk_deleter()
+
+    # --- Bulk user provisioning from CSV (rate-limited, resumable jobs) ---
+    from user_provisioning import create_user_provisioner
+    app.config['USER_PROVISIONER'] = create_user_provisioner()
+
+    # --- Web Push for spares events (VAPID; batched background dispatcher) ---
+    from push_dispatch import create_push_dispatcher
+    app.config['PUSH'] = create_push_dispatcher()
+
     # Register blueprints
     from auth_routes import auth_bp
     from admin_routes import admin_bp
     from user_routes import user_bp
+    from export_routes import export_bp
+    from push_routes import push_bp
 
     app.register_blueprint(auth_bp)                     # login/logout at /login, /logout, etc.
     app.register_blueprint(admin_bp, url_prefix='/admin')     # admin routes (paths keep previous names)
     app.register_blueprint(user_bp, url_prefix='/user')      # user routes
+    app.register_blueprint(export_bp, url_prefix='/exports')  # background export jobs
+    app.register_blueprint(push_bp, url_prefix='/push')       # Web Push subscriptions
 
     # home route preserves old behavior
     @app.route('/')
@@ -89,20 +187,57 @@ def create_app():
 
     return app
 
+
+# ===== ✅ STARTUP TASKS (once per deployment) =====
+def run_startup_tasks(app):
+    """
+    One-off work that used to live only under __main__:
+      - make sure a first admin exists
+      - warm the shared caches and compile every template, so a preloading
+        server (wsgi.py) forks workers that already hold them
+    Every step is best-effort; a Supabase outage must not stop the server.
+    """
+    from services import ensure_first_admin
+
+    supabase_admin = app.config['supabase_admin']
+    ensure_first_admin(supabase_admin, app.config['MODULES'])
+
+    warmups = [
+        ("dropdown_config", lambda: app.config['DROPDOWN_CACHE'].ensure_fresh(supabase_admin)),
+        ("user directory", lambda: app.config['USER_DIRECTORY'].ensure_fresh(supabase_admin)),
+        ("asset summary", lambda: app.config['ASSET_SUMMARY'].ensure_fresh(supabase_admin)),
+        ("templates", lambda: [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates()]),
+    ]
+    for name, warm in warmups:
+        try:
+            warm()
+        except Exception as e:
+            print(f"⚠️ Startup warm-up of {name} skipped:", e)
+
+
+def release_connections(app):
+    """Close pooled Supabase connections; a forked worker must not share the parent's sockets."""
+    client = app.config.get('SUPABASE_HTTP_CLIENT')
+    transport = getattr(client, "_transport", None)
+    if transport is not None:
+        try:
+            transport.close()   # the pool stays usable and reconnects on the next request
+        except Exception as e:
+            print("⚠️ Could not release Supabase connections:", e)
+
+
 if __name__ == "__main__":
+    # Development server only; production runs `gunicorn wsgi:app` (see gunicorn.conf.py)
     app = create_app()
 
-    # Ensure first admin exists
+    # Run startup tasks in background to avoid blocking startup if Supabase is unreachable
     try:
-        from services import ensure_first_admin
         import threading
 
-        # Run admin creation in background to avoid blocking startup if Supabase is unreachable
-        t = threading.Thread(target=lambda: ensure_first_admin(app.config['supabase_admin'], app.config['MODULES']))
+        t = threading.Thread(target=run_startup_tasks, args=(app,))
         t.daemon = True
         t.start()
     except Exception as e:
-        print("Warning: ensure_first_admin startup skipped:", e)
+        print("Warning: startup tasks skipped:", e)
 
     app.run(host="0.0.0.0", port=5000, debug=True)
-        
\ No newline at end of file
@@ -0,0 +1,309 @@
+# asset_import.py
+"""Batched asset CSV import (upsert on asset_code).
+
+The upload is read as a stream (plain or gzip-compressed CSV) and handled
+in chunks of `batch_size` rows:
+  1. normalize the chunk column by column (numbers, dates)
+  2. validate: asset_code required, bad numbers/dates, duplicate codes
+     within the file
+  3. one multi-row `upsert(on_conflict="asset_code")` per chunk. If a chunk
+     is rejected, its rows are retried one by one so only the bad rows fail.
+
+Re-uploading a file updates the existing assets instead of duplicating
+them. This needs the unique index on asset_code shipped in
+migrations/001_asset_master_asset_code_unique.sql. Without it Postgres
+rejects every upsert (42P10); the import then notices on the first chunk
+and falls back to plain inserts, as before this module existed, and
+reports a warning so the migration gets applied.
+
+Every problem is reported per row:
+    {"row": 17, "asset_code": "EX-01", "field": "ehc", "error": "not a number: 'abc'"}
+"""
+import csv
+import gzip
+import io
+from datetime import datetime
+
+ASSET_IMPORT_FIELDS = [
+    "asset_code", "asset_description", "asset_category", "reg_no", "package", "activity",
+    "location", "meter_type", "uom", "fuel_norms", "owner", "vendor_code", "agency",
+    "wod_number", "vendor_mail_id", "date_of_commission", "starting_reading",
+    "tank_capacity", "hsd_available", "make", "model", "pm_make", "pm_model", "ehc", "ihc",
+    "shift_hours", "operator_available", "helper_available", "supervisor_owner_name",
+    "supervisor_owner_phone", "operator1", "operator1_phone", "operator1_shift",
+    "operator2", "operator2_phone", "operator2_shift",
+]
+NUMERIC_FIELDS = ["starting_reading", "tank_capacity", "hsd_available", "ehc", "ihc",
+                  "additional_operator_charge", "shift_hours", "operator_available", "helper_available"]
+DATE_FIELDS = ["date_of_commission"]
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_supported_upload(filename):
+    name = (filename or "").lower()
+    return name.endswith(".csv") or name.endswith(".csv.gz") or name.endswith(".gz")
+
+
+def open_upload(file_storage):
+    """Text stream over an uploaded .csv or .csv.gz without reading it all into memory."""
+    raw = file_storage.stream
+    head = raw.read(2)
+    raw.seek(0)
+    if head == _GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    return io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+
+def parse_date(val):
+    """DD-MM-YYYY or YYYY-MM-DD -> YYYY-MM-DD (None if unparseable)."""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(val, fmt).strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def iter_chunks(reader, size):
+    """Yield lists of (row_number, row) from a DictReader, `size` rows at a time."""
+    chunk = []
+    for i, row in enumerate(reader, start=1):
+        chunk.append((i, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalize_chunk(chunk, seen_codes, stamp):
+    """
+    Normalize and validate one chunk in place.
+    Returns (records ready to upsert as [(row_number, record)], errors).
+    `seen_codes` maps asset_code -> first row number across the whole file.
+    `stamp` holds the audit columns added to every record.
+    """
+    errors = []
+    bad = set()
+
+    def fail(i, row, field, msg):
+        errors.append({"row": i, "asset_code": (row.get("asset_code") or "").strip() or None,
+                       "field": field, "error": msg})
+        bad.add(i)
+
+    # column-wise conversions (each converter is looked up once per column)
+    for field in NUMERIC_FIELDS:
+        for i, row in chunk:
+            val = row.get(field)
+            if val is None:
+                continue
+            val = str(val).strip()
+            if not val:
+                row[field] = None
+                continue
+            try:
+                row[field] = float(val)
+            except ValueError:
+                fail(i, row, field, f"not a number: {val!r}")
+
+    for field in DATE_FIELDS:
+        memo = {}
+        for i, row in chunk:
+            val = (row.get(field) or "").strip()
+            if not val:
+                row[field] = None
+                continue
+            if val not in memo:
+                memo[val] = parse_date(val)
+            if memo[val] is None:
+                fail(i, row, field, f"invalid date {val!r} (use DD-MM-YYYY or YYYY-MM-DD)")
+            else:
+                row[field] = memo[val]
+
+    records = []
+    for i, row in chunk:
+        code = (row.get("asset_code") or "").strip()
+        if not code:
+            fail(i, row, "asset_code", "asset_code is required")
+            continue
+        if code in seen_codes:
+            fail(i, row, "asset_code", f"duplicate asset_code (first seen on row {seen_codes[code]})")
+            continue
+        if i in bad:
+            continue
+        seen_codes[code] = i
+        record = {f: row.get(f) for f in ASSET_IMPORT_FIELDS}
+        record["asset_code"] = code
+        record.update(stamp)
+        records.append((i, record))
+    return records, errors
+
+
+MISSING_KEY_WARNING = ("asset_code has no unique index: rows were inserted, not upserted. "
+                       "Apply migrations/001_asset_master_asset_code_unique.sql.")
+
+
+class MissingConflictKey(Exception):
+    """asset_master has no unique constraint on asset_code (Postgres 42P10)."""
+
+
+def _is_missing_conflict_key(exc):
+    msg = str(exc)
+    return "42P10" in msg or "no unique or exclusion constraint" in msg
+
+
+def _write(supabase_admin, payload, upsert):
+    table = supabase_admin.table("asset_master")
+    q = table.upsert(payload, on_conflict="asset_code") if upsert else table.insert(payload)
+    return q.execute().data or []
+
+
+def upsert_chunk(supabase_admin, records, upsert=True):
+    """Write one chunk; on failure retry row by row. Returns (written rows, errors).
+
+    Raises MissingConflictKey when upserts cannot work at all.
+    """
+    try:
+        return _write(supabase_admin, [r for _, r in records], upsert), []
+    except Exception as e:
+        if upsert and _is_missing_conflict_key(e):
+            raise MissingConflictKey(str(e)) from e
+
+    written, errors = [], []
+    for i, record in records:
+        try:
+            written.extend(_write(supabase_admin, record, upsert))
+        except Exception as e:
+            msg = str(e)
+            if "date/time field value out of range" in msg:
+                msg = "Invalid date format. Please use DD-MM-YYYY (e.g., 25-08-2025)."
+            errors.append({"row": i, "asset_code": record.get("asset_code"), "field": None, "error": msg})
+    return written, errors
+
+
+def import_assets(supabase_admin, text_stream, batch_size, stamp, on_written=None):
+    """
+    Run the whole import. `on_written(rows)` is called after each chunk
+    (cache/index maintenance). Returns {"rows", "upserted", "errors"} plus
+    "warning" when the asset_code index is missing.
+    """
+    reader = csv.DictReader(text_stream)
+    seen_codes, errors = {}, []
+    total = upserted = 0
+    upsert, warning = True, None
+    for chunk in iter_chunks(reader, batch_size):
+        total += len(chunk)
+        records, chunk_errors = normalize_chunk(chunk, seen_codes, stamp)
+        errors.extend(chunk_errors)
+        if not records:
+            continue
+        try:
+            written, write_errors = upsert_chunk(supabase_admin, records, upsert)
+        except MissingConflictKey as e:
+            print("⚠️ asset_master.asset_code unique index missing, importing with inserts:", e)
+            upsert, warning = False, MISSING_KEY_WARNING
+            written, write_errors = upsert_chunk(supabase_admin, records, upsert)
+        errors.extend(write_errors)
+        upserted += len(records) - len(write_errors)
+        if on_written and written:
+            on_written(written)
+    errors.sort(key=lambda e: e["row"])
+    report = {"rows": total, "upserted": upserted, "errors": errors}
+    if warning:
+        report["warning"] = warning
+    return report
+
+
+# ===== ✅ DRY RUN (validate only, vectorized with pandas)
+def dry_run_assets(supabase_admin, text_stream):
+    """
+    Validate a whole upload without writing anything.
+    Returns {"rows", "would_insert", "would_update", "errors", "error_counts"}.
+
+    Checks run column-wise over the full file: numeric coercion, date
+    formats, missing / duplicate asset_code and reg_no within the file,
+    reg_no already used by a different catalog asset, and values of any
+    column backed by a dropdown_config list (package, activity, ...).
+    """
+    import pandas as pd
+
+    df = pd.read_csv(text_stream, dtype=str, keep_default_na=False)
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.apply(lambda s: s.str.strip())
+    row_no = pd.Series(range(1, len(df) + 1), index=df.index)
+    empty = pd.Series("", index=df.index)
+    code = df["asset_code"] if "asset_code" in df else empty
+    reg = df["reg_no"] if "reg_no" in df else empty
+
+    found = []
+
+    def flag(mask, field, message):
+        """message: a str, or a Series aligned with df (per-row text)."""
+        if not mask.any():
+            return
+        msgs = message[mask] if isinstance(message, pd.Series) else pd.Series(message, index=df.index[mask])
+        found.append(pd.DataFrame({"row": row_no[mask], "asset_code": code[mask], "field": field, "error": msgs}))
+
+    for field in NUMERIC_FIELDS:
+        if field in df:
+            col = df[field]
+            bad = (col != "") & pd.to_numeric(col, errors="coerce").isna()
+            flag(bad, field, "not a number: '" + col + "'")
+
+    for field in DATE_FIELDS:
+        if field in df:
+            col = df[field]
+            parsed = None
+            for fmt in DATE_FORMATS:
+                attempt = pd.to_datetime(col, format=fmt, errors="coerce")
+                parsed = attempt if parsed is None else parsed.fillna(attempt)
+            flag((col != "") & parsed.isna(), field,
+                 "invalid date '" + col + "' (use DD-MM-YYYY or YYYY-MM-DD)")
+
+    flag(code == "", "asset_code", "asset_code is required")
+    first_code = row_no.groupby(code).transform("min").astype(str)
+    flag((code != "") & code.duplicated(), "asset_code", "duplicate asset_code (first seen on row " + first_code + ")")
+    first_reg = row_no.groupby(reg).transform("min").astype(str)
+    flag((reg != "") & reg.duplicated(), "reg_no", "duplicate reg_no (first seen on row " + first_reg + ")")
+
+    # against the catalog
+    catalog = pd.DataFrame(
+        supabase_admin.table("asset_master").select("asset_code, reg_no").execute().data or [],
+        columns=["asset_code", "reg_no"],
+    ).fillna("")
+    existing = code.isin(set(catalog["asset_code"]))
+    reg_owner = reg.map(catalog[catalog["reg_no"] != ""].drop_duplicates("reg_no").set_index("reg_no")["asset_code"])
+    flag(reg_owner.notna() & (reg_owner != code), "reg_no",
+         "reg_no already belongs to asset " + reg_owner.fillna("").astype(str))
+
+    # dropdown-backed columns
+    dropdowns = pd.DataFrame(
+        supabase_admin.table("dropdown_config").select("list_name, value").execute().data or [],
+        columns=["list_name", "value"],
+    )
+    for list_name, allowed in dropdowns.groupby("list_name")["value"]:
+        if list_name in df:
+            col = df[list_name]
+            flag((col != "") & ~col.isin(set(allowed.astype(str).str.strip())), list_name,
+                 "'" + col + f"' is not in the {list_name} list")
+
+    errors = []
+    if found:
+        matrix = pd.concat(found, ignore_index=True).sort_values(["row", "field"], kind="stable")
+        errors = [{"row": int(r), "asset_code": c or None, "field": f, "error": e}
+                  for r, c, f, e in zip(matrix["row"].tolist(), matrix["asset_code"].tolist(),
+                                        matrix["field"].tolist(), matrix["error"].tolist())]
+    counts = {}
+    for e in errors:
+        counts[e["field"]] = counts.get(e["field"], 0) + 1
+
+    valid_codes = code != ""
+    return {
+        "rows": int(len(df)),
+        "would_insert": int((valid_codes & ~existing & ~code.duplicated()).sum()),
+        "would_update": int((valid_codes & existing & ~code.duplicated()).sum()),
+        "errors": errors,
+        "error_counts": counts,
+    }
@@ -0,0 +1,211 @@
+# asset_index.py
+"""In-process search index over the asset catalog (autocomplete).
+
+Indexes `asset_code`, `reg_no` and `asset_description` with:
+  - a trigram -> asset postings map for substring queries (3+ chars)
+  - sorted prefix lists (codes, reg numbers, description words) for short
+    queries and prefix ranking
+
+Ranking (best first): exact code / reg_no, code prefix, reg_no prefix,
+description word prefix, code substring, reg_no substring, description
+substring; ties break on the shorter code.
+
+Freshness: writes made through this process update the index directly
+(`upsert` / `remove`). Changes made by other workers are picked up by
+`ensure_fresh`, which probes the table version at most every
+`check_interval` seconds: edits are fetched as a delta on
+`last_updated_at`, while a changed row count (inserts/deletes) triggers a
+full rebuild.
+"""
+import bisect
+import heapq
+import threading
+import time
+
+SEARCH_FIELDS = ("asset_code", "reg_no", "asset_description")
+RESULT_FIELDS = ("id", "asset_code", "asset_description", "reg_no", "owner", "package", "location", "agency")
+
+# ranks (lower is better)
+_EXACT, _CODE_PREFIX, _REG_PREFIX, _WORD_PREFIX, _CODE_SUB, _REG_SUB, _DESC_SUB = range(7)
+
+
+def _norm(val):
+    return " ".join(str(val).lower().split()) if val else ""
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class AssetSearchIndex:
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._clear()
+        self.version = None
+        self.built_at = 0.0
+        self._last_check = 0.0
+
+    def _clear(self):
+        self._docs = {}        # key -> result payload
+        self._text = {}        # key -> (code, reg, desc) normalized
+        self._grams = {}       # trigram -> set(keys)
+        self._prefix = []      # sorted [(token, field_rank, key)]
+
+    # ---------- build / maintain ----------
+    @staticmethod
+    def _key(row):
+        return row.get("id") if row.get("id") is not None else row.get("asset_code")
+
+    def _tokens(self, code, reg, desc):
+        out = []
+        if code:
+            out.append((code, _CODE_PREFIX))
+        if reg:
+            out.append((reg, _REG_PREFIX))
+        for word in set(desc.split()):
+            out.append((word, _WORD_PREFIX))
+        return out
+
+    def _add(self, row, sort=True):
+        key = self._key(row)
+        if key is None:
+            return
+        code, reg, desc = (_norm(row.get(f)) for f in SEARCH_FIELDS)
+        self._docs[key] = {f: row.get(f) for f in RESULT_FIELDS}
+        self._text[key] = (code, reg, desc)
+        for text in (code, reg, desc):
+            for g in _trigrams(text):
+                self._grams.setdefault(g, set()).add(key)
+        for token, rank in self._tokens(code, reg, desc):
+            if sort:
+                bisect.insort(self._prefix, (token, rank, key))
+            else:
+                self._prefix.append((token, rank, key))
+
+    def _drop(self, key):
+        text = self._text.pop(key, None)
+        self._docs.pop(key, None)
+        if not text:
+            return
+        for t in text:
+            for g in _trigrams(t):
+                keys = self._grams.get(g)
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self._grams[g]
+        for token, rank in self._tokens(*text):
+            i = bisect.bisect_left(self._prefix, (token, rank, key))
+            if i < len(self._prefix) and self._prefix[i] == (token, rank, key):
+                del self._prefix[i]
+
+    def build(self, rows, version=None):
+        """Replace the whole index with `rows`."""
+        with self._lock:
+            self._clear()
+            for r in rows:
+                self._add(r, sort=False)
+            self._prefix.sort()
+            self.version = version
+            self.built_at = time.time()
+
+    def upsert(self, row):
+        """Add or replace one asset (row must carry `id` or `asset_code`)."""
+        with self._lock:
+            key = self._key(row)
+            if key in self._docs:
+                merged = dict(self._docs[key])
+                merged.update({k: v for k, v in row.items() if k in RESULT_FIELDS})
+                self._drop(key)
+                row = merged
+            self._add(row)
+
+    def remove(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def remove_many(self, keys):
+        with self._lock:
+            for k in keys:
+                self._drop(k)
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ---------- freshness against Supabase ----------
+    def ensure_fresh(self, supabase_admin, force=False):
+        """Build on first use; afterwards probe the table version every `check_interval`s."""
+        from export_jobs import table_version
+
+        now = time.time()
+        if not force and self.built_at and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if not force and self.built_at and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            version = table_version(supabase_admin, "asset_master", "last_updated_at")
+            if not force and version == self.version:
+                return
+
+            old_count = (self.version or "").split(":", 1)[0]
+            new_count, _, new_stamp = version.partition(":")
+            old_stamp = (self.version or "").partition(":")[2]
+            if not force and self.built_at and old_count == new_count and old_stamp not in ("", "None"):
+                # same row count -> only edits; fetch just the changed rows
+                res = supabase_admin.table("asset_master") \
+                    .select(", ".join(RESULT_FIELDS + ("last_updated_at",))) \
+                    .gt("last_updated_at", old_stamp) \
+                    .execute()
+                for r in res.data or []:
+                    self.upsert(r)
+                self.version = version
+                return
+
+            res = supabase_admin.table("asset_master").select(", ".join(RESULT_FIELDS)).execute()
+            self.build(res.data or [], version=version)
+
+    # ---------- query ----------
+    def _prefix_hits(self, q, hits):
+        i = bisect.bisect_left(self._prefix, (q,))
+        while i < len(self._prefix):
+            token, rank, key = self._prefix[i]
+            if not token.startswith(q):
+                break
+            if token == q and rank in (_CODE_PREFIX, _REG_PREFIX):
+                rank = _EXACT
+            if rank < hits.get(key, 99):
+                hits[key] = rank
+            i += 1
+
+    def search(self, q, limit=50):
+        """Return up to `limit` ranked result payloads for query `q`."""
+        q = _norm(q)
+        if not q:
+            return []
+        with self._lock:
+            hits = {}
+            self._prefix_hits(q, hits)
+
+            if len(q) >= 3:
+                postings = sorted((self._grams.get(g, ()) for g in _trigrams(q)), key=len)
+                candidates = set(postings[0]) if postings else set()
+                for p in postings[1:]:
+                    candidates &= p
+                    if not candidates:
+                        break
+                for key in candidates:
+                    if key in hits:
+                        continue
+                    code, reg, desc = self._text[key]
+                    if q in code:
+                        hits[key] = _CODE_SUB
+                    elif q in reg:
+                        hits[key] = _REG_SUB
+                    elif q in desc:
+                        hits[key] = _DESC_SUB
+
+            text = self._text
+            ranked = heapq.nsmallest(limit, hits.items(), key=lambda kv: (kv[1], len(text[kv[0]][0]), text[kv[0]][0]))
+            return [dict(self._docs[k]) for k, _ in ranked]
@@ -0,0 +1,179 @@
+# asset_lookup.py
+"""Keyed asset lookup (asset_code -> agency, package, owner, location, description).
+
+Write paths that need to enrich a record from asset_master use this instead
+of issuing their own `.single()` query:
+  - `AssetLookup` is a process-wide TTL cache (misses are cached too, so an
+    unknown code doesn't hit Supabase on every call)
+  - asset writes keep it correct via `apply_asset_writes()`, which also
+    updates the search index and fleet summary
+  - `request_loader()` returns a per-request batch loader on `flask.g`:
+    collect codes with `want()`, then the first `get()` resolves all of them
+    with a single `in_()` query
+
+    loader = request_loader()
+    loader.want(*codes)
+    agency = (loader.get(code) or {}).get("agency")
+"""
+import threading
+import time
+
+LOOKUP_FIELDS = ("asset_code", "agency", "package", "owner", "location", "asset_description")
+
+_MISSING = object()
+
+
+class AssetLookup:
+    def __init__(self, ttl=300, chunk_size=200):
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self._cache = {}  # code -> (expires_at, record or None)
+        self._code_by_id = {}  # asset id -> code it is cached under (to spot renames)
+        self._lock = threading.Lock()
+
+    def _cached(self, code, now):
+        hit = self._cache.get(code)
+        if hit is None or hit[0] < now:
+            return _MISSING
+        return hit[1]
+
+    def get_many(self, supabase_admin, codes):
+        """Return {code: record or None} for `codes`, fetching misses in one round trip per chunk."""
+        now = time.time()
+        out, missing = {}, []
+        with self._lock:
+            for code in {c for c in codes if c}:
+                rec = self._cached(code, now)
+                if rec is _MISSING:
+                    missing.append(code)
+                else:
+                    out[code] = rec
+
+        for i in range(0, len(missing), self.chunk_size):
+            chunk = missing[i:i + self.chunk_size]
+            res = supabase_admin.table("asset_master") \
+                .select(", ".join(("id",) + LOOKUP_FIELDS)) \
+                .in_("asset_code", chunk) \
+                .execute()
+            found = {r.get("asset_code"): {f: r.get(f) for f in LOOKUP_FIELDS} for r in res.data or []}
+            expires = time.time() + self.ttl
+            with self._lock:
+                for r in res.data or []:
+                    if r.get("id") is not None:
+                        self._code_by_id[r["id"]] = r.get("asset_code")
+                for code in chunk:
+                    rec = found.get(code)
+                    self._cache[code] = (expires, rec)
+                    out[code] = rec
+        return out
+
+    def get(self, supabase_admin, code):
+        if not code:
+            return None
+        return self.get_many(supabase_admin, [code]).get(code)
+
+    def prime(self, rows):
+        """Write-through: store freshly written asset rows.
+
+        A row whose asset_code changed (a rename) also drops the entry under
+        its previous code, so the old code stops resolving to this asset.
+        """
+        expires = time.time() + self.ttl
+        with self._lock:
+            for r in rows or []:
+                code = r.get("asset_code")
+                asset_id = r.get("id")
+                if asset_id is not None:
+                    previous = self._code_by_id.get(asset_id)
+                    if previous is not None and previous != code:
+                        self._cache.pop(previous, None)
+                    self._code_by_id[asset_id] = code
+                if code:
+                    self._cache[code] = (expires, {f: r.get(f) for f in LOOKUP_FIELDS})
+
+    def invalidate(self, codes=None):
+        """Forget `codes` (or everything when None)."""
+        with self._lock:
+            if codes is None:
+                self._cache.clear()
+                self._code_by_id.clear()
+            else:
+                for c in codes:
+                    self._cache.pop(c, None)
+
+
+class RequestAssetLoader:
+    """Collects asset codes during one request and resolves them together."""
+
+    def __init__(self, lookup, supabase_admin):
+        self.lookup = lookup
+        self.supabase_admin = supabase_admin
+        self._wanted = set()
+        self._loaded = {}
+
+    def want(self, *codes):
+        self._wanted.update(c for c in codes if c and c not in self._loaded)
+        return self
+
+    def load(self):
+        if self._wanted:
+            self._loaded.update(self.lookup.get_many(self.supabase_admin, self._wanted))
+            self._wanted.clear()
+        return self._loaded
+
+    def get(self, code):
+        if not code:
+            return None
+        if code not in self._loaded:
+            self._wanted.add(code)
+            self.load()
+        return self._loaded.get(code)
+
+
+def request_loader():
+    """Return the batch loader bound to the current request (created on first use)."""
+    from flask import current_app, g
+
+    loader = g.get("_asset_loader")
+    if loader is None:
+        loader = RequestAssetLoader(current_app.config["ASSET_LOOKUP"], current_app.config["supabase_admin"])
+        g._asset_loader = loader
+    return loader
+
+
+def apply_asset_writes(rows=None, removed_ids=None):
+    """Apply this process's asset writes to the in-process asset caches (best effort).
+
+    Updates the autocomplete index and the fleet summary rollups, and writes
+    through to the asset lookup cache; deletes are keyed by id, so they drop
+    the whole lookup cache.
+    """
+    from flask import current_app
+
+    lookup = current_app.config.get("ASSET_LOOKUP")
+    if lookup is not None:
+        lookup.prime(rows)
+        if removed_ids:
+            lookup.invalidate()
+    summary = current_app.config.get("ASSET_SUMMARY")
+    if summary is not None:
+        for r in rows or []:
+            summary.apply(r)
+        for i in removed_ids or []:
+            summary.remove(i)
+    index = current_app.config.get("ASSET_INDEX")
+    if index is None:
+        return
+    try:
+        for r in rows or []:
+            index.upsert(r)
+        if removed_ids:
+            keys = []
+            for i in removed_ids:
+                try:
+                    keys.append(int(i))
+                except (TypeError, ValueError):
+                    keys.append(i)
+            index.remove_many(keys)
+    except Exception as e:
+        current_app.logger.warning(f"asset index update skipped: {e}")
@@ -0,0 +1,141 @@
+# asset_patch.py
+"""Field-level asset edits with optimistic concurrency (admin + user).
+
+A client sends only the fields it changed, plus the `last_updated_at` it
+last saw for the row as a version token:
+
+    PATCH /admin/assets          (or /user/assets)
+    {"edits": [{"id": 7, "version": "2025-08-25T10:12:03+05:30",
+                "changes": {"owner": "Hire", "ehc": "125000"}}, ...]}
+
+Each edit is one conditional update (`eq("id") + eq("last_updated_at")`),
+so a row changed by someone else since it was loaded is not overwritten:
+the edit comes back as a conflict carrying the current row, and the page
+can show the other user's values. Every edit gets its own result:
+
+    {"id": 7, "ok": True, "row": {...}}
+    {"id": 8, "ok": False, "conflict": True, "error": "...", "row": {...}}
+
+Edits without a version (older pages, the full edit form) are applied
+unconditionally, as before.
+"""
+from datetime import datetime, timedelta, timezone
+
+from asset_import import ASSET_IMPORT_FIELDS, DATE_FIELDS, NUMERIC_FIELDS, parse_date
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+ASSET_EDIT_FIELDS = frozenset(ASSET_IMPORT_FIELDS) | {"activity_works", "additional_operator_charge"}
+MAX_EDITS = 200
+
+
+def clean_changes(changes):
+    """Validate and normalize one edit's changed fields. Raises ValueError."""
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("changes must be a non-empty object")
+    unknown = sorted(k for k in changes if k not in ASSET_EDIT_FIELDS)
+    if unknown:
+        raise ValueError(f"Fields not editable: {', '.join(unknown)}")
+    out = {}
+    for field, val in changes.items():
+        if isinstance(val, str):
+            val = val.strip()
+        if val == "" or val is None:
+            out[field] = None
+        elif field in NUMERIC_FIELDS:
+            try:
+                out[field] = float(val)
+            except (TypeError, ValueError):
+                raise ValueError(f"{field}: not a number: {val!r}")
+        elif field in DATE_FIELDS:
+            out[field] = parse_date(str(val))
+            if out[field] is None:
+                raise ValueError(f"{field}: invalid date {val!r} (use DD-MM-YYYY or YYYY-MM-DD)")
+        else:
+            out[field] = val
+    if "asset_code" in out and not out["asset_code"]:
+        raise ValueError("asset_code cannot be empty")
+    return out
+
+
+def parse_edits(body):
+    """Read `{"edits": [...]}` from a request body. Raises ValueError."""
+    edits = (body or {}).get("edits")
+    if not isinstance(edits, list) or not edits:
+        raise ValueError("edits must be a non-empty list")
+    if len(edits) > MAX_EDITS:
+        raise ValueError(f"At most {MAX_EDITS} edits per request")
+    return edits
+
+
+def single_edit(body):
+    """(changes, version) from an `update_asset/<id>` body.
+
+    New pages send {"changes": {...}, "version": ...}; older ones post the
+    whole row, which is applied without a version check.
+    """
+    body = body or {}
+    if "changes" in body:
+        return body.get("changes"), body.get("version")
+    return {k: v for k, v in body.items() if k in ASSET_EDIT_FIELDS}, None
+
+
+def _same_version(a, b):
+    """Compare two timestamp strings as instants (formats differ between client and DB)."""
+    try:
+        return datetime.fromisoformat(str(a).replace("Z", "+00:00")) == \
+            datetime.fromisoformat(str(b).replace("Z", "+00:00"))
+    except ValueError:
+        return str(a) == str(b)
+
+
+def apply_edit(supabase_admin, asset_id, changes, version=None, actor=None):
+    """Apply one edit. Returns the per-edit result dict (never raises for bad input)."""
+    try:
+        patch = clean_changes(changes)
+    except ValueError as e:
+        return {"id": asset_id, "ok": False, "error": str(e)}
+
+    patch["last_updated_by"] = actor
+    patch["last_updated_at"] = datetime.now(IST).isoformat()
+
+    def write(expected):
+        q = supabase_admin.table("asset_master").update(patch).eq("id", asset_id)
+        if expected:
+            q = q.eq("last_updated_at", expected)
+        return q.execute().data
+
+    try:
+        rows = write(version)
+        if rows:
+            return {"id": asset_id, "ok": True, "row": rows[0]}
+
+        current = supabase_admin.table("asset_master").select("*").eq("id", asset_id).limit(1).execute().data
+        if not current:
+            return {"id": asset_id, "ok": False, "error": "Asset not found"}
+        stored = current[0].get("last_updated_at")
+        if version and _same_version(stored, version) and stored != version:
+            # same instant, different spelling (e.g. "Z" vs "+05:30"): retry with the stored value
+            rows = write(stored)
+            if rows:
+                return {"id": asset_id, "ok": True, "row": rows[0]}
+    except Exception as e:
+        return {"id": asset_id, "ok": False, "error": str(e)}
+    if version:
+        return {"id": asset_id, "ok": False, "conflict": True, "row": current[0],
+                "error": f"Changed by {current[0].get('last_updated_by') or 'another user'} since you loaded it"}
+    return {"id": asset_id, "ok": False, "error": "Update was not applied"}
+
+
+def apply_edits(supabase_admin, edits, actor=None):
+    """Apply a batch of edits. Returns (per-edit results, updated rows)."""
+    results, rows = [], []
+    for edit in edits:
+        if not isinstance(edit, dict) or edit.get("id") in (None, ""):
+            results.append({"id": None, "ok": False, "error": "each edit needs an id"})
+            continue
+        r = apply_edit(supabase_admin, edit["id"], edit.get("changes"), edit.get("version"), actor)
+        results.append(r)
+        if r["ok"]:
+            rows.append(r["row"])
+    return results, rows
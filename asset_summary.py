@@ -0,0 +1,150 @@
+# asset_summary.py
+"""Fleet summary rollups for the asset master dashboard.
+
+For every dimension (package, owner, activity, asset_category, location)
+the summary keeps one rollup per value:
+
+    {"value": "Adabari", "count": 120, "own": 80, "hire": 35, "nc": 5,
+     "ehc": 1250000.0, "ihc": 830000.0}
+
+plus fleet-wide totals. Values group case-insensitively (first spelling
+wins for display), so a new package shows up without code changes.
+
+Rollups are maintained incrementally: every asset contributes once, and an
+update subtracts its old contribution before adding the new one. Writes
+made through this process are applied directly (`apply` / `remove`);
+changes from other workers arrive through the asset delta feed
+(delta_sync, checked at most every `check_interval` seconds). A full
+rebuild only happens on first use or when the feed asks for one.
+"""
+import threading
+import time
+
+DIMENSIONS = ("package", "owner", "activity", "asset_category", "location")
+OWNER_KINDS = ("own", "hire", "nc")
+SUMMARY_COLUMNS = ("id", "ehc", "ihc", "last_updated_at") + DIMENSIONS
+SUMMARY_FIELDS = ", ".join(SUMMARY_COLUMNS)
+
+
+def _num(val):
+    try:
+        return float(val) if val not in (None, "") else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _blank():
+    return {"count": 0, "own": 0, "hire": 0, "nc": 0, "ehc": 0.0, "ihc": 0.0}
+
+
+class AssetSummary:
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._reset()
+        self.cursor = None
+        self._last_check = 0.0
+
+    def _reset(self):
+        self._assets = {}                            # id -> (contribution, summary columns)
+        self._totals = _blank()
+        self._groups = {d: {} for d in DIMENSIONS}   # dim -> key -> rollup
+        self._labels = {d: {} for d in DIMENSIONS}   # dim -> key -> display value
+        self._latest = None
+
+    # ---------- incremental maintenance ----------
+    @staticmethod
+    def _contribution(row):
+        owner = str(row.get("owner") or "").strip().lower()
+        dims = tuple(str(row.get(d) or "").strip() for d in DIMENSIONS)
+        return dims, owner if owner in OWNER_KINDS else None, _num(row.get("ehc")), _num(row.get("ihc"))
+
+    def _add(self, contrib, sign):
+        dims, owner, ehc, ihc = contrib
+        targets = [self._totals]
+        for dim, value in zip(DIMENSIONS, dims):
+            key = value.lower()
+            groups = self._groups[dim]
+            if key not in groups:
+                groups[key] = _blank()
+                self._labels[dim][key] = value
+            targets.append(groups[key])
+        for t in targets:
+            t["count"] += sign
+            if owner:
+                t[owner] += sign
+            t["ehc"] += sign * ehc
+            t["ihc"] += sign * ihc
+        if sign < 0:
+            for dim, value in zip(DIMENSIONS, dims):
+                key = value.lower()
+                if self._groups[dim][key]["count"] <= 0:
+                    del self._groups[dim][key]
+                    del self._labels[dim][key]
+
+    def apply(self, row):
+        """Add or replace one asset (row needs `id`; missing columns keep their old value)."""
+        if row.get("id") is None:
+            return
+        key = str(row["id"])
+        with self._lock:
+            old = self._assets.pop(key, None)
+            if old is not None:
+                self._add(old[0], -1)
+                row = dict(old[1], **{k: v for k, v in row.items() if k in SUMMARY_COLUMNS})
+            contrib = self._contribution(row)
+            self._add(contrib, +1)
+            self._assets[key] = (contrib, {k: row.get(k) for k in SUMMARY_COLUMNS})
+            stamp = row.get("last_updated_at")
+            if stamp and (self._latest is None or str(stamp) > str(self._latest)):
+                self._latest = stamp
+
+    def remove(self, asset_id):
+        with self._lock:
+            old = self._assets.pop(str(asset_id), None)
+            if old is not None:
+                self._add(old[0], -1)
+
+    def build(self, rows, cursor=None):
+        with self._lock:
+            self._reset()
+            for r in rows:
+                self.apply(r)
+            self.cursor = cursor
+
+    # ---------- freshness against Supabase ----------
+    def ensure_fresh(self, supabase_admin, force=False):
+        from delta_sync import fetch_delta, new_cursor
+
+        now = time.time()
+        with self._lock:
+            if not force and self.cursor and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            if not force and self.cursor:
+                rows, deleted, full, cursor = fetch_delta(supabase_admin, "asset_master", self.cursor, select=SUMMARY_FIELDS)
+                if not full:
+                    for r in rows:
+                        self.apply(r)
+                    for i in deleted:
+                        self.remove(i)
+                    self.cursor = cursor
+                    return
+            cursor = new_cursor()
+            res = supabase_admin.table("asset_master").select(SUMMARY_FIELDS).execute()
+            self.build(res.data or [], cursor=cursor)
+
+    # ---------- read ----------
+    def snapshot(self, dimensions=DIMENSIONS):
+        with self._lock:
+            by = {}
+            for dim in dimensions:
+                labels = self._labels[dim]
+                by[dim] = sorted(
+                    (dict(g, value=labels[key], ehc=round(g["ehc"], 2), ihc=round(g["ihc"], 2))
+                     for key, g in self._groups[dim].items()),
+                    key=lambda g: (g["value"] == "", g["value"].lower()),
+                )
+            totals = dict(self._totals, ehc=round(self._totals["ehc"], 2), ihc=round(self._totals["ihc"], 2))
+            totals["last_updated_at"] = self._latest
+            return {"totals": totals, "by": by}
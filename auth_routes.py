@@ -47,6 +47,27 @@ def _get_user_meta_field(user, field, default=None):
     except Exception:
         return default
 
+# --- ✅ Preferred sidebar order ---
+ORDERED_PAGES = [
+    'user_dashboard',
+    'user_asset_master',
+    'user_daywise_fuel_consumption',
+    'user_breakdown_report',
+    'user_spares_requirements',
+    'user_maintenance_schedule',
+    'user_concrete_production',
+    'user_hire_billing_status',
+    'user_workmen_status',
+    'user_solar_report',
+    'user_digital_status',
+    'user_uauc_status',
+    'user_asset_documents_status',
+    'user_asset_green_card_status',
+    'user_daywise_works',
+    'user_profile'
+]
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     supabase = current_app.config['supabase']
@@ -59,12 +80,12 @@ def login():
 
         try:
             # ✅ Step 1: Resolve phone → email if needed
+            directory = current_app.config['USER_DIRECTORY']
             if re.match(r'^\d{10,15}$', identifier):
                 print(">>> Login attempt with phone:", identifier)
-                result = supabase_admin.table("users_meta").select("email").eq("phone", identifier).execute()
-                if not result.data:
+                email = directory.email_for_phone(supabase_admin, identifier)
+                if not email:
                     return render_template('login.html', error="Phone not registered")
-                email = result.data[0]["email"]
             else:
                 email = identifier  # treat as email
 
@@ -111,43 +132,23 @@ def login():
             session['role'] = _get_user_meta_field(user, 'role', 'user')
             print(f"+++ login ok: user={session.get('user')} role={session.get('role')}")
 
-            # ✅ Step 4: Fetch name & permissions from users_meta
-            meta = supabase_admin.table("users_meta") \
+            # ✅ Step 4: Name & permissions, read fresh so changes from any worker apply
+            res = supabase_admin.table("users_meta") \
                 .select("full_name, accesses, feature_accesses") \
                 .eq("email", email) \
-                .single() \
+                .limit(1) \
                 .execute()
-            print("+++ users_meta query result:", getattr(meta, 'data', None))
-
-            if meta.data:
-                session['name'] = meta.data.get("full_name") or _get_user_meta_field(user, 'full_name', email)
-
-                # --- Original user accesses fetched from Supabase ---
-                user_accesses = meta.data.get("accesses", [])
-                session['feature_accesses'] = meta.data.get("feature_accesses", {})
-
-                # --- ✅ Define your preferred sidebar order here ---
-                ordered_pages = [
-                    'user_dashboard',
-                    'user_asset_master',
-                    'user_daywise_fuel_consumption',
-                    'user_breakdown_report',
-                    'user_spares_requirements',
-                    'user_maintenance_schedule',
-                    'user_concrete_production',
-                    'user_hire_billing_status',
-                    'user_workmen_status',
-                    'user_solar_report',
-                    'user_digital_status',
-                    'user_uauc_status',
-                    'user_asset_documents_status',
-                    'user_asset_green_card_status',
-                    'user_daywise_works',
-                    'user_profile'
-                ]
+            meta = res.data[0] if res.data else None
+
+            if meta:
+                session['name'] = meta.get("full_name") or _get_user_meta_field(user, 'full_name', email)
+
+                # --- User accesses from users_meta ---
+                user_accesses = meta.get("accesses") or []
+                session['feature_accesses'] = meta.get("feature_accesses") or {}
 
                 # --- ✅ Reorder the accesses based on preferred order ---
-                session['accesses'] = [p for p in ordered_pages if p in user_accesses]
+                session['accesses'] = [p for p in ORDERED_PAGES if p in user_accesses]
 
                 print("🧭 Ordered session accesses:", session['accesses'])
             else:
@@ -155,20 +156,7 @@ def login():
                 session['accesses'] = []
                 session['feature_accesses'] = {}
 
-            # ✅ Cache dropdown_config at login to avoid repeated Supabase calls on page load
-            try:
-                supabase_admin_cfg = supabase_admin
-                if supabase_admin_cfg:
-                    # reuse user_routes logic: fetch, group and store
-                    dc_res = supabase_admin_cfg.table("dropdown_config").select("*").execute()
-                    dc_data = sorted(dc_res.data or [], key=lambda x: (x.get("list_name", ""), x.get("value", "")))
-                    dc_grouped = {}
-                    for row in dc_data:
-                        name = row.get("list_name") or "default"
-                        dc_grouped.setdefault(name, []).append(row.get("value"))
-                    session['dropdown_config'] = dc_grouped
-            except Exception as e:
-                current_app.logger.warning("Could not pre-cache dropdown_config at login: %s", e)
+            # dropdown_config is served from the shared DROPDOWN_CACHE, not copied per login
 
             # ✅ Step 5: Admin override (see everything)
             if session['role'] == 'admin':
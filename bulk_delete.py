@@ -0,0 +1,205 @@
+# bulk_delete.py
+"""Bulk deletes for assets and users, run as background jobs.
+
+A delete request is split into chunks of `chunk_size` IDs; up to
+`parallelism` chunks are deleted at once, each with one
+`delete().in_(key, chunk)` statement. Deleting users also removes their
+Supabase Auth accounts (users_meta.auth_id) through the admin API, on a
+separate small pool so auth calls overlap with the table deletes.
+
+Every ID gets its own result, like spares_bulk:
+
+    {"id": "EMP01", "ok": False, "error": "not found"}
+
+Jobs are recorded as JSON files (BULK_JOB_DIR) the same way export jobs
+are, so any worker can answer a progress poll:
+
+    {"id": ..., "kind": "users", "status": "running", "total": 900,
+     "done": 400, "failed": 2, "progress": 0.444, "failures": [...]}
+
+Kinds are registered in DELETE_KINDS; `after(deleted_ids, rows)` runs once
+the table deletes finish (tombstones, cache/index maintenance).
+"""
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from export_jobs import STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, JobStore
+
+BULK_MAX_IDS = 20000
+MAX_REPORTED_FAILURES = 500
+
+
+# ==========================================================
+# ✅ 1. DELETE KINDS
+# ==========================================================
+def _int_ids(raw):
+    return [int(i) for i in raw]
+
+
+def _str_ids(raw):
+    if not all(isinstance(i, str) for i in raw):
+        raise TypeError("ids must be strings")
+    return [i.strip() for i in raw if i.strip()]
+
+
+DELETE_KINDS = {
+    "assets": {"table": "asset_master", "key": "id", "coerce": _int_ids, "auth_column": None,
+               "id_error": "ids must be integers"},
+    "users": {"table": "users_meta", "key": "user_id", "coerce": _str_ids, "auth_column": "auth_id",
+              "id_error": "ids must be user_id strings"},
+}
+
+
+def parse_ids(kind, raw):
+    """Validate the `ids` list from a request body. Raises ValueError."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("ids must be a non-empty list")
+    if len(raw) > BULK_MAX_IDS:
+        raise ValueError(f"At most {BULK_MAX_IDS} ids per request")
+    spec = DELETE_KINDS[kind]
+    try:
+        ids = spec["coerce"](raw)
+    except (TypeError, ValueError):
+        raise ValueError(spec["id_error"])
+    if not ids:
+        raise ValueError(spec["id_error"])
+    return list(dict.fromkeys(ids))  # de-dupe, keep order
+
+
+# ==========================================================
+# ✅ 2. ENGINE
+# ==========================================================
+class BulkDeleter:
+    """Bounded parallel chunked deletes + job records for progress polling."""
+
+    def __init__(self, job_dir, chunk_size=200, parallelism=4, auth_workers=8, max_jobs=2,
+                 job_ttl=24 * 3600):
+        self.store = JobStore(job_dir, ttl=job_ttl)
+        self.chunk_size = chunk_size
+        self._jobs = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="bulk-job")
+        self._chunks = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="bulk-delete")
+        self._auth = ThreadPoolExecutor(max_workers=auth_workers, thread_name_prefix="bulk-auth")
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    # ---------- public API ----------
+    def submit(self, kind, supabase_admin, ids, requested_by=None, after=None):
+        """Queue a delete job and return its record (status "queued")."""
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": STATUS_QUEUED,
+            "total": len(ids),
+            "done": 0,
+            "failed": 0,
+            "progress": 0.0,
+            "failures": [],
+            "error": None,
+            "requested_by": requested_by,
+            "created_at": time.time(),
+        }
+        self.store.save(job)
+        self.store.prune()
+        self._jobs.submit(self._run_job, dict(job), supabase_admin, ids, after)
+        return job
+
+    def run(self, kind, supabase_admin, ids, progress=None):
+        """Delete `ids` now. Returns (per-id results, deleted rows)."""
+        spec = DELETE_KINDS[kind]
+        key = spec["key"]
+        chunks = [ids[i:i + self.chunk_size] for i in range(0, len(ids), self.chunk_size)]
+        results, rows = {}, []
+        auth_jobs = []
+        lock = threading.Lock()
+
+        def delete_chunk(chunk):
+            q = supabase_admin.table(spec["table"]).delete().in_(key, chunk)
+            return (q.execute().data or [])
+
+        def finish_chunk(chunk, done, error):
+            with lock:
+                if error is not None:
+                    for i in chunk:
+                        results[i] = {"id": i, "ok": False, "error": error}
+                else:
+                    rows.extend(done)
+                    hit = {r.get(key) for r in done}
+                    for i in chunk:
+                        results[i] = {"id": i, "ok": True} if i in hit else {"id": i, "ok": False, "error": "not found"}
+                    if spec["auth_column"]:
+                        for r in done:
+                            if r.get(spec["auth_column"]):
+                                auth_jobs.append((r[key], self._auth.submit(
+                                    supabase_admin.auth.admin.delete_user, r[spec["auth_column"]])))
+                if progress:
+                    progress(len(results), len(ids))
+
+        futures = [(chunk, self._chunks.submit(delete_chunk, chunk)) for chunk in chunks]
+        for chunk, fut in futures:
+            try:
+                finish_chunk(chunk, fut.result(), None)
+            except Exception as e:
+                finish_chunk(chunk, None, str(e))
+
+        # the row is gone either way; report auth failures so they can be cleaned up by hand
+        for row_id, fut in auth_jobs:
+            try:
+                fut.result()
+            except Exception as e:
+                results[row_id] = {"id": row_id, "ok": True, "warning": f"auth user not removed: {e}"}
+        return [results[i] for i in ids], rows
+
+    def _run_job(self, job, supabase_admin, ids, after):
+        job["status"] = STATUS_RUNNING
+        self.store.save(job)
+        last_saved = [0.0]
+
+        def progress(done, total):
+            job["done"] = done
+            job["progress"] = round(done / total, 3) if total else 1.0
+            now = time.time()
+            if now - last_saved[0] >= 0.5:
+                last_saved[0] = now
+                self.store.save(job)
+
+        try:
+            results, rows = self.run(job["kind"], supabase_admin, ids, progress)
+            failures = [r for r in results if not r["ok"] or r.get("warning")]
+            job["done"] = sum(1 for r in results if r["ok"])
+            job["failed"] = len(results) - job["done"]
+            job["failures"] = failures[:MAX_REPORTED_FAILURES]
+            if after:
+                deleted = [r["id"] for r in results if r["ok"]]
+                if deleted:
+                    after(deleted, rows)
+            job["status"] = STATUS_DONE
+            job["progress"] = 1.0
+        except Exception as e:
+            print("❌ bulk delete job failed:", job["id"], e, traceback.format_exc())
+            job["status"] = STATUS_FAILED
+            job["error"] = str(e)
+        self.store.save(job)
+
+
+def create_bulk_deleter():
+    """Build the engine from env (BULK_JOB_DIR, BULK_DELETE_CHUNK, BULK_DELETE_PARALLELISM, BULK_AUTH_WORKERS)."""
+    job_dir = os.getenv("BULK_JOB_DIR") or os.path.join(tempfile.gettempdir(), "pnm_bulk_jobs")
+    try:
+        chunk = max(int(os.getenv("BULK_DELETE_CHUNK", "200")), 1)
+    except Exception:
+        chunk = 200
+    try:
+        parallelism = max(int(os.getenv("BULK_DELETE_PARALLELISM", "4")), 1)
+    except Exception:
+        parallelism = 4
+    try:
+        auth_workers = max(int(os.getenv("BULK_AUTH_WORKERS", "8")), 1)
+    except Exception:
+        auth_workers = 8
+    return BulkDeleter(job_dir, chunk_size=chunk, parallelism=parallelism, auth_workers=auth_workers)
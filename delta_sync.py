@@ -0,0 +1,99 @@
+# delta_sync.py
+"""Delta sync for list endpoints (`?since=<cursor>`).
+
+Used by `/get_spares` and `/get_assets`. A cursor is an opaque UTC
+timestamp. A delta returns:
+  - rows whose change columns (created_at / last_updated_at) are after the
+    cursor (every write stamps last_updated_at)
+  - tombstones: ids deleted after the cursor, read from a tombstone table
+  - a new cursor to use next time
+
+Deletes are hard deletes, so they are recorded in small tombstone tables
+(spares_tombstones, asset_tombstones). migrations/003_delta_sync_tombstones.sql
+creates them, plus delete triggers that fill them for deletes made outside
+the app; the app also records its own deletes (`record_tombstones`).
+
+If a tombstone table is missing the delta answers `full: true` and the
+client reloads everything, so deletes are never silently missed. Cursors
+are moved back by CURSOR_OVERLAP to absorb clock skew between app servers;
+rows may therefore repeat across deltas, which is harmless because the
+client patches by id.
+"""
+import base64
+from datetime import datetime, timedelta, timezone
+
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+# table -> (tombstone table, tombstone id column, columns that mark a change)
+SYNC_TABLES = {
+    "spares_requirements": ("spares_tombstones", "spare_id", ("created_at", "last_updated_at")),
+    "asset_master": ("asset_tombstones", "asset_id", ("last_updated_at",)),
+}
+
+
+def new_cursor(now=None):
+    """Cursor for 'everything up to now' (taken BEFORE reading rows)."""
+    now = now or datetime.now(timezone.utc)
+    stamp = (now - CURSOR_OVERLAP).isoformat(timespec="seconds")
+    return base64.urlsafe_b64encode(stamp.encode("utf-8")).decode("ascii")
+
+
+def parse_cursor(cursor):
+    """Return the ISO timestamp inside a cursor, or raise ValueError."""
+    try:
+        stamp = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        datetime.fromisoformat(stamp)
+        return stamp
+    except Exception:
+        raise ValueError("Invalid sync cursor")
+
+
+def fetch_delta(supabase_admin, table, cursor, select="*"):
+    """
+    Returns (rows, deleted_ids, full_reload_needed, next_cursor).
+    """
+    tomb_table, tomb_id, change_columns = SYNC_TABLES[table]
+    since = parse_cursor(cursor)
+    next_cursor = new_cursor()
+
+    q = supabase_admin.table(table).select(select)
+    if len(change_columns) == 1:
+        q = q.gt(change_columns[0], since)
+    else:
+        q = q.or_(",".join(f"{col}.gt.{since}" for col in change_columns))
+    rows = q.order(change_columns[0], desc=True).execute().data or []
+
+    try:
+        tomb = supabase_admin.table(tomb_table) \
+            .select(tomb_id) \
+            .gt("deleted_at", since) \
+            .execute()
+        deleted = [t.get(tomb_id) for t in tomb.data or []]
+    except Exception as e:
+        print(f"⚠️ {tomb_table} unavailable, asking client for a full reload:", e)
+        return [], [], True, next_cursor
+
+    return rows, deleted, False, next_cursor
+
+
+def record_tombstones(supabase_admin, table, ids):
+    """Remember deleted ids of `table` for delta clients (best effort)."""
+    tomb_table, tomb_id, _ = SYNC_TABLES[table]
+    ids = [i for i in ids or [] if i is not None]
+    if not ids:
+        return
+    try:
+        now = datetime.now(timezone.utc).isoformat()
+        supabase_admin.table(tomb_table) \
+            .upsert([{tomb_id: i, "deleted_at": now} for i in ids], on_conflict=tomb_id, returning="minimal") \
+            .execute()
+    except Exception as e:
+        print(f"⚠️ could not record {tomb_table} {ids}:", e)
+
+
+def fetch_spares_delta(supabase_admin, cursor):
+    return fetch_delta(supabase_admin, "spares_requirements", cursor)
+
+
+def record_spares_tombstones(supabase_admin, ids):
+    record_tombstones(supabase_admin, "spares_requirements", ids)
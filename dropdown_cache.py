@@ -0,0 +1,62 @@
+# dropdown_cache.py
+"""Shared, versioned cache of dropdown_config.
+
+Every page (and previously every login) fetched and sorted the whole
+dropdown_config table, and the user copy was frozen into the session
+cookie. Instead the table is held once per process:
+
+  - reloaded at most every `ttl` seconds (single-flight)
+  - `version` is a hash of the content; the dropdown endpoints send it as an
+    ETag, so the pages' 30 s change poll is answered with 304 Not Modified
+  - `invalidate()` is called by admin dropdown writes in this process
+"""
+import hashlib
+import json
+import threading
+import time
+
+
+class DropdownCache:
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows = []
+        self._version = None
+        self._loaded_at = 0.0
+        self._grouped = None
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def ensure_fresh(self, supabase_admin, force=False):
+        with self._lock:
+            if not force and self._version and time.time() - self._loaded_at < self.ttl:
+                return self._version
+            res = supabase_admin.table("dropdown_config").select("*").execute()
+            rows = sorted(res.data or [], key=lambda x: (x.get("list_name") or "", x.get("value") or ""))
+            version = hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+            if version != self._version:
+                self._rows, self._version, self._grouped = rows, version, None
+            self._loaded_at = time.time()
+            return self._version
+
+    def grouped(self, supabase_admin, force=False):
+        """(version, {list_name: [value, ...]}) — the shape user pages use."""
+        self.ensure_fresh(supabase_admin, force)
+        with self._lock:
+            if self._grouped is None:
+                grouped = {}
+                for row in self._rows:
+                    grouped.setdefault(row.get("list_name") or "default", []).append(row.get("value"))
+                self._grouped = grouped
+            return self._version, self._grouped
+
+    def grouped_with_ids(self, supabase_admin, force=False):
+        """(version, {list_name: [{"value", "id"}, ...]}) — the admin editor shape."""
+        self.ensure_fresh(supabase_admin, force)
+        with self._lock:
+            grouped = {}
+            for row in self._rows:
+                grouped.setdefault(row.get("list_name"), []).append({"value": row.get("value"), "id": row.get("id")})
+            return self._version, grouped
@@ -0,0 +1,267 @@
+# export_jobs.py
+"""Background export jobs.
+
+Exports run on a small bounded thread pool instead of inside the request
+worker. Each job is recorded as a JSON file next to its artifact in the
+export directory, so any gunicorn worker can answer a status poll or serve
+the finished file (with sendfile) regardless of which worker ran it.
+
+Job ids are derived from (kind, params, data version): asking for the same
+export again while the underlying table is unchanged returns the existing
+job/artifact instead of running it twice.
+
+Routes register their exports with `@export_kind(...)`; `export_routes.py`
+exposes start / poll / download endpoints. The queue itself lives in
+`app.config['EXPORT_JOBS']`.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+# ==========================================================
+# ✅ 1. EXPORT KIND REGISTRY
+# ==========================================================
+EXPORT_KINDS = {}
+
+
+def export_kind(name, role, filename, mimetype, version=None):
+    """
+    Register an export runner.
+      runner(supabase_admin, fileobj, progress)  -> writes the artifact (binary file object)
+      version(supabase_admin) -> str             -> cheap data-version probe used for dedup
+    `role` is the session role allowed to start it ('admin' / 'user').
+    """
+    def decorator(fn):
+        EXPORT_KINDS[name] = {
+            "name": name,
+            "role": role,
+            "filename": filename,
+            "mimetype": mimetype,
+            "runner": fn,
+            "version": version,
+        }
+        return fn
+    return decorator
+
+
+def table_version(supabase_admin, table, stamp_column):
+    """Return '<row count>:<latest stamp>' for a table in one round trip.
+
+    Inserts/deletes change the count, edits bump the stamp column.
+    """
+    res = supabase_admin.table(table) \
+        .select(stamp_column, count="exact") \
+        .order(stamp_column, desc=True, nullsfirst=False) \
+        .limit(1) \
+        .execute()
+    count = res.count if getattr(res, "count", None) is not None else len(res.data or [])
+    latest = (res.data or [{}])[0].get(stamp_column)
+    return f"{count}:{latest}"
+
+
+def track_progress(rows, total, progress, every=500):
+    """Yield `rows` unchanged, reporting progress every `every` rows."""
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % every == 0:
+            progress(done, total)
+    progress(done, total)
+
+
+def write_csv(fileobj, header, rows):
+    """Write a UTF-8 CSV into a binary file object."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+
+# ==========================================================
+# ✅ 2. JOB RECORDS (shared by other background jobs)
+# ==========================================================
+class JobStore:
+    """JSON job records in a directory, readable from any worker process."""
+
+    def __init__(self, job_dir, ttl=24 * 3600, prune_interval=600):
+        self.job_dir = job_dir
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        os.makedirs(job_dir, mode=0o700, exist_ok=True)
+
+    def path(self, job_id, suffix=".json"):
+        return os.path.join(self.job_dir, f"{job_id}{suffix}")
+
+    def get(self, job_id):
+        # records also expire while nobody submits new jobs
+        if time.time() - self._last_prune >= self.prune_interval:
+            self.prune()
+        if not job_id or not job_id.isalnum():
+            return None
+        try:
+            with open(self.path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, job):
+        job["updated_at"] = time.time()
+        fd, tmp = tempfile.mkstemp(dir=self.job_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp, self.path(job["id"]))
+
+    def prune(self):
+        """Drop records older than the TTL."""
+        self._last_prune = time.time()
+        cutoff = self._last_prune - self.ttl
+        try:
+            names = os.listdir(self.job_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.job_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+# ==========================================================
+# ✅ 3. JOB QUEUE
+# ==========================================================
+class ExportJobQueue:
+    """Bounded pool + on-disk job table for export artifacts."""
+
+    def __init__(self, artifact_dir, max_workers=2, artifact_ttl=24 * 3600, stale_after=15 * 60):
+        self.artifact_dir = artifact_dir
+        self.artifact_ttl = artifact_ttl
+        self.stale_after = stale_after
+        # job records and artifacts share one directory and one TTL
+        self.store = JobStore(artifact_dir, ttl=artifact_ttl)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+
+    # ---------- job table ----------
+    def artifact_path(self, job_id):
+        return self.store.path(job_id, ".bin")
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _save(self, job):
+        self.store.save(job)
+
+    def _is_reusable(self, job):
+        if not job:
+            return False
+        if job["status"] == STATUS_DONE:
+            return os.path.exists(self.artifact_path(job["id"]))
+        if job["status"] in (STATUS_QUEUED, STATUS_RUNNING):
+            # a job whose worker died stops updating its record; rerun it
+            return time.time() - job.get("updated_at", 0) < self.stale_after
+        return False
+
+    # ---------- public API ----------
+    @staticmethod
+    def job_id_for(kind, params, version):
+        key = json.dumps([kind, params or {}, version], sort_keys=True, default=str)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+
+    def submit(self, kind, supabase_admin, params=None, requested_by=None):
+        """Start an export (or return the identical one already queued/done)."""
+        spec = EXPORT_KINDS[kind]
+        version = spec["version"](supabase_admin) if spec["version"] else str(time.time())
+        job_id = self.job_id_for(kind, params, version)
+
+        with self._lock:
+            existing = self.get(job_id)
+            if self._is_reusable(existing):
+                return existing
+
+            job = {
+                "id": job_id,
+                "kind": kind,
+                "params": params or {},
+                "data_version": version,
+                "status": STATUS_QUEUED,
+                "progress": 0.0,
+                "rows": 0,
+                "error": None,
+                "filename": spec["filename"],
+                "requested_by": requested_by,
+                "created_at": time.time(),
+            }
+            self._save(job)
+
+        self.prune()
+        self._pool.submit(self._run, dict(job), spec, supabase_admin)
+        return job
+
+    def _run(self, job, spec, supabase_admin):
+        job["status"] = STATUS_RUNNING
+        self._save(job)
+        last_saved = [0.0]
+
+        def progress(done, total=None):
+            job["rows"] = done
+            if total:
+                job["progress"] = round(min(done / total, 1.0), 3)
+            now = time.time()
+            if now - last_saved[0] >= 0.5:
+                last_saved[0] = now
+                self._save(job)
+
+        final_path = self.artifact_path(job["id"])
+        fd, tmp = tempfile.mkstemp(dir=self.artifact_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                spec["runner"](supabase_admin, f, progress)
+            os.replace(tmp, final_path)
+            job["status"] = STATUS_DONE
+            job["progress"] = 1.0
+        except Exception as e:
+            print("❌ export job failed:", job["id"], e, traceback.format_exc())
+            job["status"] = STATUS_FAILED
+            job["error"] = str(e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        self._save(job)
+
+    def prune(self):
+        """Drop artifacts and job records older than the TTL."""
+        self.store.prune()
+
+
+def create_export_queue():
+    """Build the queue from env (EXPORT_DIR, EXPORT_WORKERS, EXPORT_TTL_SECONDS)."""
+    artifact_dir = os.getenv("EXPORT_DIR") or os.path.join(tempfile.gettempdir(), "pnm_exports")
+    try:
+        workers = int(os.getenv("EXPORT_WORKERS", "2"))
+    except Exception:
+        workers = 2
+    try:
+        ttl = int(os.getenv("EXPORT_TTL_SECONDS", str(24 * 3600)))
+    except Exception:
+        ttl = 24 * 3600
+    return ExportJobQueue(artifact_dir, max_workers=max(workers, 1), artifact_ttl=ttl)
@@ -0,0 +1,68 @@
+# export_routes.py
+from flask import Blueprint, current_app, jsonify, request, send_file, session
+from services import require_role
+from export_jobs import EXPORT_KINDS, STATUS_DONE
+
+export_bp = Blueprint("exports", __name__)
+
+
+def _job_view(job):
+    """Public shape of a job record (what the polling UI sees)."""
+    out = {k: job.get(k) for k in ("id", "kind", "status", "progress", "rows", "error", "filename")}
+    out["status_url"] = f"/exports/jobs/{job['id']}"
+    out["download_url"] = f"/exports/jobs/{job['id']}/download" if job.get("status") == STATUS_DONE else None
+    return out
+
+
+def _allowed(kind_spec):
+    return kind_spec.get("role") in (None, session.get("role"))
+
+
+# ---------------- START (or reuse) AN EXPORT ----------------
+@export_bp.route('/<kind>', methods=['POST'])
+@require_role()
+def start_export(kind):
+    spec = EXPORT_KINDS.get(kind)
+    if not spec:
+        return jsonify({"success": False, "error": f"Unknown export: {kind}"}), 404
+    if not _allowed(spec):
+        return jsonify({"success": False, "error": "Unauthorized"}), 403
+
+    queue = current_app.config['EXPORT_JOBS']
+    params = request.get_json(silent=True) or {}
+    try:
+        job = queue.submit(kind, current_app.config['supabase_admin'], params=params,
+                           requested_by=session.get("user"))
+        return jsonify({"success": True, "job": _job_view(job)}), 202
+    except Exception as e:
+        current_app.logger.error("start_export %s error: %s", kind, e, exc_info=True)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# ---------------- POLL ----------------
+@export_bp.route('/jobs/<job_id>')
+@require_role()
+def export_status(job_id):
+    job = current_app.config['EXPORT_JOBS'].get(job_id)
+    if not job or not _allowed(EXPORT_KINDS.get(job.get("kind"), {})):
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, "job": _job_view(job)}), 200
+
+
+# ---------------- DOWNLOAD ----------------
+@export_bp.route('/jobs/<job_id>/download')
+@require_role()
+def export_download(job_id):
+    queue = current_app.config['EXPORT_JOBS']
+    job = queue.get(job_id)
+    spec = EXPORT_KINDS.get(job.get("kind")) if job else None
+    if not job or not spec or not _allowed(spec):
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    if job.get("status") != STATUS_DONE:
+        return jsonify({"success": False, "error": "Export not ready", "job": _job_view(job)}), 409
+    try:
+        # send_file on a path lets the server use sendfile / X-Sendfile
+        return send_file(queue.artifact_path(job_id), mimetype=spec["mimetype"],
+                         as_attachment=True, download_name=job.get("filename") or spec["filename"])
+    except FileNotFoundError:
+        return jsonify({"success": False, "error": "Export expired, please run it again"}), 410
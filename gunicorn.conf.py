@@ -0,0 +1,63 @@
+# gunicorn.conf.py
+"""gunicorn settings, picked up automatically: `gunicorn wsgi:app`.
+
+Requests spend most of their time waiting on Supabase, so each worker runs
+a thread pool (gthread) instead of one request at a time. The in-process
+caches and background job pools live per worker; job state is kept on disk,
+so any worker can answer a status poll.
+
+Env overrides: PORT, WEB_CONCURRENCY (workers), GUNICORN_THREADS,
+GUNICORN_TIMEOUT, GUNICORN_LOG_LEVEL, METRICS_DIR.
+"""
+import glob
+import multiprocessing
+import os
+import tempfile
+
+
+def _int_env(name, default):
+    try:
+        return max(int(os.getenv(name, default)), 1)
+    except Exception:
+        return default
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# build the app once in the master (see wsgi.py); workers fork from it
+preload_app = True
+
+worker_class = "gthread"
+workers = _int_env("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4))
+threads = _int_env("GUNICORN_THREADS", 8)
+
+# exports, bulk jobs and CSV provisioning run in background threads, so no
+# request should need longer than this; max_requests stays off because
+# recycling a worker would abort the jobs it is running
+timeout = _int_env("GUNICORN_TIMEOUT", 120)
+graceful_timeout = 30
+keepalive = 5
+
+# worker heartbeat files on tmpfs: a slow container disk must not look like a hung worker
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+# workers share metrics snapshots here so /admin/metrics covers all of them (see metrics.py)
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "pnm_metrics"))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # a new deployment starts its metrics from zero
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def post_fork(server, worker):
+    server.log.info("worker %s ready (%s threads)", worker.pid, threads)
@@ -0,0 +1,331 @@
+# metrics.py
+"""Request and Supabase query metrics, exposed in Prometheus text format.
+
+Recorded per Flask endpoint (see `init_app`):
+    pnm_http_request_duration_seconds   histogram {method, endpoint}
+    pnm_http_response_size_bytes        histogram {endpoint}
+    pnm_http_requests_total             counter   {method, endpoint, status}
+
+Recorded per Supabase call (clients wrapped in `InstrumentedClient`):
+    pnm_supabase_query_duration_seconds histogram {table, operation}
+    pnm_supabase_query_rows_total       counter   {table, operation}
+    pnm_supabase_query_errors_total     counter   {table, operation}
+
+Durations stop when the view returns, so a streamed response is timed up
+to its first byte. Endpoint labels are Flask endpoint names, never raw
+paths, so ids in URLs do not explode the label set.
+
+Each gunicorn worker keeps its own registry, starting empty after the fork
+(startup work done in the preloading master is not counted once per
+worker). When METRICS_DIR is set, each worker also writes its snapshot
+there every few seconds, and /admin/metrics merges the snapshots of all
+workers.
+"""
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_OPERATIONS = frozenset(("select", "insert", "update", "upsert", "delete"))
+
+
+# ==========================================================
+# ✅ 1. METRIC TYPES
+# ==========================================================
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.reset()
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(k): v for k, v in self._values.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, json.loads(key))} {_num(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def reset(self):
+        self._values = {}      # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            slot = self._values.get(labels)
+            if slot is None:
+                slot = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            slot[i] += 1
+            slot[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(k): list(v) for k, v in self._values.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def render(self, values):
+        for key, slot in sorted(values.items()):
+            label_values = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), slot[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _num(bound)
+                yield f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + [le])} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_num(slot[-1])}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}"
+
+
+def _labels(names, values):
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+# ==========================================================
+# ✅ 2. REGISTRY (per process, optionally merged across workers)
+# ==========================================================
+class Metrics:
+    def __init__(self, snapshot_dir=None, snapshot_interval=10.0):
+        self.http_duration = Histogram(
+            "pnm_http_request_duration_seconds", "Time spent in the view, by endpoint.",
+            ("method", "endpoint"), LATENCY_BUCKETS)
+        self.http_size = Histogram(
+            "pnm_http_response_size_bytes", "Response body size (when known), by endpoint.",
+            ("endpoint",), SIZE_BUCKETS)
+        self.http_requests = Counter(
+            "pnm_http_requests_total", "Requests by endpoint and status.",
+            ("method", "endpoint", "status"))
+        self.query_duration = Histogram(
+            "pnm_supabase_query_duration_seconds", "Supabase call latency, by table and operation.",
+            ("table", "operation"), LATENCY_BUCKETS)
+        self.query_rows = Counter(
+            "pnm_supabase_query_rows_total", "Rows returned by Supabase calls.",
+            ("table", "operation"))
+        self.query_errors = Counter(
+            "pnm_supabase_query_errors_total", "Supabase calls that raised.",
+            ("table", "operation"))
+        self.all = [self.http_duration, self.http_size, self.http_requests,
+                    self.query_duration, self.query_rows, self.query_errors]
+
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = snapshot_interval
+        self._last_write = 0.0
+        self._write_lock = threading.Lock()
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        for m in self.all:
+            m.reset()
+        self._last_write = 0.0
+        self._write_lock = threading.Lock()
+
+    # ---------- recording ----------
+    def observe_request(self, method, endpoint, status, seconds, size):
+        self.http_duration.observe((method, endpoint), seconds)
+        self.http_requests.inc((method, endpoint, str(status)))
+        if size is not None:
+            self.http_size.observe((endpoint,), size)
+        self.maybe_write_snapshot()
+
+    def observe_query(self, table, operation, seconds, rows=None, error=False):
+        self.query_duration.observe((table, operation), seconds)
+        if rows:
+            self.query_rows.inc((table, operation), rows)
+        if error:
+            self.query_errors.inc((table, operation))
+
+    # ---------- cross-worker snapshots ----------
+    def snapshot(self):
+        return {m.name: m.snapshot() for m in self.all}
+
+    def _snapshot_path(self):
+        return os.path.join(self.snapshot_dir, f"{os.getpid()}.json")
+
+    def maybe_write_snapshot(self, force=False):
+        """Write this worker's snapshot if `snapshot_interval` has passed (one writer at a time)."""
+        if not self.snapshot_dir:
+            return
+        with self._write_lock:
+            now = time.time()
+            if not force and now - self._last_write < self.snapshot_interval:
+                return
+            self._last_write = now
+            path = self._snapshot_path()
+            tmp = None
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.snapshot_dir, prefix=f".{os.getpid()}-", suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp, path)
+            except Exception as e:
+                print("⚠️ metrics snapshot not written:", e)
+                if tmp and os.path.exists(tmp):
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+
+    def merged(self):
+        """This process's values, plus every other worker's last snapshot when METRICS_DIR is set."""
+        if not self.snapshot_dir:
+            return self.snapshot()
+        self.maybe_write_snapshot(force=True)
+        merged = {m.name: {} for m in self.all}
+        by_name = {m.name: m for m in self.all}
+        for path in glob.glob(os.path.join(self.snapshot_dir, "*.json")):
+            try:
+                with open(path) as f:
+                    snap = json.load(f)
+            except Exception:
+                continue   # being replaced right now; picked up next scrape
+            for name, values in snap.items():
+                metric = by_name.get(name)
+                if metric is None:
+                    continue
+                target = merged[name]
+                for key, value in values.items():
+                    target[key] = metric.merge(target[key], value) if key in target else value
+        return merged
+
+    # ---------- exposition ----------
+    def render(self):
+        values = self.merged()
+        lines = []
+        for m in self.all:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render(values.get(m.name, {})))
+        return "\n".join(lines) + "\n"
+
+
+# ==========================================================
+# ✅ 3. SUPABASE CLIENT WRAPPER
+# ==========================================================
+class _QueryProxy:
+    """Wraps a postgrest request builder; times `execute()` and tags table/operation."""
+    __slots__ = ("_builder", "_table", "_operation", "_metrics")
+
+    def __init__(self, builder, table, operation, metrics):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if name == "execute":
+            return self._execute
+        if not callable(attr):
+            # e.g. `.not_`, a property returning a builder
+            return self._wrap(attr, self._operation)
+        operation = name if name in QUERY_OPERATIONS else self._operation
+
+        def call(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs), operation)
+        return call
+
+    def _wrap(self, value, operation):
+        if hasattr(value, "execute"):
+            return _QueryProxy(value, self._table, operation, self._metrics)
+        return value
+
+    def _execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            res = self._builder.execute(*args, **kwargs)
+        except Exception:
+            self._metrics.observe_query(self._table, self._operation, time.perf_counter() - start, error=True)
+            raise
+        data = getattr(res, "data", None)
+        rows = len(data) if isinstance(data, list) else (1 if data else 0)
+        self._metrics.observe_query(self._table, self._operation, time.perf_counter() - start, rows)
+        return res
+
+
+class InstrumentedClient:
+    """Drop-in wrapper for a supabase Client: table()/from_()/rpc() calls are timed, the rest passes through."""
+
+    def __init__(self, client, metrics):
+        self._client = client
+        self._metrics = metrics
+
+    def table(self, name):
+        return _QueryProxy(self._client.table(name), name, "select", self._metrics)
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, fn, *args, **kwargs):
+        return _QueryProxy(self._client.rpc(fn, *args, **kwargs), fn, "rpc", self._metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+# ==========================================================
+# ✅ 4. FLASK HOOKS
+# ==========================================================
+def init_app(app, metrics):
+    """Time every request; results go to `metrics` (app.config['METRICS'])."""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _metrics_record(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            size = None if response.is_streamed else response.content_length
+            metrics.observe_request(request.method, request.endpoint or "unmatched",
+                                    response.status_code, time.perf_counter() - start, size)
+        return response
+
+
+def create_metrics():
+    """Build from env (METRICS_DIR, METRICS_SNAPSHOT_SECONDS)."""
+    snapshot_dir = os.getenv("METRICS_DIR") or None
+    try:
+        interval = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "10"))
+    except Exception:
+        interval = 10.0
+    return Metrics(snapshot_dir=snapshot_dir, snapshot_interval=interval)
@@ -0,0 +1,14 @@
+-- 001_asset_master_asset_code_unique.sql
+-- Asset CSV import upserts on asset_code (asset_import.py), which needs a
+-- unique key on that column. Run once in the Supabase SQL editor.
+
+-- 1. find duplicates that would block the index; resolve them first
+select asset_code, count(*) as copies
+from asset_master
+where asset_code is not null
+group by asset_code
+having count(*) > 1;
+
+-- 2. the index itself
+create unique index if not exists asset_master_asset_code_key
+  on asset_master (asset_code);
@@ -0,0 +1,35 @@
+-- 002_spares_ref_block.sql
+-- Block sequence for spares ref numbers (ref_sequence.py, SPARES_REF_SOURCE
+-- "rpc", the default). Without it both create_spare routes answer 503.
+-- Run once in the Supabase SQL editor.
+
+-- 1. one nextval reserves a whole block: the increment must equal
+--    SPARES_REF_BLOCK_SIZE (default 20)
+create sequence if not exists spares_ref_seq start 1 increment by 20;
+
+-- 2. seed above the highest existing ref_no, only while the sequence is
+--    still unused (re-seeding later could hand out blocks workers hold)
+do $$
+begin
+  if not (select is_called from spares_ref_seq) then
+    perform setval('spares_ref_seq',
+      coalesce((select max(nullif(regexp_replace(ref_no, '\D', '', 'g'), '')::bigint)
+                from spares_requirements), 0) + 1,
+      false);
+  end if;
+end $$;
+
+-- 3. reserve a block: returns its first number
+create or replace function reserve_spares_ref_block()
+returns bigint language sql volatile as $$
+  select nextval('spares_ref_seq')
+$$;
+
+-- 4. first number of the next block, WITHOUT reserving it (the "next ref"
+--    preview in the spares forms)
+create or replace function peek_spares_ref_block()
+returns bigint language sql stable as $$
+  select case when s.is_called then s.last_value + p.seqincrement else s.last_value end
+  from spares_ref_seq s, pg_sequence p
+  where p.seqrelid = 'spares_ref_seq'::regclass
+$$;
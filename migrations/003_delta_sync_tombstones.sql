@@ -0,0 +1,61 @@
+-- 003_delta_sync_tombstones.sql
+-- Tombstones for delta sync (delta_sync.py: /get_spares?since=...,
+-- /get_assets?since=...). Deletes are hard deletes, so deleted ids are
+-- kept here for delta clients. Without these tables every delta answers
+-- `full: true` and clients reload everything. Run once in the Supabase
+-- SQL editor.
+
+-- 1. tombstone tables
+create table if not exists spares_tombstones (
+  spare_id   bigint primary key,
+  deleted_at timestamptz not null default now()
+);
+create table if not exists asset_tombstones (
+  asset_id   text primary key,    -- asset ids arrive as URL strings
+  deleted_at timestamptz not null default now()
+);
+create index if not exists spares_tombstones_deleted_at_idx on spares_tombstones (deleted_at);
+create index if not exists asset_tombstones_deleted_at_idx on asset_tombstones (deleted_at);
+
+-- only the service-role client (supabase_admin) reads or writes them
+alter table spares_tombstones enable row level security;
+alter table asset_tombstones enable row level security;
+
+-- 2. record every delete, also ones made outside the app. The app still
+--    upserts tombstones itself (record_tombstones); both write the same
+--    key, so a delete is recorded once either way. Statement-level
+--    triggers: a bulk delete of thousands of rows is one insert.
+create or replace function record_spares_tombstones()
+returns trigger language plpgsql as $$
+begin
+  insert into spares_tombstones (spare_id, deleted_at)
+  select id, now() from deleted_rows
+  on conflict (spare_id) do update set deleted_at = excluded.deleted_at;
+  return null;
+end $$;
+
+drop trigger if exists spares_requirements_tombstones on spares_requirements;
+create trigger spares_requirements_tombstones
+  after delete on spares_requirements
+  referencing old table as deleted_rows
+  for each statement execute function record_spares_tombstones();
+
+create or replace function record_asset_tombstones()
+returns trigger language plpgsql as $$
+begin
+  insert into asset_tombstones (asset_id, deleted_at)
+  select id::text, now() from deleted_rows
+  on conflict (asset_id) do update set deleted_at = excluded.deleted_at;
+  return null;
+end $$;
+
+drop trigger if exists asset_master_tombstones on asset_master;
+create trigger asset_master_tombstones
+  after delete on asset_master
+  referencing old table as deleted_rows
+  for each statement execute function record_asset_tombstones();
+
+-- 3. the delta queries filter on the change columns
+create index if not exists spares_requirements_last_updated_at_idx on spares_requirements (last_updated_at);
+create index if not exists spares_requirements_created_at_idx on spares_requirements (created_at);
+create index if not exists asset_master_last_updated_at_idx on asset_master (last_updated_at);
@@ -0,0 +1,20 @@
+-- 004_push_subscriptions.sql
+-- Web Push subscriptions for spares events (push_routes.py stores them,
+-- push_dispatch.py sends to them). Without this table /push/subscribe
+-- fails and no spares event is delivered. Run once in the Supabase SQL
+-- editor.
+
+create table if not exists push_subscriptions (
+  endpoint   text primary key,    -- /push/subscribe upserts on it
+  p256dh     text not null,
+  auth       text not null,
+  user_email text,
+  role       text,
+  created_at timestamptz not null default now()
+);
+
+-- /push/unsubscribe deletes by endpoint + user_email
+create index if not exists push_subscriptions_user_email_idx on push_subscriptions (user_email);
+
+-- only the service-role client (supabase_admin) reads or writes it
+alter table push_subscriptions enable row level security;
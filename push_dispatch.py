@@ -0,0 +1,219 @@
+# push_dispatch.py
+"""Web Push for spares events.
+
+Browsers subscribe through `/push/subscribe` (VAPID application server key
+from `/push/vapid_public_key`); subscriptions live in the Supabase table
+push_subscriptions, created by migrations/004_push_subscriptions.sql.
+
+Spares writes call `notify_spares_event(...)`, which only enqueues. A
+background thread collects events for PUSH_BATCH_SECONDS, loads the
+subscriptions once per batch, coalesces a burst into ONE message per
+subscription ("3 spares updates") and sends them on a small thread pool.
+Expired subscriptions (404/410) are deleted. The actor's own browsers are
+skipped: the page already shows a local notification for them.
+
+Sending uses `pywebpush` and needs VAPID_PUBLIC_KEY / VAPID_PRIVATE_KEY /
+VAPID_SUBJECT. Without keys the dispatcher is disabled and publishing is a
+no-op. For local testing, point a subscription's endpoint at any HTTP
+stub; the encrypted POST arrives there like it would at a push service.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SUBSCRIPTIONS_TABLE = "push_subscriptions"
+_GONE = (404, 410)
+
+
+def webpush_sender(vapid_private_key, vapid_subject, ttl=3600, timeout=10):
+    """Return send(subscription_row, payload_dict) -> HTTP status (0 on network error)."""
+    def send(sub, payload):
+        from pywebpush import webpush, WebPushException
+
+        try:
+            resp = webpush(
+                subscription_info={"endpoint": sub["endpoint"],
+                                   "keys": {"p256dh": sub["p256dh"], "auth": sub["auth"]}},
+                data=json.dumps(payload),
+                vapid_private_key=vapid_private_key,
+                vapid_claims={"sub": vapid_subject},
+                ttl=ttl,
+                timeout=timeout,
+            )
+            return resp.status_code
+        except WebPushException as e:
+            return e.response.status_code if e.response is not None else 0
+    return send
+
+
+def coalesce(events):
+    """Fold a burst of events for one subscriber into a single push payload."""
+    if len(events) == 1:
+        return events[0]
+    bodies = [e.get("body") for e in events if e.get("body")]
+    body = "; ".join(bodies[:3]) + (" …" if len(bodies) > 3 else "")
+    return {"type": "spares-changed", "title": f"{len(events)} spares updates", "body": body,
+            "tag": "spares", "count": len(events)}
+
+
+class PushDispatcher:
+    def __init__(self, sender=None, public_key=None, batch_window=2.0, max_workers=4, subs_ttl=60.0):
+        self.sender = sender
+        self.public_key = public_key
+        self.batch_window = batch_window
+        self.subs_ttl = subs_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="push")
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sb = None
+        self._subs = None
+        self._subs_expires = 0.0
+
+    @property
+    def enabled(self):
+        return self.sender is not None
+
+    # ---------- producer side (request threads) ----------
+    def publish(self, supabase_admin, event, exclude_user=None):
+        """Queue `event` for every subscriber except `exclude_user`. Never blocks."""
+        if not self.enabled:
+            return
+        self._sb = supabase_admin
+        self._q.put((event, exclude_user))
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        # started lazily so a pre-forking server starts it in each worker
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="push-dispatch", daemon=True)
+                self._thread.start()
+
+    def wait_idle(self, timeout=None):
+        """Block until everything queued so far has been sent (for tests / shutdown)."""
+        done = self._q.all_tasks_done
+        with done:
+            return done.wait_for(lambda: not self._q.unfinished_tasks, timeout)
+
+    # ---------- subscription registry ----------
+    def invalidate_subscriptions(self):
+        with self._lock:
+            self._subs = None
+            self._subs_expires = 0.0
+
+    def _subscriptions(self):
+        now = time.time()
+        with self._lock:
+            if self._subs is not None and now < self._subs_expires:
+                return self._subs
+        res = self._sb.table(SUBSCRIPTIONS_TABLE).select("endpoint, p256dh, auth, user_email, role").execute()
+        subs = res.data or []
+        with self._lock:
+            self._subs, self._subs_expires = subs, time.time() + self.subs_ttl
+        return subs
+
+    def _drop_subscriptions(self, endpoints):
+        try:
+            self._sb.table(SUBSCRIPTIONS_TABLE).delete().in_("endpoint", endpoints).execute()
+        except Exception as e:
+            print("⚠️ could not remove expired push subscriptions:", e)
+        self.invalidate_subscriptions()
+
+    # ---------- consumer side (background thread) ----------
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                print("⚠️ push dispatch failed:", e)
+            for _ in batch:
+                self._q.task_done()
+
+    def _dispatch(self, batch):
+        per_sub = {}
+        for sub in self._subscriptions():
+            events = [ev for ev, exclude in batch if not (exclude and sub.get("user_email") == exclude)]
+            if events:
+                per_sub[sub["endpoint"]] = (sub, coalesce(events))
+        if not per_sub:
+            return
+
+        def send(item):
+            sub, payload = item
+            try:
+                return sub["endpoint"], self.sender(sub, payload)
+            except Exception as e:
+                print(f"⚠️ push to {sub['endpoint'][:60]} failed:", e)
+                return sub["endpoint"], 0
+
+        gone = [ep for ep, status in self._pool.map(send, per_sub.values()) if status in _GONE]
+        if gone:
+            self._drop_subscriptions(gone)
+
+
+def create_push_dispatcher():
+    """Build the app-wide dispatcher from VAPID_* / PUSH_* env settings."""
+    public_key = os.getenv("VAPID_PUBLIC_KEY")
+    private_key = os.getenv("VAPID_PRIVATE_KEY")
+    subject = os.getenv("VAPID_SUBJECT", "mailto:admin@example.com")
+    try:
+        batch_window = float(os.getenv("PUSH_BATCH_SECONDS", "2"))
+    except Exception:
+        batch_window = 2.0
+    try:
+        workers = int(os.getenv("PUSH_WORKERS", "4"))
+    except Exception:
+        workers = 4
+
+    sender = None
+    if public_key and private_key:
+        sender = webpush_sender(private_key, subject)
+    else:
+        print("⚠️ VAPID keys not configured; Web Push disabled")
+    return PushDispatcher(sender=sender, public_key=public_key, batch_window=batch_window, max_workers=workers)
+
+
+_SPARES_MESSAGES = {
+    "created": ("New Requirement created", "Requirement {ref} requested"),
+    "updated": ("Requirement Updated", "Requirement {ref} updated"),
+    "closed": ("Requirement Closed", "Requirement {ref} closed"),
+}
+
+
+def notify_spares_event(action, ref_no=None, spare_id=None, rows=None):
+    """Push a spares create/update/close to every other subscriber (call after the write).
+
+    `rows` may be the write's returned representation; ref_no is read from it.
+    """
+    from flask import current_app, session
+
+    dispatcher = current_app.config.get("PUSH")
+    if dispatcher is None or not dispatcher.enabled:
+        return
+    if not ref_no and rows:
+        ref_no = rows[0].get("ref_no") or rows[0].get("ref_number")
+    title, body = _SPARES_MESSAGES[action]
+    event = {
+        "type": "spares-changed",
+        "action": action,
+        "title": title,
+        "body": body.format(ref=ref_no or (f"#{spare_id}" if spare_id else "")).replace("  ", " "),
+        "tag": "spares",
+        "ref_no": ref_no,
+        "id": spare_id,
+    }
+    dispatcher.publish(current_app.config["supabase_admin"], event, exclude_user=session.get("user"))
@@ -0,0 +1,57 @@
+# push_routes.py
+from flask import Blueprint, current_app, jsonify, request, session
+from services import require_role
+from push_dispatch import SUBSCRIPTIONS_TABLE
+
+push_bp = Blueprint("push", __name__)
+
+
+# ---------------- VAPID PUBLIC KEY ----------------
+@push_bp.route('/vapid_public_key')
+@require_role()
+def vapid_public_key():
+    dispatcher = current_app.config.get('PUSH')
+    if dispatcher is None or not dispatcher.enabled:
+        return jsonify({"success": False, "error": "Web Push not configured"}), 404
+    return jsonify({"success": True, "public_key": dispatcher.public_key}), 200
+
+
+# ---------------- SUBSCRIBE ----------------
+@push_bp.route('/subscribe', methods=['POST'])
+@require_role()
+def push_subscribe():
+    data = request.get_json(silent=True) or {}
+    keys = data.get("keys") or {}
+    if not data.get("endpoint") or not keys.get("p256dh") or not keys.get("auth"):
+        return jsonify({"success": False, "error": "endpoint and keys.p256dh/keys.auth are required"}), 400
+
+    try:
+        current_app.config['supabase_admin'].table(SUBSCRIPTIONS_TABLE).upsert({
+            "endpoint": data["endpoint"],
+            "p256dh": keys["p256dh"],
+            "auth": keys["auth"],
+            "user_email": session.get("user"),
+            "role": session.get("role"),
+        }, on_conflict="endpoint", returning="minimal").execute()
+        current_app.config['PUSH'].invalidate_subscriptions()
+        return jsonify({"success": True}), 201
+    except Exception as e:
+        current_app.logger.error(f"push_subscribe error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# ---------------- UNSUBSCRIBE ----------------
+@push_bp.route('/unsubscribe', methods=['POST'])
+@require_role()
+def push_unsubscribe():
+    endpoint = (request.get_json(silent=True) or {}).get("endpoint")
+    if not endpoint:
+        return jsonify({"success": False, "error": "endpoint is required"}), 400
+    try:
+        current_app.config['supabase_admin'].table(SUBSCRIPTIONS_TABLE) \
+            .delete().eq("endpoint", endpoint).eq("user_email", session.get("user")).execute()
+        current_app.config['PUSH'].invalidate_subscriptions()
+        return jsonify({"success": True}), 200
+    except Exception as e:
+        current_app.logger.error(f"push_unsubscribe error: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
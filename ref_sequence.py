@@ -0,0 +1,144 @@
+# ref_sequence.py
+"""Spares reference-number allocator.
+
+Every worker reserves a block of numbers at a time and hands them out
+locally, so the create path costs no extra round trip and concurrent
+creators can never get the same ref_no.
+
+Blocks come from ONE numbering source per deployment (SPARES_REF_SOURCE);
+the two are never mixed, since their numbers would overlap:
+  - "rpc" (default): a database RPC over a Postgres sequence whose
+    increment is the block size, so one `nextval` atomically reserves a
+    whole block. The sequence and its functions are created by
+    migrations/002_spares_ref_block.sql; SPARES_REF_BLOCK_SIZE must match
+    the sequence increment.
+    A failing call is retried with backoff; if it keeps failing the
+    create fails with RefAllocationError rather than guessing a number.
+  - "local": a counter file guarded by an exclusive file lock, seeded once
+    from the highest ref_no in the table. Unique across workers on ONE
+    host with a persistent SPARES_REF_STATE path only; choose it
+    explicitly for single-host deployments without the RPC.
+
+`peek()` (the "next ref" preview) never reserves anything: it reports the
+next number of this worker's block, or else the start of the next block
+the source would hand out.
+"""
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: single-process dev server only
+    fcntl = None
+
+RPC_NAME = "reserve_spares_ref_block"
+PEEK_RPC_NAME = "peek_spares_ref_block"
+SOURCES = ("rpc", "local")
+
+
+class RefAllocationError(RuntimeError):
+    """No block could be reserved; the spare must not be created."""
+
+
+def format_ref(num):
+    return str(num).zfill(4)
+
+
+def _parse_ref(val):
+    try:
+        return int(str(val).strip().lstrip("0") or "0")
+    except Exception:
+        return 0
+
+
+class RefAllocator:
+    def __init__(self, block_size=20, state_path=None, source="rpc", retries=3, backoff=0.2):
+        if source not in SOURCES:
+            raise ValueError(f"SPARES_REF_SOURCE must be one of {', '.join(SOURCES)}")
+        self.block_size = max(int(block_size), 1)
+        self.source = source
+        self.retries = max(int(retries), 1)
+        self.backoff = backoff
+        self.state_path = state_path or os.path.join(tempfile.gettempdir(), "pnm_spares_ref.seq")
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0          # exclusive
+
+    # ---------- block reservation ----------
+    def _db_max_ref(self, supabase_admin):
+        res = supabase_admin.table("spares_requirements").select("ref_no").order("id", desc=True).limit(50).execute()
+        return max((_parse_ref(r.get("ref_no") or r.get("ref_number")) for r in res.data or []), default=0)
+
+    def _call_rpc(self, supabase_admin, name):
+        res = supabase_admin.rpc(name, {}).execute()
+        data = res.data
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if isinstance(data, dict):
+            data = next(iter(data.values()), None)
+        return int(data)
+
+    def _peek_local(self, supabase_admin):
+        try:
+            with open(self.state_path, "r") as f:
+                raw = f.read().strip()
+        except OSError:
+            raw = ""
+        return (int(raw) if raw.isdigit() else self._db_max_ref(supabase_admin)) + 1
+
+    def _reserve_local(self, supabase_admin):
+        with open(self.state_path, "a+") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read().strip()
+                current = int(raw) if raw.isdigit() else self._db_max_ref(supabase_admin)
+                start = current + 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(current + self.block_size))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        return start
+
+    def _reserve_block(self, supabase_admin):
+        if self.source == "local":
+            start = self._reserve_local(supabase_admin)
+        else:
+            delay = self.backoff
+            for attempt in range(1, self.retries + 1):
+                try:
+                    start = self._call_rpc(supabase_admin, RPC_NAME)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        raise RefAllocationError(f"Could not reserve a ref_no block ({RPC_NAME}): {e}") from e
+                    print(f"⚠️ {RPC_NAME} failed (attempt {attempt}/{self.retries}), retrying:", e)
+                    time.sleep(delay)
+                    delay *= 2
+        self._next, self._end = start, start + self.block_size
+
+    # ---------- public API ----------
+    def next_ref(self, supabase_admin):
+        """Consume and return the next ref_no (zero-padded)."""
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve_block(supabase_admin)
+            num = self._next
+            self._next += 1
+        return format_ref(num)
+
+    def peek(self, supabase_admin):
+        """Preview the ref_no this worker will hand out next; reserves nothing."""
+        with self._lock:
+            if self._next < self._end:
+                return format_ref(self._next)
+        if self.source == "local":
+            return format_ref(self._peek_local(supabase_admin))
+        return format_ref(self._call_rpc(supabase_admin, PEEK_RPC_NAME))
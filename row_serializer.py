@@ -0,0 +1,234 @@
+# row_serializer.py
+"""Schema-driven row serializers.
+
+A serializer is declared as a list of fields and compiled ONCE into a plain
+Python function (one dict literal, each source column read once), so the
+per-row cost is a handful of `dict.get` calls instead of repeated fallbacks
+and try/except blocks.
+
+    serialize = compile_serializer("spare", [
+        Field("id"),
+        Field("ref_no", "ref_no", "ref_number"),          # first truthy column
+        Field("created_at", convert=ist_formatter(...), keep_raw=True),
+        Computed("asset_display", asset_display),
+    ])
+    out = [serialize(r) for r in rows]
+
+Field options:
+  - sources: columns tried in order with `or` (defaults to the key itself)
+  - by_presence: use the first source PRESENT in the row instead of truthy
+  - default: `r.get(col, default)` for a single source
+  - convert: column-level conversion applied to the resolved value
+  - keep_raw: fall back to the raw value when `convert` returns None
+  - fallback: final `or <fallback>` literal
+"""
+from datetime import datetime, timedelta, timezone
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+class Field:
+    def __init__(self, key, *sources, by_presence=False, default=None, convert=None, keep_raw=False, fallback=None):
+        self.key = key
+        self.sources = sources or (key,)
+        self.by_presence = by_presence
+        self.default = default
+        self.convert = convert
+        self.keep_raw = keep_raw
+        self.fallback = fallback
+
+
+class Computed:
+    """Output key computed by `fn(row)` (for values that mix several columns)."""
+
+    def __init__(self, key, fn):
+        self.key = key
+        self.fn = fn
+
+
+def compile_serializer(name, fields):
+    """Compile a field spec into `serialize(row) -> dict`."""
+    ns = {}
+    lines = [f"def serialize_{name}(r):", "    g = r.get"]
+    locals_by_source = {}
+    items = []
+
+    def bind(obj, prefix):
+        ident = f"{prefix}{len(ns)}"
+        ns[ident] = obj
+        return ident
+
+    for f in fields:
+        if isinstance(f, Computed):
+            items.append(f"{f.key!r}: {bind(f.fn, 'fn')}(r)")
+            continue
+
+        if f.by_presence:
+            *heads, last = f.sources
+            expr = f"g({last!r})"
+            for src in reversed(heads):
+                expr = f"(g({src!r}) if {src!r} in r else {expr})"
+        elif len(f.sources) == 1 and f.default is not None:
+            expr = f"g({f.sources[0]!r}, {bind(f.default, 'd')})"
+        else:
+            expr = " or ".join(f"g({src!r})" for src in f.sources)
+
+        # read each distinct source chain once per row
+        var = locals_by_source.get(expr)
+        if var is None:
+            var = f"v{len(locals_by_source)}"
+            locals_by_source[expr] = var
+            lines.append(f"    {var} = {expr}")
+        expr = var
+
+        if f.convert is not None:
+            conv = bind(f.convert, "c")
+            expr = f"({conv}({var}) or {var})" if f.keep_raw else f"{conv}({var})"
+        if f.fallback is not None:
+            expr = f"({expr} or {bind(f.fallback, 'd')})"
+        items.append(f"{f.key!r}: {expr}")
+
+    lines.append("    return {" + ", ".join(items) + "}")
+    exec("\n".join(lines), ns)
+    return ns[f"serialize_{name}"]
+
+
+# ===== ✅ 1. COLUMN CONVERTERS
+IST_OFFSET = timedelta(hours=5, minutes=30)
+
+# strftime directives the fast formatter can build from datetime fields
+_FAST_DIRECTIVES = {
+    "d": ("%02d", lambda d: d.day),
+    "m": ("%02d", lambda d: d.month),
+    "Y": ("%d", lambda d: d.year),
+    "H": ("%02d", lambda d: d.hour),
+    "I": ("%02d", lambda d: (d.hour % 12) or 12),
+    "M": ("%02d", lambda d: d.minute),
+    "S": ("%02d", lambda d: d.second),
+    "p": ("%s", lambda d: "PM" if d.hour >= 12 else "AM"),
+}
+
+
+def _compile_fmt(fmt):
+    """strftime format -> (printf template, getters), or None if unsupported."""
+    out, getters, i = [], [], 0
+    while i < len(fmt):
+        ch = fmt[i]
+        if ch == "%":
+            spec = _FAST_DIRECTIVES.get(fmt[i + 1:i + 2])
+            if spec is None:
+                return None
+            out.append(spec[0])
+            getters.append(spec[1])
+            i += 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out), tuple(getters)
+
+
+def ist_formatter(fmt, cache_size=4096):
+    """Timestamp -> IST display string (None when empty or unparseable).
+
+    Aware timestamps are shifted with plain arithmetic and formatted without
+    strftime; string inputs are memoized, since the same rows are serialized
+    on every list refresh.
+    """
+    from functools import lru_cache
+
+    compiled = _compile_fmt(fmt)
+
+    def fmt_dt(dt):
+        off = dt.utcoffset()
+        if off is None or compiled is None:
+            return dt.astimezone(IST).strftime(fmt)
+        dt = dt - off + IST_OFFSET
+        template, getters = compiled
+        return template % tuple(get(dt) for get in getters)
+
+    @lru_cache(maxsize=cache_size)
+    def from_string(val):
+        try:
+            return fmt_dt(datetime.fromisoformat(val.replace("Z", "+00:00")))
+        except Exception:
+            return None
+
+    def convert(val):
+        if not val:
+            return None
+        if isinstance(val, str):
+            return from_string(val)
+        try:
+            return fmt_dt(val)
+        except Exception:
+            return None
+    return convert
+
+
+def iso_string(val):
+    if not val:
+        return None
+    if isinstance(val, str):
+        return val
+    try:
+        return val.isoformat()
+    except Exception:
+        return str(val)
+
+
+def asset_display(r):
+    code = r.get("asset_code") or ""
+    desc = r.get("asset_description")
+    return f"{code} - {desc}" if desc else code
+
+
+# ===== ✅ 2. SPARES SERIALIZERS (admin + user /get_spares)
+_SPARES_COMMON = [
+    Field("id"),
+    Field("status"),
+    Field("priority"),
+    Field("for_type"),
+    Field("asset_code"),
+    Field("asset_description"),
+    Field("required_by"),
+    Field("current_status"),
+    Field("actioner"),
+    Field("dc_number"),
+]
+
+_admin_display = ist_formatter("%d-%m-%Y %I:%M %p")
+
+serialize_admin_spare = compile_serializer("admin_spare", _SPARES_COMMON + [
+    Field("ref_no", "ref_no", "ref_number"),
+    Field("required_by_raw", "required_by"),
+    Field("title", "title", "requisition", fallback=""),
+    Field("requisition"),
+    Field("spares_req", "spares_req", "spare_requirement"),
+    Field("dc_required", "dc_required", "is_dc", by_presence=True),
+    Field("created_at", convert=_admin_display, keep_raw=True),
+    Field("status_updated_at", convert=_admin_display, keep_raw=True),
+    Computed("closed", lambda r: r.get("closed") if "closed" in r else (r.get("status") == "Closed")),
+    Field("created_by"),
+    Field("metadata"),
+])
+
+_user_display = ist_formatter("%d/%m/%Y %I:%M %p")
+
+serialize_user_spare = compile_serializer("user_spare", _SPARES_COMMON + [
+    Field("ref_no"),
+    Computed("asset_display", asset_display),
+    Field("spares_req"),
+    Field("qty_required"),
+    Field("qty_available"),
+    Field("requisition", "requisition", "created_by", "requested_by"),
+    Field("dc_required", default=False),
+    Field("expected_date"),
+    Field("closed", default=False),
+    # iso/time fields
+    Field("created_at_iso", "created_at", convert=iso_string),
+    Field("last_updated_at_iso", "last_updated_at", "status_updated_at", convert=iso_string),
+    Field("expected_date_iso", "expected_date", convert=iso_string),
+    # display strings (IST)
+    Field("created_at", convert=_user_display, keep_raw=True, fallback=""),
+    Field("last_updated_at", "last_updated_at", "status_updated_at", convert=_user_display, keep_raw=True, fallback=""),
+])
@@ -0,0 +1,93 @@
+"""Import-time budget for worker boot (python -X importtime).
+
+Imports what a worker imports at boot in a fresh interpreter, a few times,
+and fails when the fastest run is over budget or when a dependency that
+should load lazily (openpyxl, pandas, pywebpush) shows up at boot.
+
+    python scripts/import_budget.py                    # default budget
+    python scripts/import_budget.py --budget-ms 900 --runs 5
+    IMPORT_BUDGET_MS=900 python scripts/import_budget.py
+
+Exit status: 0 within budget, 1 over budget / lazy module imported,
+2 the boot imports themselves failed.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT_MODULES = [
+    "app", "auth_routes", "admin_routes", "user_routes", "export_routes", "push_routes",
+    # imported inside create_app
+    "supabase", "httpx", "certifi",
+]
+LAZY_MODULES = ["openpyxl", "pandas", "pywebpush"]
+DEFAULT_BUDGET_MS = 1500
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(modules, baseline=()):
+    """One fresh interpreter -> (total ms, [(cumulative ms, depth, name), ...]).
+
+    Modules every interpreter loads at startup (`baseline`) are left out.
+    """
+    code = "import " + ", ".join(modules) if modules else "pass"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    entries = []
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m:
+            entry = (int(m.group(2)) / 1000.0, len(m.group(3)) // 2, m.group(4))
+            if entry[2] not in baseline:
+                entries.append(entry)
+    total = sum(ms for ms, depth, _ in entries if depth == 0)
+    return total, entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float,
+                        default=float(os.getenv("IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS)))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modules", default=",".join(BOOT_MODULES),
+                        help="comma-separated modules imported at boot")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    modules = [m.strip() for m in args.modules.split(",") if m.strip()]
+
+    try:
+        baseline = {name for _, _, name in measure([])[1]}
+        runs = [measure(modules, baseline) for _ in range(max(args.runs, 1))]
+    except RuntimeError as e:
+        print("❌ boot imports failed:", e)
+        return 2
+    total, entries = min(runs, key=lambda r: r[0])
+
+    print(f"Boot imports: {total:.0f} ms (best of {len(runs)}), budget {args.budget_ms:.0f} ms")
+    print("Slowest packages:")
+    for ms, _, name in sorted((e for e in entries if e[1] <= 1), reverse=True)[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failed = False
+    eager = sorted({name.split(".")[0] for _, _, name in entries} & set(LAZY_MODULES))
+    if eager:
+        print("❌ imported at boot but should load lazily:", ", ".join(eager))
+        failed = True
+    if total > args.budget_ms:
+        print(f"❌ over budget by {total - args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("✅ within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
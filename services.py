@@ -4,7 +4,7 @@ import io
 import csv
 import secrets
 import string
-from flask import redirect, session, current_app, Response, url_for, flash
+from flask import redirect, session, current_app, Response, url_for, flash, jsonify
 from functools import wraps
 
 
@@ -39,6 +39,27 @@ def require_role(role=None):
     return decorator
 
 
+def has_feature(page, feature):
+    """True if the session's feature_accesses grant `feature` on `page`."""
+    return feature in (session.get("feature_accesses") or {}).get(page, {})
+
+
+def require_feature(page, feature):
+    """
+    Enforce a data-feature grant (e.g. 'user_asset_master', 'inline_edit')
+    on the server; the browser only hides the controls. Use below
+    @require_role. Answers 403 JSON without the grant.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not has_feature(page, feature):
+                return jsonify({"success": False, "error": f"Not permitted: {page}:{feature}"}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 # ==========================================================
 # ✅ 2. DEFAULT ADMIN CREATION
 # ==========================================================
@@ -87,15 +108,13 @@ def _generate_password(length=10):
 # ==========================================================
 # ✅ 4. CREATE SINGLE USER (AUTH + META)
 # ==========================================================
-def _create_single_user(data, supabase_admin, auto_password_fallback=True):
+def prepare_user(data, auto_password_fallback=True):
     """
-    Create user in Supabase Auth and insert into users_meta.
+    Validate one user record without touching Supabase.
     - Auto-generates password if missing.
     - Sanitizes names.
-    - Returns dict with auth_id and generated_password (if created).
+    Returns (users_meta row without auth_id, password to use, generated_password or None).
     """
-    print(">>> Creating user with data:", data)
-
     # --- Clean full_name ---
     full_name = (data.get("full_name") or "").strip()
     # Allow letters, spaces, dot, hyphen, apostrophe
@@ -132,15 +151,42 @@ def _create_single_user(data, supabase_admin, auto_password_fallback=True):
     if isinstance(accesses, str):
         accesses = [x.strip() for x in accesses.split(",") if x.strip()]
 
+    # --- users_meta row (no password stored) ---
+    meta = {
+        "user_id": data.get("user_id"),
+        "full_name": full_name_clean,
+        "designation": data.get("designation"),
+        "phone": phone_digits or None,
+        "email": email,
+        "accesses": accesses,
+        "feature_accesses": feature_accesses,
+        "role": role,
+    }
+    return meta, password_to_use, generated_password
+
+
+def create_auth_user(supabase_admin, meta, password):
+    """Create the Supabase Auth account for a prepared users_meta row; returns auth_id."""
+    auth_user = supabase_admin.auth.admin.create_user({
+        "email": meta["email"],
+        "password": password,
+        "email_confirm": True,
+        "user_metadata": {"role": meta["role"], "full_name": meta["full_name"]}
+    })
+    return getattr(auth_user.user, "id", None)
+
+
+def _create_single_user(data, supabase_admin, auto_password_fallback=True):
+    """
+    Create user in Supabase Auth and insert into users_meta.
+    Returns dict with auth_id and generated_password (if created).
+    """
+    print(">>> Creating user with data:", data)
+    meta, password_to_use, generated_password = prepare_user(data, auto_password_fallback)
+
     # --- Create Supabase Auth user ---
     try:
-        auth_user = supabase_admin.auth.admin.create_user({
-            "email": email,
-            "password": password_to_use,
-            "email_confirm": True,
-            "user_metadata": {"role": role, "full_name": full_name_clean}
-        })
-        auth_id = getattr(auth_user.user, "id", None)
+        auth_id = create_auth_user(supabase_admin, meta, password_to_use)
         print("✅ Created Supabase Auth user:", auth_id)
     except Exception as e:
         print("❌ Supabase Auth user creation failed:", e)
@@ -148,17 +194,7 @@ def _create_single_user(data, supabase_admin, auto_password_fallback=True):
 
     # --- Insert into users_meta (no password stored) ---
     try:
-        supabase_admin.table("users_meta").insert({
-            "user_id": data.get("user_id"),
-            "full_name": full_name_clean,
-            "designation": data.get("designation"),
-            "phone": phone_digits or None,
-            "email": email,
-            "accesses": accesses,
-            "feature_accesses": feature_accesses,
-            "role": role,
-            "auth_id": auth_id
-        }).execute()
+        supabase_admin.table("users_meta").insert(dict(meta, auth_id=auth_id)).execute()
     except Exception as e:
         print("❌ users_meta insert failed:", e)
         raise
@@ -192,3 +228,12 @@ def generate_users_csv(users):
         writer.writerow(row)
 
     return si.getvalue().encode("utf-8")
+
+
+# ==========================================================
+# ✅ 6. BULK RESULT SUMMARY
+# ==========================================================
+def summarize(results):
+    """Per-item results ([{"ok": ...}, ...]) -> the JSON body bulk endpoints return."""
+    ok = sum(1 for r in results if r["ok"])
+    return {"success": ok == len(results), "done": ok, "failed": len(results) - ok, "results": results}
@@ -0,0 +1,68 @@
+# spares_bulk.py
+"""Bulk spares writes shared by the admin and user blueprints.
+
+IDs are processed in chunks with one `in_("id", chunk)` statement each, so
+closing or deleting hundreds of requisitions costs a few round trips. Every
+ID gets its own result:
+
+    [{"id": 12, "ok": True}, {"id": 13, "ok": False, "error": "not found"}]
+
+A failing chunk marks only its own IDs as failed; later chunks still run.
+"""
+BULK_CHUNK_SIZE = 200
+BULK_MAX_IDS = 2000
+
+
+def parse_ids(raw):
+    """Validate the `ids` list from a request body. Raises ValueError."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("ids must be a non-empty list")
+    if len(raw) > BULK_MAX_IDS:
+        raise ValueError(f"At most {BULK_MAX_IDS} ids per request")
+    try:
+        ids = [int(i) for i in raw]
+    except (TypeError, ValueError):
+        raise ValueError("ids must be integers")
+    return list(dict.fromkeys(ids))  # de-dupe, keep order
+
+
+def parse_patch(raw, allowed):
+    """Validate the `patch` object from a request body. Raises ValueError.
+
+    At least one field must be in `allowed`; otherwise the update would only
+    bump timestamps and fan out push events for every row.
+    """
+    if not isinstance(raw, dict) or not any(k in allowed for k in raw):
+        raise ValueError(f"patch must set at least one of: {', '.join(sorted(allowed))}")
+    return raw
+
+
+def _run_chunks(ids, op, chunk_size):
+    results, rows = {}, []
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        try:
+            done = op(chunk) or []
+        except Exception as e:
+            for sid in chunk:
+                results[sid] = {"id": sid, "ok": False, "error": str(e)}
+            continue
+        rows.extend(done)
+        hit = {r.get("id") for r in done}
+        for sid in chunk:
+            results[sid] = {"id": sid, "ok": True} if sid in hit else {"id": sid, "ok": False, "error": "not found"}
+    return [results[sid] for sid in ids], rows
+
+
+def bulk_update_spares(supabase_admin, ids, patch, chunk_size=BULK_CHUNK_SIZE):
+    """Apply `patch` to every id. Returns (per-id results, updated rows)."""
+    def op(chunk):
+        return supabase_admin.table("spares_requirements").update(patch).in_("id", chunk).execute().data
+    return _run_chunks(ids, op, chunk_size)
+
+
+def bulk_delete_spares(supabase_admin, ids, chunk_size=BULK_CHUNK_SIZE):
+    """Delete every id. Returns (per-id results, deleted rows)."""
+    def op(chunk):
+        return supabase_admin.table("spares_requirements").delete().in_("id", chunk).execute().data
+    return _run_chunks(ids, op, chunk_size)
@@ -0,0 +1,143 @@
+# spares_stats.py
+"""Spares counters shared by the admin and user dashboards.
+
+All status counts plus the latest update time come from ONE grouped query
+(PostgREST aggregates: count/max grouped by status + closed). If the
+project has aggregates disabled (PostgREST error PGRST123), the service
+falls back to a narrow column scan and only probes the aggregate again
+every AGGREGATE_RETRY_SECONDS. Any other error (a timeout, say) scans for
+that one call and keeps using aggregates afterwards.
+
+Results are cached for a few seconds (SPARES_STATS_TTL_SECONDS) and the
+cache is dropped whenever a spare is created, updated, closed or deleted
+(`invalidate_spares_stats()`).
+"""
+import threading
+import time
+from datetime import datetime
+
+_AGGREGATE_SELECT = "status, closed, n:id.count(), last_updated:last_updated_at.max(), last_created:created_at.max()"
+_SCAN_SELECT = "status, closed, created_at, last_updated_at"
+
+
+def _parse_bool(val):
+    if isinstance(val, bool):
+        return val
+    if val is None:
+        return False
+    return str(val).strip().lower() in ("1", "true", "t", "yes", "y")
+
+
+def _parse_dt(cand):
+    if not cand:
+        return None
+    s = str(cand)
+    # handle trailing Z
+    if s.endswith('Z'):
+        s = s[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(s)
+    except Exception:
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%d-%m-%Y %I:%M %p", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(s, fmt)
+            except Exception:
+                continue
+    return None
+
+
+def _later(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    try:
+        return b if b > a else a
+    except TypeError:
+        # naive vs aware: compare wall-clock values
+        return b if b.replace(tzinfo=None) > a.replace(tzinfo=None) else a
+
+
+def _aggregates_disabled(exc):
+    """PostgREST's "aggregate functions are not enabled" error (PGRST123)."""
+    code = getattr(exc, "code", None)
+    return code == "PGRST123" or "PGRST123" in str(exc)
+
+
+class SparesStats:
+    # how long to scan before probing the aggregate query again
+    AGGREGATE_RETRY_SECONDS = 600.0
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires = 0.0
+        self._aggregates_off_until = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._expires = 0.0
+
+    def _groups(self, supabase_admin):
+        """Return [(status, closed, count, latest_dt)] for the whole table."""
+        if time.time() >= self._aggregates_off_until:
+            try:
+                res = supabase_admin.table("spares_requirements").select(_AGGREGATE_SELECT).execute()
+                return [
+                    (r.get("status"), r.get("closed"), int(r.get("n") or 0),
+                     _later(_parse_dt(r.get("last_updated")), _parse_dt(r.get("last_created"))))
+                    for r in res.data or []
+                ]
+            except Exception as e:
+                if _aggregates_disabled(e):
+                    # only this error turns aggregates off, and only until the next probe
+                    print("⚠️ spares aggregates not enabled, scanning instead:", e)
+                    self._aggregates_off_until = time.time() + self.AGGREGATE_RETRY_SECONDS
+                else:
+                    print("⚠️ spares aggregate query failed, scanning this time:", e)
+
+        # same timestamps as the aggregate: the later of last_updated_at and created_at
+        res = supabase_admin.table("spares_requirements").select(_SCAN_SELECT).execute()
+        return [
+            (r.get("status"), r.get("closed"), 1,
+             _later(_parse_dt(r.get("last_updated_at")), _parse_dt(r.get("created_at"))))
+            for r in res.data or []
+        ]
+
+    def get(self, supabase_admin):
+        """
+        Returns:
+          { "by_status": {"Active": 3, ...}, "open": n, "closed": n, "total": n,
+            "latest": datetime or None }
+        """
+        now = time.time()
+        with self._lock:
+            if self._value is not None and now < self._expires:
+                return self._value
+
+        by_status, open_n, closed_n, latest = {}, 0, 0, None
+        for status, closed, n, dt in self._groups(supabase_admin):
+            key = status or ""
+            by_status[key] = by_status.get(key, 0) + n
+            if _parse_bool(closed) or str(status or "").strip().lower() == "closed":
+                closed_n += n
+            else:
+                open_n += n
+            latest = _later(latest, dt)
+
+        value = {"by_status": by_status, "open": open_n, "closed": closed_n,
+                 "total": open_n + closed_n, "latest": latest}
+        with self._lock:
+            self._value = value
+            self._expires = time.time() + self.ttl
+        return value
+
+
+def invalidate_spares_stats():
+    """Drop the cached counters (call after any spares write)."""
+    from flask import current_app
+    stats = current_app.config.get("SPARES_STATS")
+    if stats is not None:
+        stats.invalidate()
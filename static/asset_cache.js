@@ -0,0 +1,85 @@
+// asset_cache.js
+// Keeps the asset catalog in IndexedDB and refreshes it with
+// `/get_assets?since=<cursor>` deltas, so a cold page load renders from
+// local data at once and only changed/deleted assets cross the network.
+//
+//   AssetCache.sync("/admin/get_assets", {
+//     onRows:  (rows, fromCache) => ...,    // full list (cached or fresh)
+//     onDelta: (changed, deletedIds) => ... // optional: patch in place
+//   });
+(function(){
+  const DB_NAME = "pnm-cache";
+  const STORE = "catalogs";
+  let dbPromise = null;
+
+  function openDb(){
+    if(dbPromise) return dbPromise;
+    dbPromise = new Promise(resolve => {
+      if(!window.indexedDB) return resolve(null);
+      const req = indexedDB.open(DB_NAME, 1);
+      req.onupgradeneeded = () => req.result.createObjectStore(STORE);
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => resolve(null);   // private mode etc.: behave like no cache
+    });
+    return dbPromise;
+  }
+
+  async function read(key){
+    const db = await openDb();
+    if(!db) return null;
+    return new Promise(resolve => {
+      const req = db.transaction(STORE).objectStore(STORE).get(key);
+      req.onsuccess = () => resolve(req.result || null);
+      req.onerror = () => resolve(null);
+    });
+  }
+
+  async function write(key, value){
+    const db = await openDb();
+    if(!db) return;
+    return new Promise(resolve => {
+      const tx = db.transaction(STORE, "readwrite");
+      if(value === null) tx.objectStore(STORE).delete(key);
+      else tx.objectStore(STORE).put(value, key);
+      tx.oncomplete = tx.onerror = () => resolve();
+    });
+  }
+
+  async function fetchFull(url){
+    const r = await fetch(url, { credentials: "same-origin" });
+    if(!r.ok) throw new Error("get_assets returned " + r.status);
+    return { cursor: r.headers.get("X-Sync-Cursor"), rows: await r.json() };
+  }
+
+  async function sync(url, handlers){
+    const cached = await read(url);
+    if(cached && Array.isArray(cached.rows)) handlers.onRows(cached.rows, true);
+
+    try{
+      if(cached && cached.cursor){
+        const r = await fetch(url + "?since=" + encodeURIComponent(cached.cursor), { credentials: "same-origin" });
+        const d = r.ok ? await r.json() : null;
+        if(d && !d.full){
+          const byId = new Map(cached.rows.map(row => [String(row.id), row]));
+          (d.changed || []).forEach(row => byId.set(String(row.id), row));
+          (d.deleted || []).forEach(id => byId.delete(String(id)));
+          const rows = Array.from(byId.values());
+          await write(url, { cursor: d.cursor, rows });
+          if(handlers.onDelta) handlers.onDelta(d.changed || [], d.deleted || [], rows);
+          else handlers.onRows(rows, false);
+          return rows;
+        }
+      }
+      const full = await fetchFull(url);
+      await write(url, full);
+      handlers.onRows(full.rows, false);
+      return full.rows;
+    }catch(e){
+      console.warn("AssetCache sync failed", e);
+      if(!cached) throw e;
+      return cached.rows;
+    }
+  }
+
+  window.AssetCache = { sync, clear: url => write(url, null) };
+})();
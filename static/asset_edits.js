@@ -0,0 +1,82 @@
+// asset_edits.js
+// Collects inline cell edits and saves them as ONE batched PATCH
+// (`/admin/assets` or `/user/assets`) once editing pauses. Only changed
+// fields are sent, with the row's `last_updated_at` as a version token,
+// so a row someone else changed meanwhile comes back as a conflict
+// instead of being overwritten.
+//
+//   const edits = AssetEdits.create("/admin/assets", {
+//     version:    id => table.getRow(id)?.getData().last_updated_at,
+//     onSaved:    row => table.updateData([row]),
+//     onConflict: r => ...,   // r.row is the current server row
+//     onError:    r => ...,
+//   });
+//   table.on("cellEdited", cell => edits.queue(cell.getRow().getData().id, cell.getField(), cell.getValue()));
+(function(){
+  function create(url, opts){
+    const delay = opts.delay || 800;
+    let pending = new Map();      // id -> {field: value}
+    let timer = null;
+    let chain = Promise.resolve();
+
+    function queue(id, field, value){
+      const changes = pending.get(id) || {};
+      changes[field] = value;
+      pending.set(id, changes);
+      clearTimeout(timer);
+      timer = setTimeout(flush, delay);
+    }
+
+    function takeBatch(){
+      const edits = Array.from(pending, ([id, changes]) => ({ id, changes, version: opts.version(id) || null }));
+      pending = new Map();
+      return edits;
+    }
+
+    // Saves run one after another, so an edit queued while a save is in
+    // flight picks up the version that save returns.
+    function flush(){
+      clearTimeout(timer);
+      chain = chain.then(async () => {
+        const edits = takeBatch();
+        if (!edits.length) return;
+        try {
+          const r = await fetch(url, {
+            method: "PATCH",
+            headers: { "Content-Type": "application/json" },
+            credentials: "same-origin",
+            body: JSON.stringify({ edits })
+          });
+          const body = await r.json();
+          if (!r.ok) throw new Error(body.error || r.status);
+          body.results.forEach(res => {
+            if (res.ok) opts.onSaved && opts.onSaved(res.row);
+            else if (res.conflict) opts.onConflict && opts.onConflict(res);
+            else opts.onError && opts.onError(res);
+          });
+          if (opts.onBatch) opts.onBatch(body);
+        } catch (err) {
+          edits.forEach(e => opts.onError && opts.onError({ id: e.id, ok: false, error: String(err.message || err) }));
+        }
+      });
+      return chain;
+    }
+
+    // last chance for edits made right before leaving the page
+    window.addEventListener("pagehide", () => {
+      const edits = takeBatch();
+      if (!edits.length) return;
+      fetch(url, {
+        method: "PATCH",
+        headers: { "Content-Type": "application/json" },
+        credentials: "same-origin",
+        body: JSON.stringify({ edits }),
+        keepalive: true
+      });
+    });
+
+    return { queue, flush };
+  }
+
+  window.AssetEdits = { create };
+})();
@@ -30,5 +30,9 @@ self.addEventListener('push', function(event) {
   }
   const title = payload.title || 'Notification';
   const options = { body: payload.body || '', tag: payload.tag || undefined, renotify: true };
-  event.waitUntil(self.registration.showNotification(title, options));
+  // Let open pages refresh their data (e.g. spares delta sync) without polling
+  const notifyPages = clients.matchAll({ type: "window", includeUncontrolled: true }).then(clientList => {
+    clientList.forEach(c => c.postMessage({ type: payload.type || 'push', payload }));
+  });
+  event.waitUntil(Promise.all([self.registration.showNotification(title, options), notifyPages]));
 });
@@ -0,0 +1,23 @@
+import pytest
+
+from bulk_delete import parse_ids
+
+
+def test_user_ids_are_stripped_and_deduplicated():
+    assert parse_ids("users", [" EMP01", "EMP02", "EMP01 "]) == ["EMP01", "EMP02"]
+
+
+@pytest.mark.parametrize("raw", [[None], [{"user_id": "EMP01"}], [7], ["  "]])
+def test_bad_users_payload(raw):
+    with pytest.raises(ValueError, match="ids must be user_id strings"):
+        parse_ids("users", raw)
+
+
+def test_bad_assets_payload():
+    with pytest.raises(ValueError, match="ids must be integers"):
+        parse_ids("assets", ["abc"])
+
+
+def test_empty_payload():
+    with pytest.raises(ValueError, match="non-empty list"):
+        parse_ids("users", [])
@@ -0,0 +1,28 @@
+import os
+import time
+
+from export_jobs import STATUS_DONE, ExportJobQueue
+
+
+def test_get_unknown_job_returns_none(tmp_path):
+    queue = ExportJobQueue(str(tmp_path))
+    assert queue.get("x") is None
+
+
+def test_saved_job_is_read_back(tmp_path):
+    queue = ExportJobQueue(str(tmp_path))
+    queue._save({"id": "abc123", "status": STATUS_DONE})
+    assert queue.get("abc123")["status"] == STATUS_DONE
+
+
+def test_prune_drops_expired_records_and_artifacts(tmp_path):
+    queue = ExportJobQueue(str(tmp_path), artifact_ttl=60)
+    queue._save({"id": "old", "status": STATUS_DONE})
+    with open(queue.artifact_path("old"), "wb") as f:
+        f.write(b"x")
+    past = time.time() - 120
+    for name in os.listdir(tmp_path):
+        os.utime(os.path.join(tmp_path, name), (past, past))
+    queue.prune()
+    assert os.listdir(tmp_path) == []
+    assert queue.get("old") is None
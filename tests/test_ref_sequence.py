@@ -0,0 +1,53 @@
+from ref_sequence import PEEK_RPC_NAME, RPC_NAME, RefAllocator
+
+
+class _Res:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Call:
+    def __init__(self, value):
+        self.value = value
+
+    def execute(self):
+        return _Res(self.value)
+
+
+class FakeSequence:
+    """reserve/peek RPCs over an in-memory sequence with increment `block`."""
+
+    def __init__(self, start=1, block=20):
+        self.next_start, self.block, self.calls = start, block, []
+
+    def rpc(self, name, params):
+        self.calls.append(name)
+        value = self.next_start
+        if name == RPC_NAME:
+            self.next_start += self.block
+        return _Call(value)
+
+
+def test_peek_does_not_reserve_a_block():
+    sb = FakeSequence(start=41)
+    refs = RefAllocator(block_size=20)
+    assert refs.peek(sb) == "0041"
+    assert refs.peek(sb) == "0041"
+    assert sb.calls == [PEEK_RPC_NAME, PEEK_RPC_NAME]
+    assert refs.next_ref(sb) == "0041"
+
+
+def test_peek_uses_the_cached_block():
+    sb = FakeSequence(start=1)
+    refs = RefAllocator(block_size=20)
+    assert refs.next_ref(sb) == "0001"
+    assert refs.peek(sb) == "0002"
+    assert sb.calls == [RPC_NAME]
+
+
+def test_peek_local_reads_the_counter_file(tmp_path):
+    state = tmp_path / "seq"
+    state.write_text("40")
+    refs = RefAllocator(block_size=20, state_path=str(state), source="local")
+    assert refs.peek(None) == "0041"
+    assert state.read_text() == "40"
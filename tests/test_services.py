@@ -0,0 +1,39 @@
+import pytest
+
+flask = pytest.importorskip("flask")
+
+from services import require_feature, summarize
+
+
+def _app():
+    app = flask.Flask(__name__)
+    app.secret_key = "test"
+
+    @app.route("/login-as", methods=["POST"])
+    def login_as():
+        flask.session["feature_accesses"] = flask.request.get_json()
+        return "", 204
+
+    @app.route("/edit", methods=["PATCH"])
+    @require_feature("user_asset_master", "inline_edit")
+    def edit():
+        return flask.jsonify({"success": True})
+
+    return app
+
+
+@pytest.mark.parametrize("grants, status", [
+    ({}, 403),
+    ({"user_asset_master": {}}, 403),
+    ({"user_asset_master": {"download_csv": []}}, 403),
+    ({"user_asset_master": {"inline_edit": []}}, 200),
+])
+def test_require_feature(grants, status):
+    client = _app().test_client()
+    client.post("/login-as", json=grants)
+    assert client.patch("/edit").status_code == status
+
+
+def test_summarize():
+    out = summarize([{"id": 1, "ok": True}, {"id": 2, "ok": False, "error": "not found"}])
+    assert (out["success"], out["done"], out["failed"]) == (False, 1, 1)
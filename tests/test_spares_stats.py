@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+
+from spares_stats import SparesStats
+
+ROWS = [
+    {"id": 1, "status": "Active", "closed": False,
+     "created_at": "2025-01-01T08:00:00+00:00", "last_updated_at": "2025-01-03T08:00:00+00:00"},
+    {"id": 2, "status": "Active", "closed": None,
+     "created_at": "2025-01-02T08:00:00+00:00", "last_updated_at": None},
+    {"id": 3, "status": "Closed", "closed": True,
+     "created_at": "2025-01-05T09:30:00Z", "last_updated_at": "2025-01-04T08:00:00+00:00"},
+    {"id": 4, "status": "Ordered", "closed": "false",
+     "created_at": "2025-01-01T00:00:00+00:00", "last_updated_at": "2025-01-02T00:00:00+00:00"},
+]
+
+
+class _Res:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeSpares:
+    """spares_requirements answering both the grouped aggregate and the column scan."""
+
+    def __init__(self, rows, aggregates=True):
+        self.rows, self.aggregates = rows, aggregates
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        self._columns = columns
+        return self
+
+    def execute(self):
+        if ".count()" not in self._columns:
+            return _Res([dict(r) for r in self.rows])
+        if not self.aggregates:
+            raise RuntimeError("PGRST123: Use of aggregate functions is not allowed")
+        groups = {}
+        for r in self.rows:
+            g = groups.setdefault((r["status"], r["closed"]), {
+                "status": r["status"], "closed": r["closed"], "n": 0,
+                "last_updated": None, "last_created": None})
+            g["n"] += 1
+            for src, dst in (("last_updated_at", "last_updated"), ("created_at", "last_created")):
+                # max() over timestamptz: compare as instants, not as strings
+                if r[src] and (g[dst] is None or _dt(r[src]) > _dt(g[dst])):
+                    g[dst] = r[src]
+        return _Res(list(groups.values()))
+
+
+def _dt(s):
+    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+
+@pytest.mark.parametrize("aggregates", [True, False])
+def test_aggregate_and_scan_count_the_same(aggregates):
+    stats = SparesStats().get(FakeSpares(ROWS, aggregates=aggregates))
+    assert stats["by_status"] == {"Active": 2, "Closed": 1, "Ordered": 1}
+    assert (stats["open"], stats["closed"], stats["total"]) == (3, 1, 4)
+    assert stats["latest"] == _dt("2025-01-05T09:30:00+00:00")
+
+
+def test_both_paths_agree():
+    assert SparesStats().get(FakeSpares(ROWS)) == SparesStats().get(FakeSpares(ROWS, aggregates=False))
@@ -0,0 +1,98 @@
+import threading
+
+from user_directory import UserDirectory
+
+
+class _Res:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeUsersMeta:
+    """users_meta with just enough of the query builder for UserDirectory."""
+
+    def __init__(self, rows, on_page=None):
+        self.rows, self.on_page, self.pages = rows, on_page, 0
+        self._eq = None
+
+    def table(self, name):
+        self._eq = None
+        return self
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self._eq = (column, value)
+        return self
+
+    def limit(self, n):
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def execute(self):
+        if self._eq:
+            column, value = self._eq
+            return _Res([r for r in self.rows if r.get(column) == value][:1])
+        self.pages += 1
+        if self.on_page:
+            self.on_page()
+        start, end = self._range
+        return _Res(self.rows[start:end + 1])
+
+
+def _users(n):
+    return [{"user_id": f"U{i:04d}", "phone": f"9{i:09d}", "email": f"u{i}@x"} for i in range(n)]
+
+
+def test_loads_every_page():
+    sb = FakeUsersMeta(_users(25))
+    directory = UserDirectory(page_size=10)
+    assert directory.email_for_phone(sb, "9000000024") == "u24@x"
+    assert sb.pages == 3
+
+
+def test_miss_falls_back_to_eq():
+    sb = FakeUsersMeta(_users(3))
+    directory = UserDirectory()
+    directory.ensure_fresh(sb)
+    sb.rows.append({"user_id": "NEW", "phone": "9999999999", "email": "new@x"})
+    assert directory.email_for_phone(sb, "9999999999") == "new@x"
+
+
+def test_lookups_do_not_wait_for_a_reload():
+    entered, release = threading.Event(), threading.Event()
+
+    def block():
+        entered.set()
+        release.wait(5)
+
+    sb = FakeUsersMeta(_users(3))
+    directory = UserDirectory(ttl=0)
+    directory.ensure_fresh(sb)
+    sb.on_page = block
+    reload = threading.Thread(target=directory.ensure_fresh, args=(sb,))
+    reload.start()
+    assert entered.wait(5)
+    # served from the previous map while the reload is blocked
+    assert directory.email_for_phone(sb, "9000000001") == "u1@x"
+    release.set()
+    reload.join(5)
+
+
+def test_invalidate_during_reload_forces_another():
+    sb = FakeUsersMeta(_users(3))
+    directory = UserDirectory(ttl=3600)
+    sb.on_page = directory.invalidate
+    directory.ensure_fresh(sb)
+    sb.on_page = None
+    directory.ensure_fresh(sb)
+    assert sb.pages == 2
+    directory.ensure_fresh(sb)
+    assert sb.pages == 2
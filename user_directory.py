@@ -0,0 +1,88 @@
+# user_directory.py
+"""Process-wide phone -> email directory for the login path.
+
+Phone logins used to cost a users_meta round trip before the Auth call.
+The directory keeps every user's phone and email in memory instead:
+
+  - the whole table is loaded page by page (`.range()`), so it is not
+    truncated by PostgREST's row cap, and reloaded at most every `ttl`
+    seconds. One thread reloads at a time; the pages are fetched outside
+    the lock and swapped in at the end, so logins meanwhile keep using the
+    previous map instead of waiting for the reload
+  - a phone that is not in the directory (a user created since the last
+    load, possibly by another worker) is looked up directly with `eq()`
+  - admin user writes in this process call `invalidate()`; background
+    provisioning and delete jobs call it when they finish. A reload that
+    was already running when `invalidate()` came in does not count as
+    fresh
+
+Permissions are NOT served from here: login reads accesses and
+feature_accesses fresh from users_meta after sign-in, so a change made in
+any worker applies at the next login.
+"""
+import threading
+import time
+
+DIRECTORY_FIELDS = "user_id, email, phone"
+PAGE_SIZE = 1000
+
+
+class UserDirectory:
+    def __init__(self, ttl=60.0, page_size=PAGE_SIZE):
+        self.ttl = ttl
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._by_phone = {}
+        self._loaded_at = 0.0
+        self._loading = False
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+            self._generation += 1
+
+    def ensure_fresh(self, supabase_admin):
+        """Reload if older than `ttl` (also the startup warm-up); no-op while another thread reloads."""
+        with self._lock:
+            if self._loading or time.time() - self._loaded_at < self.ttl:
+                return
+            self._loading = True
+            generation = self._generation
+        try:
+            by_phone = self._fetch(supabase_admin)
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+        with self._lock:
+            self._by_phone = by_phone
+            self._loading = False
+            if generation == self._generation:
+                self._loaded_at = time.time()
+
+    def _fetch(self, supabase_admin):
+        by_phone = {}
+        start = 0
+        while True:
+            page = supabase_admin.table("users_meta").select(DIRECTORY_FIELDS) \
+                .order("user_id").range(start, start + self.page_size - 1).execute().data or []
+            for r in page:
+                if r.get("phone") and r.get("email"):
+                    by_phone[str(r["phone"]).strip()] = r["email"]
+            if len(page) < self.page_size:
+                return by_phone
+            start += self.page_size
+
+    def email_for_phone(self, supabase_admin, phone):
+        phone = str(phone).strip()
+        try:
+            self.ensure_fresh(supabase_admin)
+            email = self._by_phone.get(phone)
+            if email:
+                return email
+        except Exception as e:
+            print("⚠️ user directory reload failed, querying users_meta directly:", e)
+        # miss: not loaded yet or created since the last load
+        res = supabase_admin.table("users_meta").select("email").eq("phone", phone).limit(1).execute()
+        return res.data[0].get("email") if res.data else None
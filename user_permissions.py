@@ -0,0 +1,164 @@
+# user_permissions.py
+"""Grant / revoke permission deltas across many users at once.
+
+A delta names a permission with the same strings the permission checkboxes
+post:
+
+    "page"                    page access
+    "page:feature"            a feature on that page (implies the page)
+    "page:feature:sub"        a sub-option of that feature (implies both)
+
+For every selected user the revokes are applied first, then the grants, so
+"only feature X on this page" is `revoke: ["page"], grant: ["page:X"]`.
+Revoking a page removes its features too; revoking a feature leaves the
+page access in place.
+
+Users whose permissions come out identical are written with one
+`update(...).in_("user_id", ids)`. A crew usually starts with the same
+permissions, so 100 users normally cost one read and a handful of updates
+instead of 100 edit_user round trips. Users the delta does not change are
+not written at all.
+"""
+import json
+
+MAX_DELTAS = 200
+MAX_USERS = 5000
+CHUNK_SIZE = 200       # ids per in_() filter, keeps request URLs short
+PAGE_SIZE = 1000       # PostgREST's default row cap
+PERMISSION_FIELDS = "user_id, accesses, feature_accesses"
+
+
+def parse_permission(token):
+    """'page[:feature[:sub]]' -> tuple of 1-3 parts. Raises ValueError."""
+    parts = tuple(p.strip() for p in str(token or "").split(":"))
+    if not 1 <= len(parts) <= 3 or not all(parts):
+        raise ValueError(f"Invalid permission {token!r} (use page, page:feature or page:feature:sub)")
+    return parts
+
+
+def parse_deltas(body):
+    """(grants, revokes) from a request body. Raises ValueError."""
+    body = body or {}
+    out = []
+    for key in ("grant", "revoke"):
+        raw = body.get(key) or []
+        if not isinstance(raw, list):
+            raise ValueError(f"{key} must be a list")
+        out.append([parse_permission(t) for t in raw])
+    grants, revokes = out
+    if not grants and not revokes:
+        raise ValueError("Nothing to grant or revoke")
+    if len(grants) + len(revokes) > MAX_DELTAS:
+        raise ValueError(f"At most {MAX_DELTAS} permissions per request")
+    both = set(grants) & set(revokes)
+    if both:
+        raise ValueError(f"Both granted and revoked: {', '.join(':'.join(p) for p in sorted(both))}")
+    return grants, revokes
+
+
+def apply_deltas(accesses, feature_accesses, grants, revokes):
+    """New (accesses, feature_accesses) for one user; the inputs are not modified."""
+    pages = list(accesses or [])
+    features = {page: {f: list(subs or []) for f, subs in (feats or {}).items()}
+                for page, feats in (feature_accesses or {}).items()}
+
+    for parts in revokes:
+        page = parts[0]
+        if len(parts) == 1:
+            pages = [p for p in pages if p != page]
+            features.pop(page, None)
+        elif len(parts) == 2:
+            features.get(page, {}).pop(parts[1], None)
+        else:
+            subs = features.get(page, {}).get(parts[1])
+            if subs is not None:
+                features[page][parts[1]] = [s for s in subs if s != parts[2]]
+
+    for parts in grants:
+        page = parts[0]
+        if page not in pages:
+            pages.append(page)
+        feats = features.setdefault(page, {})
+        if len(parts) >= 2:
+            subs = feats.setdefault(parts[1], [])
+            if len(parts) == 3 and parts[2] not in subs:
+                subs.append(parts[2])
+
+    return pages, features
+
+
+def _key(accesses, feature_accesses):
+    return json.dumps([sorted(accesses), feature_accesses], sort_keys=True)
+
+
+def plan_updates(rows, grants, revokes):
+    """Group users by their resulting permissions.
+
+    Returns (groups, unchanged_ids); each group is
+    {"accesses", "feature_accesses", "user_ids"}.
+    """
+    groups, unchanged = {}, []
+    for row in rows:
+        old = _key(row.get("accesses") or [], row.get("feature_accesses") or {})
+        accesses, features = apply_deltas(row.get("accesses"), row.get("feature_accesses"), grants, revokes)
+        new = _key(accesses, features)
+        if new == old:
+            unchanged.append(row["user_id"])
+            continue
+        group = groups.setdefault(new, {"accesses": accesses, "feature_accesses": features, "user_ids": []})
+        group["user_ids"].append(row["user_id"])
+    return list(groups.values()), unchanged
+
+
+def load_users_by_ids(supabase_admin, user_ids, chunk_size=CHUNK_SIZE):
+    """users_meta rows (PERMISSION_FIELDS) for `user_ids`, selected in chunks."""
+    rows = []
+    for i in range(0, len(user_ids), chunk_size):
+        rows.extend(supabase_admin.table("users_meta").select(PERMISSION_FIELDS)
+                    .in_("user_id", user_ids[i:i + chunk_size]).execute().data or [])
+    return rows
+
+
+def load_users_by_filter(supabase_admin, apply_filter, max_users=MAX_USERS, page_size=PAGE_SIZE):
+    """users_meta rows matching `apply_filter(query)`, paged with .range().
+
+    Raises ValueError when more than `max_users` match (checked with an
+    exact count before anything is changed).
+    """
+    rows, start, total = [], 0, None
+    while True:
+        first = start == 0
+        query = supabase_admin.table("users_meta").select(PERMISSION_FIELDS, count="exact" if first else None)
+        res = apply_filter(query).order("user_id").range(start, start + page_size - 1).execute()
+        if first:
+            total = res.count
+            if total is not None and total > max_users:
+                raise ValueError(f"Filter matches {total} users; at most {max_users} per request")
+        page = res.data or []
+        rows.extend(page)
+        start += page_size
+        if len(page) < page_size or (total is not None and start >= total):
+            return rows
+
+
+def apply_to_users(supabase_admin, rows, grants, revokes, chunk_size=CHUNK_SIZE):
+    """Write the deltas for `rows` (users_meta rows with PERMISSION_FIELDS).
+
+    Returns {"updated": [...], "unchanged": [...], "failed": [{"user_ids", "error"}]}.
+    """
+    groups, unchanged = plan_updates(rows, grants, revokes)
+    updated, failed = [], []
+    for group in groups:
+        ids = group["user_ids"]
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            try:
+                supabase_admin.table("users_meta").update({
+                    "accesses": group["accesses"],
+                    "feature_accesses": group["feature_accesses"],
+                }).in_("user_id", chunk).execute()
+            except Exception as e:
+                failed.append({"user_ids": chunk, "error": str(e)})
+                continue
+            updated.extend(chunk)
+    return {"updated": updated, "unchanged": unchanged, "failed": failed}
@@ -0,0 +1,282 @@
+# user_provisioning.py
+"""Bulk user provisioning from a CSV upload, run as a resumable job.
+
+Pipeline for one upload:
+  1. every CSV row is validated up front (services.prepare_user); bad rows
+     fail immediately, the rest are "pending"
+  2. Supabase Auth accounts are created on a bounded thread pool, throttled
+     to PROVISION_RATE calls per second (the Auth admin API rate-limits)
+  3. users_meta rows are inserted in batches of `insert_batch`; a rejected
+     batch is retried row by row, and a row that still fails has its Auth
+     account removed again so nothing is left orphaned
+  4. the results CSV (user_id, email, generated_password, status, error) is
+     streamed from the job record
+
+The job record (JSON in PROVISION_JOB_DIR) is saved after every Auth
+account, so a job interrupted by a restart can be resumed: rows that
+already have an Auth account skip straight to the users_meta insert.
+
+Passwords in the record are kept no longer than needed:
+  - a row's password is removed as soon as its Auth account is created
+    (or creation fails); only rows still waiting for Auth keep one, so
+    the job can be resumed
+  - a generated password is kept only for a row that was created, and
+    only until the results CSV has been downloaded
+  - records expire after the JobStore TTL, checked on every read too
+"""
+import csv
+import io
+import os
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from export_jobs import STATUS_DONE, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, JobStore
+from services import create_auth_user, prepare_user
+
+ROW_PENDING = "pending"
+ROW_AUTH_CREATED = "auth_created"
+ROW_CREATED = "created"
+ROW_FAILED = "failed"
+
+MAX_ROWS = 5000
+RESULT_COLUMNS = ["user_id", "email", "generated_password", "status", "error"]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def read_user_rows(text_stream):
+    """CSV -> list of raw dicts (accesses split on commas). Raises ValueError if too large."""
+    rows = []
+    for row in csv.DictReader(text_stream):
+        row["accesses"] = [x.strip() for x in (row.get("accesses") or "").split(",") if x.strip()]
+        rows.append(row)
+        if len(rows) > MAX_ROWS:
+            raise ValueError(f"At most {MAX_ROWS} users per upload")
+    return rows
+
+
+class UserProvisioner:
+    def __init__(self, job_dir, workers=4, rate=5.0, insert_batch=100, max_jobs=1, stale_after=120):
+        self.store = JobStore(job_dir)
+        self.workers = workers
+        self.rate = rate
+        self.insert_batch = insert_batch
+        self.stale_after = stale_after
+        self._jobs = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="provision")
+        self._running = set()
+        self._lock = threading.Lock()
+
+    # ---------- public API ----------
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def submit(self, supabase_admin, raw_rows, requested_by=None, after=None):
+        """Validate `raw_rows`, record the job and start it; `after(job)` runs when it ends."""
+        rows, emails = [], set()
+        for i, raw in enumerate(raw_rows, start=1):
+            entry = {"row": i, "user_id": raw.get("user_id") or "", "email": (raw.get("email") or "").strip(),
+                     "status": ROW_PENDING, "error": None, "auth_id": None}
+            try:
+                meta, password, generated = prepare_user(raw)
+                if meta["email"].lower() in emails:
+                    raise ValueError(f"Duplicate email in file: {meta['email']}")
+                emails.add(meta["email"].lower())
+                entry.update(meta=meta, password=password, generated_password=generated)
+            except Exception as e:
+                entry.update(status=ROW_FAILED, error=str(e))
+            rows.append(entry)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": "provision_users",
+            "status": STATUS_QUEUED,
+            "rows": rows,
+            "error": None,
+            "downloaded": False,
+            "requested_by": requested_by,
+            "created_at": time.time(),
+        }
+        self.store.save(job)
+        self.store.prune()
+        self._start(job, supabase_admin, after)
+        return job
+
+    def resume(self, job_id, supabase_admin, after=None):
+        """Restart an interrupted job; returns the record (None if unknown, unchanged if not resumable)."""
+        job = self.get(job_id)
+        if not job or not self.resumable(job):
+            return job
+        job["status"] = STATUS_QUEUED
+        job["error"] = None
+        self.store.save(job)
+        self._start(job, supabase_admin, after)
+        return job
+
+    def resumable(self, job):
+        if job["id"] in self._running:
+            return False
+        if job["status"] == STATUS_FAILED:
+            return True
+        # a job whose worker died stops updating its record
+        return job["status"] in (STATUS_QUEUED, STATUS_RUNNING) and \
+            time.time() - job.get("updated_at", 0) > self.stale_after
+
+    def results_csv(self, job):
+        """Yield the results CSV line by line, then forget the generated passwords it showed."""
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(RESULT_COLUMNS)
+        for r in job["rows"]:
+            writer.writerow([r.get("user_id"), r.get("email"),
+                             r.get("generated_password") if r["status"] == ROW_CREATED else "",
+                             r["status"], r.get("error") or ""])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        # finished rows' generated passwords are handed out once; rows still
+        # pending (an interrupted job) keep theirs for the resume
+        shown = [r for r in job["rows"] if r["status"] in (ROW_CREATED, ROW_FAILED) and "generated_password" in r]
+        for r in shown:
+            r.pop("generated_password", None)
+        if job["status"] == STATUS_DONE:
+            job["downloaded"] = True
+        if shown or job.get("downloaded"):
+            self.store.save(job)
+
+    # ---------- worker ----------
+    def _start(self, job, supabase_admin, after=None):
+        with self._lock:
+            self._running.add(job["id"])
+        self._jobs.submit(self._run, job, supabase_admin, after)
+
+    def _run(self, job, supabase_admin, after=None):
+        lock = threading.Lock()
+        job["status"] = STATUS_RUNNING
+        self.store.save(job)
+        try:
+            self._create_auth_users(job, supabase_admin, lock)
+            self._insert_meta(job, supabase_admin)
+            job["status"] = STATUS_DONE
+        except Exception as e:
+            print("❌ provisioning job failed:", job["id"], e, traceback.format_exc())
+            job["status"] = STATUS_FAILED
+            job["error"] = str(e)
+        finally:
+            with self._lock:
+                self._running.discard(job["id"])
+        self.store.save(job)
+        # failed jobs may have created some users too
+        if after:
+            try:
+                after(job)
+            except Exception as e:
+                print("⚠️ provisioning after-hook failed:", job["id"], e)
+
+    def _create_auth_users(self, job, supabase_admin, lock):
+        limiter = RateLimiter(self.rate)
+        pending = [r for r in job["rows"] if r["status"] == ROW_PENDING]
+
+        def create(entry):
+            limiter.wait()
+            try:
+                auth_id = create_auth_user(supabase_admin, entry["meta"], entry["password"])
+                update = {"status": ROW_AUTH_CREATED, "auth_id": auth_id}
+            except Exception as e:
+                update = {"status": ROW_FAILED, "error": f"auth: {e}"}
+            with lock:
+                entry.update(update)
+                entry.pop("password", None)
+                if entry["status"] == ROW_FAILED:
+                    entry.pop("generated_password", None)
+                self.store.save(job)   # an Auth account must never be lost on restart
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="provision-auth") as pool:
+            list(pool.map(create, pending))
+
+    def _insert_meta(self, job, supabase_admin):
+        ready = [r for r in job["rows"] if r["status"] == ROW_AUTH_CREATED]
+        for i in range(0, len(ready), self.insert_batch):
+            chunk = ready[i:i + self.insert_batch]
+            try:
+                supabase_admin.table("users_meta").insert(
+                    [dict(r["meta"], auth_id=r["auth_id"]) for r in chunk]).execute()
+                for r in chunk:
+                    r["status"] = ROW_CREATED
+            except Exception:
+                for r in chunk:
+                    self._insert_one(supabase_admin, r)
+            self.store.save(job)
+
+    @staticmethod
+    def _insert_one(supabase_admin, entry):
+        try:
+            supabase_admin.table("users_meta").insert(dict(entry["meta"], auth_id=entry["auth_id"])).execute()
+            entry["status"] = ROW_CREATED
+        except Exception as e:
+            entry.update(status=ROW_FAILED, error=f"users_meta: {e}")
+            entry.pop("generated_password", None)
+            try:
+                if entry.get("auth_id"):
+                    supabase_admin.auth.admin.delete_user(entry["auth_id"])
+            except Exception as cleanup_error:
+                entry["error"] += f" (auth user {entry['auth_id']} not removed: {cleanup_error})"
+
+
+def job_view(job):
+    """Public shape of a provisioning job (no passwords)."""
+    counts = {}
+    for r in job["rows"]:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    total = len(job["rows"])
+    finished = counts.get(ROW_CREATED, 0) + counts.get(ROW_FAILED, 0)
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "total": total,
+        "created": counts.get(ROW_CREATED, 0),
+        "failed": counts.get(ROW_FAILED, 0),
+        "progress": round(finished / total, 3) if total else 1.0,
+        "errors": [{"row": r["row"], "email": r["email"], "error": r["error"]}
+                   for r in job["rows"] if r["status"] == ROW_FAILED][:50],
+        "error": job.get("error"),
+        "downloaded": job.get("downloaded", False),
+    }
+
+
+def create_user_provisioner():
+    """Build from env (PROVISION_JOB_DIR, PROVISION_WORKERS, PROVISION_RATE, PROVISION_INSERT_BATCH)."""
+    job_dir = os.getenv("PROVISION_JOB_DIR") or os.path.join(tempfile.gettempdir(), "pnm_provision_jobs")
+    try:
+        workers = max(int(os.getenv("PROVISION_WORKERS", "4")), 1)
+    except Exception:
+        workers = 4
+    try:
+        rate = float(os.getenv("PROVISION_RATE", "5"))
+    except Exception:
+        rate = 5.0
+    try:
+        batch = max(int(os.getenv("PROVISION_INSERT_BATCH", "100")), 1)
+    except Exception:
+        batch = 100
+    return UserProvisioner(job_dir, workers=workers, rate=rate, insert_batch=batch)
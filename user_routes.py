@@ -14,9 +14,17 @@ from flask import Blueprint, render_template, current_app, jsonify, request, ses
 import csv
 import io
 
-from services import require_role
-import openpyxl
-from openpyxl.styles import Border, Side, Alignment, Font
+from services import require_feature, require_role, summarize
+from xlsx_export import XLSX_MIMETYPE, write_xlsx, xlsx_response
+from export_jobs import export_kind, table_version, track_progress, write_csv
+from asset_lookup import apply_asset_writes, request_loader
+from spares_stats import invalidate_spares_stats
+from delta_sync import fetch_delta, fetch_spares_delta, new_cursor
+from row_serializer import serialize_user_spare
+from push_dispatch import notify_spares_event
+from spares_bulk import parse_ids, parse_patch, bulk_update_spares
+from ref_sequence import RefAllocationError
+from asset_patch import apply_edit, apply_edits, parse_edits, single_edit
 
 # Blueprint (no prefix here; app.py registers under `/user`)
 user_bp = Blueprint("user", __name__)
@@ -153,53 +161,95 @@ def user_module_page(module_name):
 
 
 # ---------------- Asset endpoints ----------------
+USER_ASSET_FIELDS = "id, asset_code, asset_description, reg_no, package, activity, last_updated_at"
+
+
 @user_bp.route("/get_assets")
 @require_role("user")
 def user_get_assets():
-    """Return a lightweight list of assets for client dropdowns."""
+    """Return a lightweight list of assets for client dropdowns (?since=<cursor> for a delta)."""
     supabase_admin = current_app.config.get("supabase_admin")
     try:
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
-        res = supabase_admin.table("asset_master").select("*").execute()
-        rows = res.data or []
-        out = []
-        for r in rows:
-            out.append({
-                "id": r.get("id"),
-                "asset_code": r.get("asset_code"),
-                "asset_description": r.get("asset_description"),
-                "reg_no": r.get("reg_no"),
-                "package": r.get("package"),
-                "activity": r.get("activity"),
-            })
-        return jsonify(out), 200
+        since = request.args.get("since")
+        if since:
+            try:
+                rows, deleted, full, cursor = fetch_delta(supabase_admin, "asset_master", since, select=USER_ASSET_FIELDS)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"cursor": cursor, "changed": rows, "deleted": deleted, "full": full}), 200
+
+        cursor = new_cursor()
+        res = supabase_admin.table("asset_master").select(USER_ASSET_FIELDS).execute()
+        resp = jsonify(res.data or [])
+        resp.headers["X-Sync-Cursor"] = cursor
+        return resp, 200
     except Exception as e:
         current_app.logger.error("user_get_assets error: %s\n%s", e, traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
 
+@user_bp.route("/update_asset/<asset_id>", methods=["POST", "PATCH"])
+@require_role("user")
+@require_feature("user_asset_master", "inline_edit")
+def user_update_asset(asset_id):
+    """Edit one asset: {"changes": {...}, "version": <last_updated_at>} (see asset_patch.py)."""
+    supabase_admin = current_app.config["supabase_admin"]
+    try:
+        changes, version = single_edit(request.get_json(silent=True))
+        if not changes:
+            return jsonify({"success": False, "error": "No data provided"}), 400
+
+        result = apply_edit(supabase_admin, asset_id, changes, version, actor=session.get("name"))
+        if result["ok"]:
+            apply_asset_writes([result["row"]])
+            return jsonify({"success": True, "row": result["row"]}), 200
+        status = 409 if result.get("conflict") else 404 if result["error"] == "Asset not found" else 400
+        return jsonify(dict(result, success=False)), status
+    except Exception as e:
+        current_app.logger.error("user_update_asset error: %s\n%s", e, traceback.format_exc())
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@user_bp.route("/assets", methods=["PATCH"])
+@require_role("user")
+@require_feature("user_asset_master", "inline_edit")
+def user_patch_assets():
+    """Batched field-level edits: {"edits": [{"id", "version", "changes"}]}."""
+    supabase_admin = current_app.config["supabase_admin"]
+    try:
+        edits = parse_edits(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        results, rows = apply_edits(supabase_admin, edits, actor=session.get("name"))
+        if rows:
+            apply_asset_writes(rows)
+        return jsonify(summarize(results)), 200
+    except Exception as e:
+        current_app.logger.error("user_patch_assets error: %s\n%s", e, traceback.format_exc())
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 # ---------------- Dropdown config ----------------
 @user_bp.route("/dropdown_config", methods=["GET"])
 @require_role("user")
 def user_get_dropdown_config():
     supabase_admin = current_app.config.get("supabase_admin")
     try:
-        # Return cached dropdown config from session if present and not explicitly refreshed
-        if request.args.get('refresh') != '1' and session.get('dropdown_config'):
-            return jsonify(session.get('dropdown_config')), 200
-
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
-        # retry transient network errors when fetching dropdown config
+        cache = current_app.config["DROPDOWN_CACHE"]
+        force = request.args.get('refresh') == '1'
+        # retry transient network errors when (re)loading dropdown config
         retries = int(current_app.config.get('SUPABASE_HTTP_RETRIES', 3))
         backoff = 1.0
-        result = None
         last_exc = None
         from httpx import ConnectTimeout
         for attempt in range(1, retries + 1):
             try:
-                result = supabase_admin.table("dropdown_config").select("*").execute()
+                version, grouped = cache.grouped(supabase_admin, force=force)
                 break
             except ConnectTimeout as ct:
                 last_exc = ct
@@ -212,23 +262,16 @@ def user_get_dropdown_config():
                 import time
                 time.sleep(backoff)
                 backoff *= 2
-
-        if result is None:
+        else:
             raise last_exc or RuntimeError("Failed to fetch dropdown_config")
-        data = sorted(result.data or [], key=lambda x: (x.get("list_name", ""), x.get("value", "")))
-        grouped = {}
-        for row in data:
-            name = row.get("list_name") or "default"
-            grouped.setdefault(name, []).append(row.get("value"))
 
-        # Cache the grouped config in session so subsequent page loads don't hit Supabase
-        try:
-            session['dropdown_config'] = grouped
-        except Exception:
-            # if session storage fails for any reason, continue without caching
-            current_app.logger.warning("Could not cache dropdown_config in session")
-
-        return jsonify(grouped), 200
+        # shared versioned cache: unchanged config is answered with 304
+        if not force and request.if_none_match.contains(version):
+            return "", 304, {"ETag": f'"{version}"'}
+        resp = jsonify(grouped)
+        resp.set_etag(version)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp, 200
     except Exception as e:
         current_app.logger.error("user_dropdown_config GET error: %s\n%s", e, traceback.format_exc())
         return jsonify({"error": str(e)}), 500
@@ -249,11 +292,26 @@ def user_spares_page():
 @user_bp.route("/get_spares")
 @require_role("user")
 def user_get_spares():
+    """Full list, or with ?since=<cursor> only the rows changed/deleted since then."""
     supabase_admin = current_app.config.get("supabase_admin")
     try:
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
 
+        since = request.args.get("since")
+        if since:
+            try:
+                rows, deleted, full, cursor = fetch_spares_delta(supabase_admin, since)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({
+                "cursor": cursor,
+                "changed": [serialize_user_spare(r) for r in rows],
+                "deleted": deleted,
+                "full": full,
+            }), 200
+
+        cursor = new_cursor()
         # Prefer ordering by created_at; fallback to local sort by id
         try:
             res = supabase_admin.table("spares_requirements").select("*").order("created_at", desc=True).execute()
@@ -267,41 +325,9 @@ def user_get_spares():
             except Exception:
                 pass
 
-        out = []
-        for r in rows:
-            created_raw = r.get("created_at")
-            updated_raw = r.get("last_updated_at") or r.get("status_updated_at")
-            expected_raw = r.get("expected_date")
-
-            out.append({
-                "id": r.get("id"),
-                "ref_no": r.get("ref_no"),
-                "status": r.get("status"),
-                "priority": r.get("priority"),
-                "for_type": r.get("for_type"),
-                "asset_code": r.get("asset_code"),
-                "asset_description": r.get("asset_description"),
-                "asset_display": (r.get("asset_code") or "") + (" - " + r.get("asset_description") if r.get("asset_description") else ""),
-                "spares_req": r.get("spares_req"),
-                "qty_required": r.get("qty_required"),
-                "qty_available": r.get("qty_available"),
-                "required_by": r.get("required_by"),
-                "requisition": r.get("requisition") or r.get("created_by") or r.get("requested_by"),
-                "actioner": r.get("actioner"),
-                "current_status": r.get("current_status"),
-                "dc_required": r.get("dc_required", False),
-                "dc_number": r.get("dc_number"),
-                "expected_date": expected_raw,
-                "closed": r.get("closed", False),
-                # iso/time fields
-                "created_at_iso": _to_iso(created_raw),
-                "last_updated_at_iso": _to_iso(updated_raw),
-                "expected_date_iso": _to_iso(expected_raw),
-                # display strings (IST)
-                "created_at": _format_dt_to_ist_string(created_raw) or (r.get("created_at") or ""),
-                "last_updated_at": _format_dt_to_ist_string(updated_raw) or (r.get("last_updated_at") or ""),
-            })
-        return jsonify(out), 200
+        resp = jsonify([serialize_user_spare(r) for r in rows])
+        resp.headers["X-Sync-Cursor"] = cursor
+        return resp, 200
     except Exception as e:
         current_app.logger.error("user_get_spares error: %s\n%s", e, traceback.format_exc())
         return jsonify({"error": str(e)}), 500
@@ -313,14 +339,23 @@ def user_create_spare():
     supabase_admin = current_app.config.get("supabase_admin")
     data = request.get_json() or {}
     try:
-        if not data.get("ref_no") or not data.get("spares_req"):
-            return jsonify({"success": False, "error": "ref_no and spares_req are required"}), 400
+        if not data.get("spares_req"):
+            return jsonify({"success": False, "error": "spares_req is required"}), 400
 
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
 
+        # ref_no always comes from the block allocator so concurrent creators can't collide
+        ref_no = current_app.config["SPARES_REFS"].next_ref(supabase_admin)
+
+        # fill the description from asset master instead of trusting the client
+        if data.get("asset_code") and not data.get("asset_description"):
+            asset = request_loader().get(data.get("asset_code"))
+            if asset:
+                data["asset_description"] = asset.get("asset_description")
+
         base = {
-            "ref_no": data.get("ref_no"),
+            "ref_no": ref_no,
             "status": data.get("status") or "Active",
             "priority": data.get("priority"),
             "for_type": data.get("for_type"),
@@ -343,9 +378,9 @@ def user_create_spare():
         }
 
         # try insert, if DB schema lacks optional columns retry without them
+        body = {"success": True, "ref_no": ref_no}
         try:
             supabase_admin.table("spares_requirements").insert(base).execute()
-            return jsonify({"success": True}), 201
         except Exception as ex_insert:
             current_app.logger.warning("create_spare initial insert failed: %s — retrying without optional fields", ex_insert)
             # remove commonly optional/absent fields and retry
@@ -353,13 +388,25 @@ def user_create_spare():
                 base.pop(optional, None)
             try:
                 supabase_admin.table("spares_requirements").insert(base).execute()
-                return jsonify({"success": True, "warning": "insert retried without some optional fields"}), 201
+                body["warning"] = "insert retried without some optional fields"
             except Exception as ex_retry:
                 current_app.logger.error("create_spare retry failed: %s\n%s", ex_retry, traceback.format_exc())
                 return jsonify({"success": False, "error": str(ex_retry)}), 500
 
+        # the row exists now: hooks run once, outside the insert/retry path,
+        # and a failing hook must not turn the create into an error
+        try:
+            invalidate_spares_stats()
+            notify_spares_event("created", ref_no=ref_no)
+        except Exception as ex_hook:
+            current_app.logger.warning("create_spare post-insert hooks failed: %s", ex_hook)
+        return jsonify(body), 201
+
     except ValueError:
         return jsonify({"success": False, "error": "Invalid numeric value"}), 400
+    except RefAllocationError as e:
+        current_app.logger.error("user_create_spare error: %s", e)
+        return jsonify({"success": False, "error": "Could not assign a reference number, please try again"}), 503
     except Exception as e:
         current_app.logger.error("user_create_spare error: %s\n%s", e, traceback.format_exc())
         return jsonify({"success": False, "error": str(e)}), 500
@@ -372,15 +419,8 @@ def user_get_spares_next_ref():
     try:
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
-        res = supabase_admin.table("spares_requirements").select("ref_no").order("id", desc=True).limit(1).execute()
-        if res.data and len(res.data) > 0:
-            last_ref = res.data[0].get("ref_no") or ""
-            try:
-                next_num = str(int(last_ref) + 1).zfill(4)
-            except Exception:
-                next_num = "0001"
-        else:
-            next_num = "0001"
+        # preview only; the number is assigned when the spare is created
+        next_num = current_app.config["SPARES_REFS"].peek(supabase_admin)
         return jsonify({"next_ref": next_num}), 200
     except Exception as e:
         current_app.logger.error("user_get_spares_next_ref error: %s\n%s", e, traceback.format_exc())
@@ -395,20 +435,14 @@ def user_get_spares_counts():
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
 
-        active_q = supabase_admin.table("spares_requirements").select("id", count="exact").eq("status", "Active").execute()
-        pending_q = supabase_admin.table("spares_requirements").select("id", count="exact").eq("status", "Pending").execute()
-        total_q = supabase_admin.table("spares_requirements").select("id", count="exact").execute()
-
-        def _count(q):
-            if hasattr(q, "count") and q.count is not None:
-                return q.count
-            return len(q.data or [])
+        stats = current_app.config["SPARES_STATS"].get(supabase_admin)
+        by_status = stats["by_status"]
 
         return jsonify({
             "counts": {
-                "active": _count(active_q),
-                "pending": _count(pending_q),
-                "total": _count(total_q),
+                "active": by_status.get("Active", 0),
+                "pending": by_status.get("Pending", 0),
+                "total": stats["total"],
             },
             "updated_at": datetime.utcnow().isoformat(),
         }), 200
@@ -417,6 +451,18 @@ def user_get_spares_counts():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# Fields a user may change on a spare (single and bulk update)
+USER_SPARE_FIELDS = {"current_status", "dc_required", "dc_number", "priority", "status", "remarks", "expected_date", "qty_required", "qty_available"}
+
+
+def _user_spare_patch(data):
+    payload = {k: data.get(k) for k in data.keys() if k in USER_SPARE_FIELDS}
+
+    payload["last_updated_at"] = datetime.utcnow().isoformat()
+    payload["last_updated_by"] = session.get("name", session.get("user"))
+    return payload
+
+
 @user_bp.route("/update_spare/<int:spare_id>", methods=["POST"])
 @require_role("user")
 def user_update_spare(spare_id):
@@ -426,13 +472,11 @@ def user_update_spare(spare_id):
         if not supabase_admin:
             raise RuntimeError("supabase_admin not configured")
 
-        allowed = {"current_status", "dc_required", "dc_number", "priority", "status", "remarks", "expected_date", "qty_required", "qty_available"}
-        payload = {k: data.get(k) for k in data.keys() if k in allowed}
-
-        payload["last_updated_at"] = datetime.utcnow().isoformat()
-        payload["last_updated_by"] = session.get("name", session.get("user"))
+        payload = _user_spare_patch(data)
 
-        supabase_admin.table("spares_requirements").update(payload).eq("id", spare_id).execute()
+        res = supabase_admin.table("spares_requirements").update(payload).eq("id", spare_id).execute()
+        invalidate_spares_stats()
+        notify_spares_event("closed" if payload.get("status") == "Closed" else "updated", spare_id=spare_id, rows=res.data)
         return jsonify({"success": True}), 200
     except Exception as e:
         current_app.logger.error("user_update_spare error: %s\n%s", e, traceback.format_exc())
@@ -453,13 +497,71 @@ def user_close_spare(spare_id):
             "last_updated_at": datetime.utcnow().isoformat(),
             "last_updated_by": session.get("name", session.get("user")),
         }
-        supabase_admin.table("spares_requirements").update(payload).eq("id", spare_id).execute()
+        res = supabase_admin.table("spares_requirements").update(payload).eq("id", spare_id).execute()
+        invalidate_spares_stats()
+        notify_spares_event("closed", spare_id=spare_id, rows=res.data)
         return jsonify({"success": True}), 200
     except Exception as e:
         current_app.logger.error("user_close_spare error: %s\n%s", e, traceback.format_exc())
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# ---------------- Spares: bulk actions ----------------
+# Body: {"ids": [..]} (+ "patch": {..} for update). Per-id results, see spares_bulk.py
+@user_bp.route("/bulk_update_spares", methods=["POST"])
+@require_role("user")
+def user_bulk_update_spares():
+    supabase_admin = current_app.config.get("supabase_admin")
+    data = request.get_json() or {}
+    try:
+        ids = parse_ids(data.get("ids"))
+        patch = parse_patch(data.get("patch"), USER_SPARE_FIELDS)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        if not supabase_admin:
+            raise RuntimeError("supabase_admin not configured")
+
+        payload = _user_spare_patch(patch)
+        results, rows = bulk_update_spares(supabase_admin, ids, payload)
+        invalidate_spares_stats()
+        for r in rows:
+            notify_spares_event("closed" if payload.get("status") == "Closed" else "updated", spare_id=r.get("id"), rows=[r])
+        return jsonify(summarize(results)), 200
+    except Exception as e:
+        current_app.logger.error("user_bulk_update_spares error: %s\n%s", e, traceback.format_exc())
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@user_bp.route("/bulk_close_spares", methods=["POST"])
+@require_role("user")
+def user_bulk_close_spares():
+    supabase_admin = current_app.config.get("supabase_admin")
+    data = request.get_json() or {}
+    try:
+        ids = parse_ids(data.get("ids"))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
+        if not supabase_admin:
+            raise RuntimeError("supabase_admin not configured")
+
+        payload = {
+            "status": "Closed",
+            "closed": True,
+            "last_updated_at": datetime.utcnow().isoformat(),
+            "last_updated_by": session.get("name", session.get("user")),
+        }
+        results, rows = bulk_update_spares(supabase_admin, ids, payload)
+        invalidate_spares_stats()
+        for r in rows:
+            notify_spares_event("closed", spare_id=r.get("id"), rows=[r])
+        return jsonify(summarize(results)), 200
+    except Exception as e:
+        current_app.logger.error("user_bulk_close_spares error: %s\n%s", e, traceback.format_exc())
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 # =================================================
 # Breakdown report pages + endpoints
 # =================================================
@@ -526,6 +628,58 @@ def get_breakdown_reports():
         return jsonify({"error": str(e)}), 500
 
 
+# ---- STRICT whitelist for breakdown creation (matches DB exactly) ----
+BREAKDOWN_CREATE_FIELDS = {
+    "asset_code",
+    "asset_description",
+    "asset_package",
+    "own_hire",
+    "agency",
+    "breakdown_start",
+    "breakdown_end",
+    "breakdown_type",
+    "breakdown_description",
+    "root_cause",
+    "responsible_person",
+    "expected_commissioned_at",
+    "eip_commissioned_at",
+    "downtime_hrs",
+    "reported_by",
+    "remarks",
+    "location",
+}
+
+BREAKDOWN_REQUIRED_FIELDS = ("asset_code", "breakdown_start")
+
+BREAKDOWN_TIMESTAMP_FIELDS = (
+    "breakdown_start",
+    "breakdown_end",
+    "expected_commissioned_at",
+    "eip_commissioned_at",
+)
+
+
+def _build_breakdown_insert(data, actor, now_utc):
+    """Whitelist + normalize one new breakdown (IST input → UTC). Raises ValueError on bad dates."""
+    payload = {k: data.get(k) for k in BREAKDOWN_CREATE_FIELDS if k in data}
+
+    # ---- Normalize own_hire to satisfy DB CHECK constraint ----
+    if payload.get("own_hire"):
+        payload["own_hire"] = str(payload["own_hire"]).strip().upper()
+
+    # ---- Backend owns timestamps (IST → UTC for DB) ----
+    for f in BREAKDOWN_TIMESTAMP_FIELDS:
+        if payload.get(f):
+            payload[f] = ist_to_utc(payload[f])
+
+    payload["created_at"] = now_utc
+    payload["updated_at"] = now_utc
+    payload["status"] = "Active"
+    payload["reported_by"] = payload.get("reported_by") or actor
+    payload["last_updated_by"] = actor
+    return payload
+
+
 @user_bp.route("/breakdown_reports", methods=["POST"])
 @require_role("user")
 def create_breakdown_report():
@@ -533,71 +687,24 @@ def create_breakdown_report():
     data = request.get_json() or {}
 
     # ---- Required fields (DB truth) ----
-    required = ["asset_code", "breakdown_start"]
-    missing = [f for f in required if not data.get(f)]
+    missing = [f for f in BREAKDOWN_REQUIRED_FIELDS if not data.get(f)]
     if missing:
         return jsonify({
             "success": False,
             "error": f"Missing required fields: {', '.join(missing)}"
         }), 400
 
-    # ---- Normalize own_hire to satisfy DB CHECK constraint ----
-    if data.get("own_hire"):
-        data["own_hire"] = data["own_hire"].strip().upper()
-
-    # ---- STRICT whitelist (matches DB exactly) ----
-    allowed_fields = {
-        "asset_code",
-        "asset_description",
-        "asset_package",
-        "own_hire",
-        "agency",
-        "breakdown_start",
-        "breakdown_end",
-        "breakdown_type",
-        "breakdown_description",
-        "root_cause",
-        "responsible_person",
-        "expected_commissioned_at",
-        "eip_commissioned_at",
-        "downtime_hrs",
-        "reported_by",
-        "remarks",
-        "location",
-    }
-
-    payload = {k: data.get(k) for k in allowed_fields if k in data}
-
-
-
-
-    # ---- Backend owns timestamps (IST → UTC for DB) ----
-    for f in (
-        "breakdown_start",
-        "breakdown_end",
-        "expected_commissioned_at",
-        "eip_commissioned_at",
-    ):
-        if payload.get(f):
-            payload[f] = ist_to_utc(payload[f])
-
-    now_utc = datetime.now(UTC).isoformat()
-
-    payload["created_at"] = now_utc
-    payload["updated_at"] = now_utc
-    payload["status"] = "Active"
-    payload["reported_by"] = payload.get("reported_by") or session.get("name", session.get("user"))
-    payload["last_updated_by"] = session.get("name", session.get("user"))
+    payload = _build_breakdown_insert(
+        data,
+        session.get("name", session.get("user")),
+        datetime.now(UTC).isoformat(),
+    )
 
-    # force agency from asset master (create only)
+    # force agency from asset master (create only; served from the asset lookup cache)
     if not payload.get("agency") and payload.get("asset_code"):
-        am = supabase_admin.table("asset_master") \
-            .select("agency") \
-            .eq("asset_code", payload["asset_code"]) \
-            .single() \
-            .execute()
-        if am.data:
-            payload["agency"] = am.data.get("agency")
+        asset = request_loader().get(payload["asset_code"])
+        if asset:
+            payload["agency"] = asset.get("agency")
 
     # ---- FORCE PAYLOAD TO BE JSON SAFE (MANDATORY) ----
     payload = {k: json_safe(v) for k, v in payload.items()}
@@ -610,29 +717,172 @@ def create_breakdown_report():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# ---------------- Bulk import (CSV / XLSX) ----------------
+def _read_import_rows(file):
+    """Yield (row_number, dict) from an uploaded CSV or XLSX file."""
+    name = (file.filename or "").lower()
+    if name.endswith(".xlsx"):
+        import openpyxl
+        wb = openpyxl.load_workbook(file.stream, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+            for i, values in enumerate(rows, start=2):
+                if values is None or all(v is None or v == "" for v in values):
+                    continue
+                yield i, dict(zip(header, values))
+        finally:
+            wb.close()
+    elif name.endswith(".csv"):
+        stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+        for i, row in enumerate(csv.DictReader(stream), start=2):
+            if not any((v or "").strip() for v in row.values() if isinstance(v, str)):
+                continue
+            yield i, row
+    else:
+        raise ValueError("Only .csv or .xlsx files are allowed")
+
+
+@user_bp.route("/breakdown_reports/import", methods=["POST"])
+@require_role("user")
+def import_breakdown_reports():
+    """Bulk-create breakdowns from a CSV/XLSX upload (form field `file`).
+
+    Rows are validated against BREAKDOWN_CREATE_FIELDS, agencies are resolved
+    with one batched asset lookup, and inserts go out in multi-row batches
+    (`batch_size`, default 200). A failing batch is retried row by row so the
+    report can point at the bad rows. Returns a per-row error report.
+    """
+    supabase_admin = current_app.config.get("supabase_admin")
+    file = request.files.get("file") or request.files.get("csv_file")
+    if not file:
+        return jsonify({"success": False, "error": "No file uploaded"}), 400
+    try:
+        batch_size = max(1, min(int(request.form.get("batch_size") or 200), 1000))
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid batch_size"}), 400
+
+    try:
+        if not supabase_admin:
+            raise RuntimeError("supabase_admin not configured")
+
+        actor = session.get("name", session.get("user"))
+        now_utc = datetime.now(UTC).isoformat()
+        errors, warnings = [], []
+        pending = []  # (row_number, payload)
+        unknown_cols = set()
+
+        for row_no, raw in _read_import_rows(file):
+            data = {}
+            for k, v in raw.items():
+                key = (k or "").strip()
+                if isinstance(v, str):
+                    v = v.strip()
+                if v is None or v == "":
+                    continue
+                if key in BREAKDOWN_CREATE_FIELDS:
+                    data[key] = v
+                elif key:
+                    unknown_cols.add(key)
+
+            missing = [f for f in BREAKDOWN_REQUIRED_FIELDS if not data.get(f)]
+            if missing:
+                errors.append({"row": row_no, "error": f"Missing required fields: {', '.join(missing)}"})
+                continue
+            data["asset_code"] = str(data["asset_code"])
+            try:
+                pending.append((row_no, _build_breakdown_insert(data, actor, now_utc)))
+            except ValueError as ve:
+                errors.append({"row": row_no, "error": str(ve)})
+
+        if unknown_cols:
+            warnings.append(f"Ignored columns: {', '.join(sorted(unknown_cols))}")
+
+        # ---- One batched asset lookup for every code in the file ----
+        loader = request_loader().want(*(p["asset_code"] for _, p in pending))
+        loader.load()
+        rows_ok = []
+        for row_no, payload in pending:
+            asset = loader.get(payload["asset_code"])
+            if not asset:
+                errors.append({"row": row_no, "error": f"Unknown asset_code: {payload['asset_code']}"})
+                continue
+            if not payload.get("agency"):
+                payload["agency"] = asset.get("agency")
+            rows_ok.append((row_no, {k: json_safe(v) for k, v in payload.items()}))
+
+        # ---- Chunked multi-row inserts ----
+        inserted = 0
+        table = supabase_admin.table("breakdown_reports")
+        for i in range(0, len(rows_ok), batch_size):
+            chunk = rows_ok[i:i + batch_size]
+            try:
+                # rows may carry different columns; let missing ones take DB defaults
+                table.insert([p for _, p in chunk], returning="minimal", default_to_null=False).execute()
+                inserted += len(chunk)
+            except Exception as batch_err:
+                current_app.logger.warning("breakdown import batch failed, retrying rows: %s", batch_err)
+                for row_no, p in chunk:
+                    try:
+                        table.insert(p, returning="minimal").execute()
+                        inserted += 1
+                    except Exception as row_err:
+                        errors.append({"row": row_no, "error": str(row_err)})
+
+        errors.sort(key=lambda e: e["row"])
+        return jsonify({
+            "success": not errors,
+            "inserted": inserted,
+            "failed": len(errors),
+            "errors": errors,
+            "warnings": warnings,
+        }), 200 if inserted or not errors else 400
+
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        current_app.logger.error("import_breakdown_reports error: %s\n%s", e, traceback.format_exc())
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+
+def _explain_refused_breakdown_update(supabase_admin, report_id, is_close, end_dt=None, eip_dt=None):
+  """Work out why a conditional update matched no row (slow path only)."""
+  res = supabase_admin.table("breakdown_reports") \
+    .select("status, breakdown_start") \
+    .eq("id", report_id) \
+    .execute()
+  if not res.data:
+    return "Breakdown not found", 404
+  row = res.data[0]
+  if not is_close and row.get("status") == "Closed":
+    return "Closed breakdowns cannot be edited", 400
+  start_dt = _safe_fromiso(row.get("breakdown_start"))
+  if is_close and not start_dt:
+    return "Breakdown Start is missing; cannot close.", 400
+  if is_close:
+    if end_dt <= start_dt:
+      return "Breakdown End Date must be AFTER Breakdown Start.", 400
+    if eip_dt <= start_dt:
+      return "EIP Commission Date must be AFTER Breakdown Start.", 400
+  return "Breakdown was modified concurrently, please reload and retry.", 409
+
 
 @user_bp.route("/breakdown_reports/<int:report_id>", methods=["PUT"])
 @require_role("user")
 def update_breakdown_report(report_id):
+  """Edit or close a breakdown in one conditional UPDATE ... RETURNING.
+
+  The row checks run as filters on the update itself, so there is no
+  read-then-write round trip and no race window:
+    - edits:  status <> 'Closed'
+    - closes: breakdown_start < breakdown_end and < eip_commissioned_at
+  When nothing matches, a follow-up read explains why the update was refused.
+  """
   supabase_admin = current_app.config.get("supabase_admin")
   data = request.get_json() or {}
 
   try:
-    # ---- Fetch existing row ----
-    existing = supabase_admin.table("breakdown_reports") \
-      .select("*") \
-      .eq("id", report_id) \
-      .single() \
-      .execute()
-
-    row = existing.data or {}
-
-    # ---- HARD BLOCK: already closed (allow only CLOSE action) ----
-    if row.get("status") == "Closed" and not (
-        data.get("breakdown_end") and data.get("eip_commissioned_at")
-    ):
-      return jsonify({"error": "Closed breakdowns cannot be edited"}), 400
-
     # ---- Allowed update fields ----
     allowed_fields = {
       "location",
@@ -658,46 +908,27 @@ def update_breakdown_report(report_id):
       payload.get("breakdown_end") and payload.get("eip_commissioned_at")
     )
 
+    end_dt = eip_dt = None
     if is_close_action:
-
-      # Mandatory dates
-      if not payload.get("breakdown_end") or not payload.get("eip_commissioned_at"):
-        return jsonify({
-          "error": "Dates are mandatory to close the breakdown."
-        }), 400
-
       try:
         # ---- Parse datetimes (ALL IN UTC) ----
         now = datetime.now(UTC)
-
-        start_dt = _safe_fromiso(row.get("breakdown_start")).astimezone(UTC)
-        end_dt   = payload.get("breakdown_end")
-        eip_dt   = payload.get("eip_commissioned_at")
-
-        # ---- Logical validations ----
-        if end_dt <= start_dt:
-          return jsonify({
-            "error": "Breakdown End Date must be AFTER Breakdown Start."
-          }), 400
-
-        if eip_dt <= start_dt:
-          return jsonify({
-            "error": "EIP Commission Date must be AFTER Breakdown Start."
-          }), 400
-
-        if end_dt > now:
-          return jsonify({
-            "error": "Breakdown End Date cannot be in the future."
-          }), 400
-
-        if eip_dt > now:
-          return jsonify({
-            "error": "EIP Commission Date cannot be in the future."
-          }), 400
-
+        end_dt = datetime.fromisoformat(payload["breakdown_end"])
+        eip_dt = datetime.fromisoformat(payload["eip_commissioned_at"])
       except Exception:
         return jsonify({"error": "Invalid date format"}), 400
 
+      # ---- Logical validations (start-date checks run in the UPDATE filter) ----
+      if end_dt > now:
+        return jsonify({
+          "error": "Breakdown End Date cannot be in the future."
+        }), 400
+
+      if eip_dt > now:
+        return jsonify({
+          "error": "EIP Commission Date cannot be in the future."
+        }), 400
+
       # ---- Apply CLOSE fields ----
       payload["status"] = "Closed"
       payload["current_status"] = "Breakdown Closed"
@@ -708,10 +939,22 @@ def update_breakdown_report(report_id):
     payload["updated_by"] = session.get("name", session.get("user"))
     payload["updated_at"] = datetime.now(UTC).isoformat()
 
-    supabase_admin.table("breakdown_reports") \
+    query = supabase_admin.table("breakdown_reports") \
       .update(payload) \
-      .eq("id", report_id) \
-      .execute()
+      .eq("id", report_id)
+
+    if is_close_action:
+      # closing is the only change allowed on an already closed breakdown
+      query = query.lt("breakdown_start", min(end_dt, eip_dt).isoformat())
+    else:
+      # HARD BLOCK: already closed (NULL status still counts as open)
+      query = query.or_("status.is.null,status.neq.Closed")
+
+    res = query.execute()
+
+    if not res.data:
+      error, code = _explain_refused_breakdown_update(supabase_admin, report_id, is_close_action, end_dt, eip_dt)
+      return jsonify({"error": error}), code
 
     return jsonify({"success": True}), 200
 
@@ -1036,7 +1279,11 @@ def get_breakdown_dashboard():
 @user_bp.route("/assets_autocomplete")
 @require_role("user")
 def assets_autocomplete():
-    """Simple autocomplete for asset_code -> returns asset_code, asset_description, owner."""
+    """Autocomplete over asset_code / reg_no / description -> asset_code, asset_description, owner.
+
+    Served from the in-process `asset_index` (ranked, no Supabase round trip
+    per keystroke); falls back to the old ilike query if the index is unavailable.
+    """
     supabase_admin = current_app.config.get("supabase_admin")
     q = (request.args.get("q") or "").strip()
     try:
@@ -1044,9 +1291,21 @@ def assets_autocomplete():
             raise RuntimeError("supabase_admin not configured")
         if not q:
             return jsonify([]), 200
-        # use ilike for case-insensitive partial match; limit to 50
-        res = supabase_admin.table("asset_master").select("asset_code, asset_description, owner, package, location").ilike("asset_code", f"%{q}%").limit(50).execute()
-        rows = res.data or []
+
+        index = current_app.config.get("ASSET_INDEX")
+        rows = None
+        if index is not None:
+            try:
+                index.ensure_fresh(supabase_admin)
+                rows = index.search(q, limit=50)
+            except Exception as ex:
+                current_app.logger.warning("asset index unavailable, using ilike: %s", ex)
+
+        if rows is None:
+            # use ilike for case-insensitive partial match; limit to 50
+            res = supabase_admin.table("asset_master").select("asset_code, asset_description, owner, package, location").ilike("asset_code", f"%{q}%").limit(50).execute()
+            rows = res.data or []
+
         out = []
         for r in rows:
             out.append({
@@ -1062,6 +1321,49 @@ def assets_autocomplete():
         return jsonify({"error": str(e)}), 500
 
 
+BREAKDOWN_EXPORT_HEADER = [
+        "id", "asset_code", "asset_description", "asset_package", "own_hire", "agency", "location",
+        "breakdown_start", "breakdown_end", "downtime_hrs", "breakdown_type", "root_cause",
+        "breakdown_description", "status", "current_status", "responsible_person",
+        "expected_commissioned_at", "eip_commissioned_at", "reported_by", "created_by",
+        "updated_by", "created_at", "remarks"
+]
+
+
+def _breakdown_export_rows(rows, now):
+    """Yield one export row (values in BREAKDOWN_EXPORT_HEADER order) per breakdown."""
+    for r in rows:
+        start_raw = r.get("breakdown_start")
+        end_raw   = r.get("breakdown_end")
+
+        downtime = ""
+
+        start_dt = _safe_fromiso(start_raw)
+        end_dt   = _safe_fromiso(end_raw)
+
+        if start_dt:
+            if end_dt:
+                delta = end_dt - start_dt
+            else:
+                delta = now - start_dt
+
+            downtime = round(delta.total_seconds() / 3600, 2)
+
+        yield [
+            r.get("id"), r.get("asset_code"), r.get("asset_description"),
+            r.get("asset_package"), r.get("own_hire"), r.get("agency"), r.get("location"),
+            _to_iso(start_raw), _to_iso(end_raw), downtime,
+            r.get("breakdown_type"), r.get("root_cause"),
+            r.get("breakdown_description"), r.get("status"),
+            r.get("current_status"), r.get("responsible_person"),
+            _to_iso(r.get("expected_commissioned_at")),
+            _to_iso(r.get("eip_commissioned_at")),
+            r.get("reported_by"), r.get("created_by"),
+            r.get("updated_by"), _to_iso(r.get("created_at")),
+            r.get("remarks")
+        ]
+
+
 @user_bp.route("/breakdown_reports/export")
 @require_role("user")
 def export_breakdown_reports():
@@ -1078,51 +1380,9 @@ def export_breakdown_reports():
 
         output = io.StringIO()
         writer = csv.writer(output)
+        writer.writerow(BREAKDOWN_EXPORT_HEADER)
+        writer.writerows(_breakdown_export_rows(rows, now))
 
-        # header
-        header = [
-                "id", "asset_code", "asset_description", "asset_package", "own_hire","agency", "location",
-                "breakdown_start", "breakdown_end", "downtime_hrs", "breakdown_type", "root_cause",
-                "breakdown_description", "status", "current_status", "responsible_person",
-                "expected_commissioned_at", "eip_commissioned_at", "reported_by", "created_by",
-                "updated_by", "created_at", "remarks"
-        ]
-        writer.writerow(header)
-
-        for r in rows:
-                start_raw = r.get("breakdown_start")
-                end_raw   = r.get("breakdown_end")
-
-                downtime = ""
-
-                start_dt = _safe_fromiso(start_raw)
-                end_dt   = _safe_fromiso(end_raw)
-
-                if start_dt:
-                        if end_dt:
-                                delta = end_dt - start_dt
-                        else:
-                                delta = now - start_dt
-
-                        downtime = round(delta.total_seconds() / 3600, 2)
-
-                row_vals = [
-                        r.get("id"), r.get("asset_code"), r.get("asset_description"),
-                        r.get("asset_package"), r.get("own_hire"), r.get("agency"), r.get("location"),
-                        _to_iso(start_raw), _to_iso(end_raw), downtime,
-                        r.get("breakdown_type"), r.get("root_cause"),
-                        r.get("breakdown_description"), r.get("status"),
-                        r.get("current_status"), r.get("responsible_person"),
-                        _to_iso(r.get("expected_commissioned_at")),
-                        _to_iso(r.get("eip_commissioned_at")),
-                        r.get("reported_by"), r.get("created_by"),
-                        r.get("updated_by"), _to_iso(r.get("created_at")),
-                        r.get("remarks")
-                ]
-
-                writer.writerow(row_vals)
-
-        output.seek(0)
         csv_bytes = output.getvalue().encode("utf-8")
         return current_app.response_class(csv_bytes, mimetype="text/csv", headers={"Content-Disposition": "attachment;filename=breakdown_reports.csv"})
 
@@ -1134,7 +1394,11 @@ def export_breakdown_reports():
 @user_bp.route("/breakdown_reports/export_xlsx")
 @require_role("user")
 def export_breakdown_reports_xlsx():
-    """Export all breakdown reports as a formatted Excel file with borders and centered text."""
+    """Export all breakdown reports as a formatted Excel file with borders and centered text.
+
+    Written through the streaming `xlsx_export` engine (write-only workbook,
+    shared named styles, spooled output) so large exports stay flat in memory.
+    """
     supabase_admin = current_app.config.get("supabase_admin")
     try:
         if not supabase_admin:
@@ -1145,88 +1409,36 @@ def export_breakdown_reports_xlsx():
 
         now = datetime.now(IST)
 
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Breakdown Reports"
-
-        header = [
-                "id", "asset_code", "asset_description", "asset_package", "own_hire", "agency", "location",
-                "breakdown_start", "breakdown_end", "downtime_hrs", "breakdown_type", "root_cause",
-                "breakdown_description", "status", "current_status", "responsible_person",
-                "expected_commissioned_at", "eip_commissioned_at", "reported_by", "created_by",
-                "updated_by", "created_at", "remarks"
-        ]
-
-        # write header
-        for c, h in enumerate(header, start=1):
-                cell = ws.cell(row=1, column=c, value=h)
-                cell.font = Font(bold=True)
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        thin = Side(border_style="thin", color="000000")
-        border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-        # write rows
-        for r_idx, r in enumerate(rows, start=2):
-                start_raw = r.get("breakdown_start")
-                end_raw   = r.get("breakdown_end")
-
-                downtime = ""
-
-                start_dt = _safe_fromiso(start_raw)
-                end_dt   = _safe_fromiso(end_raw)
-
-                if start_dt:
-                        if end_dt:
-                                delta = end_dt - start_dt
-                        else:
-                                delta = now - start_dt
-
-                        downtime = round(delta.total_seconds() / 3600, 2)
-
-                vals = [
-                        r.get("id"), r.get("asset_code"), r.get("asset_description"),
-                        r.get("asset_package"), r.get("own_hire"), r.get("agency"), r.get("location"),
-                        _to_iso(start_raw), _to_iso(end_raw), downtime,
-                        r.get("breakdown_type"), r.get("root_cause"),
-                        r.get("breakdown_description"), r.get("status"),
-                        r.get("current_status"), r.get("responsible_person"),
-                        _to_iso(r.get("expected_commissioned_at")),
-                        _to_iso(r.get("eip_commissioned_at")),
-                        r.get("reported_by"), r.get("created_by"),
-                        r.get("updated_by"), _to_iso(r.get("created_at")),
-                        r.get("remarks")
-                ]
-
-                for c_idx, v in enumerate(vals, start=1):
-                        cell = ws.cell(row=r_idx, column=c_idx, value=v)
-                        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=False)
-                        cell.border = border
-
-
-        # auto-size columns (simple heuristic)
-        for i, col in enumerate(ws.columns, start=1):
-            max_length = 0
-            for cell in col:
-                try:
-                    if cell.value:
-                        l = len(str(cell.value))
-                        if l > max_length:
-                            max_length = l
-                except Exception:
-                    pass
-            adjusted_width = (max_length + 2) if max_length > 0 else 12
-            ws.column_dimensions[openpyxl.utils.get_column_letter(i)].width = adjusted_width
-
-        bio = io.BytesIO()
-        wb.save(bio)
-        bio.seek(0)
-        return current_app.response_class(bio.getvalue(), mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers={"Content-Disposition": "attachment;filename=breakdown_reports.xlsx"})
+        out = write_xlsx("Breakdown Reports", BREAKDOWN_EXPORT_HEADER, _breakdown_export_rows(rows, now))
+        return xlsx_response(out, "breakdown_reports.xlsx")
 
     except Exception as e:
         current_app.logger.error("export_breakdown_reports_xlsx error: %s\n%s", e, traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
 
+# ---------------- Breakdown exports (background jobs, see export_jobs.py) ----------------
+def _breakdown_export_version(supabase_admin):
+    # downtime of open breakdowns grows with time, so an artifact is only reused within the hour
+    return f"{table_version(supabase_admin, 'breakdown_reports', 'updated_at')}:{datetime.now(IST):%Y%m%d%H}"
+
+
+def _fetch_breakdowns_for_export(supabase_admin):
+    res = supabase_admin.table("breakdown_reports").select("*").order("id", desc=True).execute()
+    return res.data or []
+
+
+@export_kind("breakdown_csv", role="user", filename="breakdown_reports.csv",
+             mimetype="text/csv", version=_breakdown_export_version)
+def _export_breakdown_csv_job(supabase_admin, fileobj, progress):
+    rows = _fetch_breakdowns_for_export(supabase_admin)
+    values = _breakdown_export_rows(rows, datetime.now(IST))
+    write_csv(fileobj, BREAKDOWN_EXPORT_HEADER, track_progress(values, len(rows), progress))
 
 
+@export_kind("breakdown_xlsx", role="user", filename="breakdown_reports.xlsx",
+             mimetype=XLSX_MIMETYPE, version=_breakdown_export_version)
+def _export_breakdown_xlsx_job(supabase_admin, fileobj, progress):
+    rows = _fetch_breakdowns_for_export(supabase_admin)
+    values = _breakdown_export_rows(rows, datetime.now(IST))
+    write_xlsx("Breakdown Reports", BREAKDOWN_EXPORT_HEADER, track_progress(values, len(rows), progress), fileobj=fileobj)
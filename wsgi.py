@@ -0,0 +1,22 @@
+# wsgi.py
+"""Production entry point: `gunicorn wsgi:app` (settings in gunicorn.conf.py).
+
+With preload_app the module is imported once in the gunicorn master:
+the app, its templates, the feature matrix and the warmed caches are built
+before the workers fork, so every worker starts warm and shares that
+memory copy-on-write. Startup tasks therefore run once per deployment
+instead of once per worker.
+
+Set RUN_STARTUP_TASKS=0 on additional instances of the same deployment.
+"""
+import os
+
+from app import create_app, release_connections, run_startup_tasks
+
+app = create_app()
+
+if os.getenv("RUN_STARTUP_TASKS", "1").lower() not in ("0", "false", "no"):
+    run_startup_tasks(app)
+
+# connections opened above belong to this (master) process
+release_connections(app)
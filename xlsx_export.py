@@ -0,0 +1,146 @@
+# xlsx_export.py
+"""Streaming XLSX writer shared by the export endpoints.
+
+Built on openpyxl's write-only workbook so memory stays flat no matter how
+many rows are exported:
+  - header/body styles are registered once as named styles and shared by
+    every cell (no per-cell Alignment/Border objects)
+  - column widths are measured while rows are written; openpyxl emits the
+    <cols> block before the first row, so the first `width_sample_rows` rows
+    are held back, measured, and then flushed
+  - the finished workbook lands in a SpooledTemporaryFile (RAM for small
+    files, disk for large ones) ready to be streamed back with send_file
+  - openpyxl is imported on first use, not when the routes are imported,
+    so workers that never export do not pay its ~0.4 s import
+
+Usage:
+    export = XlsxExport("Breakdown Reports", header)
+    for values in rows:
+        export.append(values)
+    return xlsx_response(export.close(), "breakdown_reports.xlsx")
+"""
+import tempfile
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+HEADER_STYLE = "pnm_header"
+CELL_STYLE = "pnm_cell"
+
+DEFAULT_WIDTH = 12
+MAX_WIDTH = 60
+
+# Keep workbooks up to this size in memory before spilling to disk
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def _build_named_styles():
+    from openpyxl.styles import Alignment, Border, Font, NamedStyle, Side
+
+    thin = Side(border_style="thin", color="000000")
+    header = NamedStyle(name=HEADER_STYLE)
+    header.font = Font(bold=True)
+    header.alignment = Alignment(horizontal="center", vertical="center")
+
+    cell = NamedStyle(name=CELL_STYLE)
+    cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=False)
+    cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    return header, cell
+
+
+class XlsxExport:
+    """Single-sheet, single-pass XLSX writer. Call `append` per row, then `close`."""
+
+    def __init__(self, title, header, width_sample_rows=500, spool_max_size=SPOOL_MAX_SIZE):
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+
+        self._cell_class = WriteOnlyCell
+        self.wb = Workbook(write_only=True)
+        for style in _build_named_styles():
+            self.wb.add_named_style(style)
+        self.ws = self.wb.create_sheet(title=title)
+        self.spool_max_size = spool_max_size
+        self.rows_written = 0
+
+        self._widths = [0] * len(header)
+        self._sample_limit = max(int(width_sample_rows), 0)
+        self._pending = []
+        self._flushed = False
+
+        self._measure(header)
+        self._pending.append([self._cell(v, HEADER_STYLE) for v in header])
+
+    # ---------- internals ----------
+    def _cell(self, value, style):
+        cell = self._cell_class(self.ws, value=value)
+        cell.style = style
+        return cell
+
+    def _measure(self, values):
+        widths = self._widths
+        for i, v in enumerate(values):
+            if v is None or v == "":
+                continue
+            n = len(str(v))
+            if i >= len(widths):
+                widths.extend([0] * (i + 1 - len(widths)))
+            if n > widths[i]:
+                widths[i] = n
+
+    def _flush_pending(self):
+        """Fix column widths from what has been measured so far and write the buffer."""
+        from openpyxl.utils import get_column_letter
+
+        for i, w in enumerate(self._widths, start=1):
+            width = min(w + 2, MAX_WIDTH) if w > 0 else DEFAULT_WIDTH
+            self.ws.column_dimensions[get_column_letter(i)].width = width
+        for row in self._pending:
+            self.ws.append(row)
+        self._pending = []
+        self._flushed = True
+
+    # ---------- public API ----------
+    def append(self, values):
+        """Append one data row (an iterable of plain values)."""
+        values = list(values)
+        row = [self._cell(v, CELL_STYLE) for v in values]
+        self.rows_written += 1
+        if self._flushed:
+            self.ws.append(row)
+            return
+        self._measure(values)
+        self._pending.append(row)
+        if len(self._pending) > self._sample_limit:
+            self._flush_pending()
+
+    def close(self, fileobj=None):
+        """Finish the workbook and return a file object positioned at 0.
+
+        Writes into `fileobj` when given (e.g. an export artifact), otherwise
+        into a new spooled temp file.
+        """
+        if not self._flushed:
+            self._flush_pending()
+        out = fileobj if fileobj is not None else tempfile.SpooledTemporaryFile(max_size=self.spool_max_size, suffix=".xlsx")
+        try:
+            self.wb.save(out)
+        except Exception:
+            if fileobj is None:
+                out.close()
+            raise
+        out.seek(0)
+        return out
+
+
+def write_xlsx(title, header, rows, fileobj=None, **kwargs):
+    """Convenience wrapper: write an iterable of value rows and return the finished file."""
+    export = XlsxExport(title, header, **kwargs)
+    for values in rows:
+        export.append(values)
+    return export.close(fileobj)
+
+
+def xlsx_response(fileobj, filename):
+    """Stream a finished workbook file object back as an attachment."""
+    from flask import send_file
+    return send_file(fileobj, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)